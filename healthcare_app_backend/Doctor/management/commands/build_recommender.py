@@ -0,0 +1,47 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from Doctor.views import import_recommender, recommender_available, train_and_publish_recommender
+
+class Command(BaseCommand):
+    help = "Train the doctor recommender and publish it for the web workers to load"
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help="Retrain even if the published model matches the doctor catalog"
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=0,
+            help="Keep running and republish whenever doctors are added, edited or deleted, checking every INTERVAL seconds"
+        )
+    
+    def handle(self, *args, **options):
+        # Web workers using a recommender server skip the import; training needs it
+        if not recommender_available and not import_recommender():
+            raise CommandError("The recommendation system could not be imported")
+        
+        force = options['force']
+        # Last published build; with --interval, later edits are upserted into it
+        build = None
+        while True:
+            try:
+                version, build = train_and_publish_recommender(force=force, previous=build)
+                if version is not None:
+                    self.stdout.write(self.style.SUCCESS(f"Published recommender version {version}"))
+                elif not options['interval']:
+                    self.stdout.write("Published recommender is up to date")
+            except Exception as e:
+                if not options['interval']:
+                    raise CommandError(f"Error publishing recommender: {str(e)}")
+                # Keep the builder running; workers keep serving the last version
+                self.stderr.write(f"Error publishing recommender: {str(e)}")
+            
+            if not options['interval']:
+                return
+            force = False
+            time.sleep(options['interval'])
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Doctor', '0002_doctor_conditions_treated'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='doctor',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, null=True),
+        ),
+    ]
@@ -22,6 +22,7 @@ class Doctor(models.Model):
     patients_treated = models.IntegerField(default=0)
     rating = models.FloatField(default=4.0)
     conditions_treated = models.JSONField(default=list, blank=True, null=True, help_text="List of conditions or diseases the doctor treats")
+    updated_at = models.DateTimeField(auto_now=True, null=True)
     
     def __str__(self):
         return self.name 
\ No newline at end of file
@@ -4,4 +4,4 @@ from .models import Doctor
 class DoctorSerializer(serializers.ModelSerializer):
     class Meta:
         model = Doctor
-        fields = '__all__' 
\ No newline at end of file
+        exclude = ['updated_at'] 
\ No newline at end of file
@@ -1,3 +1,289 @@
-from django.test import TestCase
+import logging
+import os
+import tempfile
+from unittest import mock
 
-# Create your tests here. 
\ No newline at end of file
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase
+
+from hospital.models import Hospital_Details
+from user_management.models import HealthcareUser
+from recommendation_system.client import RecommenderClient
+from . import views
+from .models import Doctor
+from .serializers import DoctorSerializer
+
+class FilterParsingTests(SimpleTestCase):
+    def test_parameters_are_combined_with_and(self):
+        self.assertEqual(
+            views.parse_doctor_filters({'fee_max': '800', 'availability': '9 AM - 1 PM', 'rating_min': ' '}),
+            {'and': [{'field': 'fee', 'lte': 800.0}, {'field': 'availability', 'eq': '9 AM - 1 PM'}]}
+        )
+        self.assertIsNone(views.parse_doctor_filters({}))
+    
+    def test_filter_expression_as_json_or_object(self):
+        expression = {'or': [{'field': 'rating', 'gte': 4.5}, {'field': 'hospital', 'eq': 3}]}
+        self.assertEqual(views.parse_doctor_filters({'filter': expression}), expression)
+        self.assertEqual(
+            views.parse_doctor_filters({'filter': '{"field": "rating", "gte": 4}', 'experience_min': 5}),
+            {'and': [{'field': 'experience', 'gte': 5.0}, {'field': 'rating', 'gte': 4}]}
+        )
+    
+    def test_malformed_parameters_are_rejected(self):
+        for params in ({'fee_min': 'cheap'}, {'filter': '{oops'}, {'filter': '[1, 2]'}):
+            with self.assertRaises(ValueError):
+                views.parse_doctor_filters(params)
+    
+    def test_malformed_expressions_are_rejected(self):
+        for expression in (
+            {},
+            {'field': 'unknown', 'eq': 1},
+            {'field': 'fee'},
+            {'field': 'fee', 'gte': 'cheap'},
+            {'field': 'fee', 'contains': '5'},
+            {'and': {'field': 'fee', 'gte': 1}},
+            {'not': {'field': 'fee', 'gte': 1}, 'field': 'fee'},
+        ):
+            with self.assertRaises(ValueError):
+                views.filters_to_q(expression)
+
+class RecommenderViewTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.hospital = Hospital_Details.objects.create(
+            name="City Hospital", specialization="General", location="Pune", available_beds=10
+        )
+        cls.doctors = [
+            Doctor.objects.create(
+                name=name, specialization=specialization, experience=experience, fee=fee, rating=rating,
+                mobile_number=f"98765432{index:02d}", conditions_treated=conditions,
+                hospital=cls.hospital if index % 2 == 0 else None
+            )
+            for index, (name, specialization, experience, fee, rating, conditions) in enumerate([
+                ("Asha Rao", "Cardiologist", 12, 800, 4.8, ["Hypertension", "Arrhythmia"]),
+                ("Vikram Shah", "Cardiologist", 5, 400, 4.1, ["Hypertension"]),
+                ("Meera Iyer", "Endocrinologist", 9, 600, 4.5, ["Diabetes", "Thyroid"]),
+                ("Rahul Nair", "Endocrinologist", 3, 300, 3.9, ["Diabetes"]),
+                ("Sara Khan", "Pulmonologist", 15, 1200, 4.9, ["Asthma", "COPD"]),
+            ])
+        ]
+    
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        cache.clear()
+        self.model_directory = tempfile.TemporaryDirectory()
+        for patcher in (
+            mock.patch.object(views, 'get_model_path', return_value=self.model_directory.name),
+            mock.patch.object(views, '_catalog_sync', None),
+            mock.patch.object(views, '_last_catalog_check', None),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+    
+    def tearDown(self):
+        views.recommender_holder.swap(None)
+        self.model_directory.cleanup()
+        logging.disable(logging.NOTSET)
+    
+    def serve_model(self):
+        """Train the served recommender on the test doctors"""
+        recommender = views.fit_recommender(views.load_training_data())
+        views.recommender_holder.swap(recommender)
+        return recommender
+    
+    def without_model(self):
+        """Answer from the database, as before a model is built"""
+        return mock.patch.object(views, 'get_recommender', return_value=None)
+    
+    def names(self, doctors):
+        return sorted(doctor['name'] for doctor in doctors)
+
+class DoctorListTests(RecommenderViewTestCase):
+    def test_filters_are_answered_alike_by_the_model_and_the_database(self):
+        queries = [
+            '?fee_max=700',
+            '?specialization=cardio&rating_min=4.5',
+            f'?hospital={self.hospital.id}&experience_max=10',
+            '?filter={"or": [{"field": "specialization", "eq": "pulmonologist"}, {"field": "fee", "lt": 350}]}',
+        ]
+        with self.without_model():
+            from_database = [self.client.get('/api/doctors/' + query).json() for query in queries]
+        cache.clear()
+        self.serve_model()
+        from_model = [self.client.get('/api/doctors/' + query).json() for query in queries]
+        
+        self.assertEqual(self.names(from_database[0]), ["Meera Iyer", "Rahul Nair", "Vikram Shah"])
+        self.assertEqual(self.names(from_database[1]), ["Asha Rao"])
+        self.assertEqual(self.names(from_database[2]), ["Meera Iyer"])
+        self.assertEqual(self.names(from_database[3]), ["Rahul Nair", "Sara Khan"])
+        for database_doctors, model_doctors in zip(from_database, from_model):
+            self.assertEqual(self.names(model_doctors), self.names(database_doctors))
+    
+    def test_both_paths_list_doctors_by_id(self):
+        self.serve_model()
+        # An edited doctor moves to a new row of the model's store
+        doctor = self.doctors[0]
+        doctor.fee = 200
+        doctor.save()
+        views.sync_doctor_to_recommender(doctor)
+        from_model = self.client.get('/api/doctors/', {'fee_max': 1000}).json()
+        with self.without_model():
+            from_database = self.client.get('/api/doctors/', {'fee_max': 1000}).json()
+        
+        expected = sorted(doctor.id for doctor in self.doctors[:4])
+        self.assertEqual([doctor['id'] for doctor in from_model], expected)
+        self.assertEqual([doctor['id'] for doctor in from_database], expected)
+    
+    def test_profile_edits_invalidate_filtered_listings(self):
+        doctor = self.doctors[1]
+        HealthcareUser.objects.create(
+            first_name="Vikram", last_name="Shah", email="vikram@example.com",
+            mobile_number=doctor.mobile_number, password="secret", role="doctor"
+        )
+        with self.without_model():
+            before = self.client.get('/api/doctors/', {'fee_max': 700}).json()
+            response = self.client.put('/api/doctor-profile/vikram@example.com/', {'fee': 900}, content_type='application/json')
+            after = self.client.get('/api/doctors/', {'fee_max': 700}).json()
+            unfiltered = self.client.get('/api/doctors/', {'specialization': 'cardio'}).json()
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("Vikram Shah", self.names(before))
+        self.assertEqual(self.names(after), ["Meera Iyer", "Rahul Nair"])
+        self.assertEqual({doctor['fee'] for doctor in unfiltered}, {800, 900})
+    
+    def test_malformed_filters_are_rejected(self):
+        self.serve_model()
+        response = self.client.get('/api/doctors/', {'filter': '{"field": "fee", "gte": "cheap"}'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get('/api/doctors/', {'fee_min': 'cheap'})
+        self.assertEqual(response.status_code, 400)
+    
+    def test_unreachable_server_falls_back_to_the_database(self):
+        client = RecommenderClient(os.path.join(self.model_directory.name, 'missing.sock'), timeout=1)
+        with mock.patch.object(views, 'recommender_client', client):
+            response = self.client.get('/api/doctors/', {'fee_min': 1000})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.names(response.json()), ["Sara Khan"])
+
+class RecommendTests(RecommenderViewTestCase):
+    def test_recommendations_with_facets(self):
+        self.serve_model()
+        response = self.client.get('/api/recommend-doctors/', {'query': 'hypertension', 'facets': 'true', 'fee_max': 500})
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertTrue(body['using_ml_recommendations'])
+        self.assertEqual(self.names(body['recommended_doctors']), ["Vikram Shah"])
+        self.assertEqual(body['facets']['specialization'], [{'value': 'Cardiologist', 'count': 1}])
+    
+    def test_profile_edits_are_served_without_retraining(self):
+        recommender = self.serve_model()
+        doctor = self.doctors[1]
+        doctor.conditions_treated = ["Migraine"]
+        doctor.save()
+        views.sync_doctor_to_recommender(doctor)
+        
+        body = self.client.get('/api/recommend-doctors/', {'query': 'migraine'}).json()
+        self.assertTrue(body['using_ml_recommendations'])
+        self.assertEqual([result['id'] for result in body['recommended_doctors']], [doctor.id])
+        self.assertIs(views.recommender_holder.get(), recommender)
+    
+    def test_edits_saved_by_other_workers_are_polled(self):
+        recommender = self.serve_model()
+        with mock.patch.object(views, 'CATALOG_POLL_SECONDS', 0):
+            self.assertIs(views.get_recommender(), recommender)
+            # Saved by another worker, so this one's model is not synced
+            doctor = self.doctors[3]
+            doctor.conditions_treated = ["Migraine"]
+            doctor.save()
+            added = Doctor.objects.create(
+                name="Kiran Das", specialization="Neurologist", experience=7, fee=700, rating=4.4,
+                mobile_number="9876543299", conditions_treated=["Migraine"]
+            )
+            body = self.client.get('/api/recommend-doctors/', {'query': 'migraine'}).json()
+        
+        self.assertTrue(body['using_ml_recommendations'])
+        self.assertEqual(sorted(result['id'] for result in body['recommended_doctors']), [doctor.id, added.id])
+        self.assertIs(views.recommender_holder.get(), recommender)
+    
+    def test_deleted_doctors_start_a_rebuild(self):
+        recommender = self.serve_model()
+        with mock.patch.object(views, 'CATALOG_POLL_SECONDS', 0), \
+                mock.patch.object(views.recommender_holder, 'rebuild_async') as rebuild_async:
+            views.get_recommender()
+            self.doctors[2].delete()
+            self.assertIs(views.get_recommender(), recommender)
+        rebuild_async.assert_called_once_with()
+    
+    def test_edits_saved_during_a_build_are_applied(self):
+        catalog_state = views.get_catalog_state()
+        recommender = views.fit_recommender(views.load_training_data())
+        doctor = self.doctors[4]
+        doctor.fee = 2500
+        doctor.save()
+        self.assertNotEqual(views.get_catalog_fingerprint(), views.get_catalog_fingerprint(catalog_state))
+        
+        views.apply_updates_since(recommender, catalog_state[2])
+        self.assertEqual([result['id'] for result in recommender.filter_doctors({'field': 'fee', 'gt': 2000})], [doctor.id])
+
+class TrainingDataTests(RecommenderViewTestCase):
+    def test_doctors_are_read_in_chunks(self):
+        chunks = list(views.iter_training_chunks(chunk_size=2))
+        self.assertEqual([len(chunk) for chunk in chunks], [2, 2, 1])
+        expected = views.batch_preprocess_doctors(
+            [dict(doctor) for doctor in DoctorSerializer(Doctor.objects.order_by('pk'), many=True).data]
+        )
+        self.assertEqual([doctor for chunk in chunks for doctor in chunk], expected)
+    
+    def test_training_store_holds_every_doctor(self):
+        store = views.load_training_data()
+        self.assertEqual(store.values('id'), [doctor.id for doctor in self.doctors])
+        self.assertEqual(store.values('conditions_treated')[4], ["Asthma", "COPD"])
+
+class BatchRecommendTests(RecommenderViewTestCase):
+    def post(self, body):
+        return self.client.post('/api/recommend-doctors/batch/', body, content_type='application/json')
+    
+    def test_results_line_up_with_the_queries(self):
+        self.serve_model()
+        response = self.post({'queries': ['diabetes', '', 'asthma, hypertension:2'], 'limit': 2, 'facets': True})
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertTrue(body['using_ml_recommendations'])
+        results = body['results']
+        self.assertEqual([result['query'] for result in results], ['diabetes', '', 'asthma, hypertension:2'])
+        self.assertEqual(self.names(results[0]['recommended_doctors']), ["Meera Iyer", "Rahul Nair"])
+        self.assertEqual(results[1]['results_count'], 0)
+        self.assertIsNone(results[1]['facets'])
+        self.assertEqual(results[2]['results_count'], 2)
+        self.assertEqual(sum(entry['count'] for entry in results[0]['facets']['specialization']), 2)
+    
+    def test_database_fallback_applies_the_filters(self):
+        with self.without_model():
+            response = self.post({'queries': ['diabetes', 'hypertension'], 'fee_max': 500, 'sort_by': 'rating'})
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertFalse(body['using_ml_recommendations'])
+        self.assertEqual([self.names(result['recommended_doctors']) for result in body['results']], [
+            ["Rahul Nair"], ["Vikram Shah"],
+        ])
+    
+    def test_unreachable_server_falls_back_to_the_database(self):
+        client = RecommenderClient(os.path.join(self.model_directory.name, 'missing.sock'), timeout=1)
+        with mock.patch.object(views, 'recommender_client', client):
+            response = self.post({'queries': ['asthma']})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.json()['using_ml_recommendations'])
+        self.assertEqual(self.names(response.json()['results'][0]['recommended_doctors']), ["Sara Khan"])
+    
+    def test_malformed_requests_are_rejected(self):
+        self.serve_model()
+        for body in (
+            {},
+            {'queries': 'diabetes'},
+            {'queries': []},
+            {'queries': ['diabetes'] * (views.MAX_BATCH_QUERIES + 1)},
+            {'queries': ['diabetes'], 'limit': 'ten'},
+            {'queries': ['diabetes'], 'filter': {'field': 'unknown', 'eq': 1}},
+        ):
+            with self.subTest(body=body):
+                self.assertEqual(self.post(body).status_code, 400)
@@ -4,6 +4,8 @@ from .views import (
     get_specialization_options, 
     doctor_details_view, 
     recommend_doctors,
+    recommend_doctors_batch,
+    recommendation_cache_stats,
     manage_doctor_profile,
     list_all_doctors
 )
@@ -16,5 +18,7 @@ urlpatterns = [
     path('doctor-profile/', manage_doctor_profile, name='doctor-profile-no-email'),
     path('list-all-doctors/', list_all_doctors, name='list-all-doctors'),
     path('recommend-doctors/', recommend_doctors, name='recommend-doctors'),
+    path('recommend-doctors/batch/', recommend_doctors_batch, name='recommend-doctors-batch'),
+    path('recommend-doctors/cache-stats/', recommendation_cache_stats, name='recommend-doctors-cache-stats'),
     path('knn-recommend/', recommend_doctors, name='knn-recommend'),
 ] 
\ No newline at end of file
@@ -8,78 +8,615 @@ from .serializers import DoctorSerializer
 from hospital.models import Hospital_Details
 from django.db.models import Q, F, ExpressionWrapper, FloatField
 import re
+import hashlib
+import json
 from django.shortcuts import render
+from django.db import connection
+from django.conf import settings
 import logging
+import time
+import threading
+from collections import namedtuple
+from concurrent.futures import TimeoutError as FutureTimeoutError
 
-# Wrap the import in a try-except block to handle potential import errors
-try:
-    from recommendation_system.doctor_recommender import DoctorRecommender
-    from recommendation_system.utils import (
-        batch_preprocess_doctors,
-        save_model,
-        load_model,
-        get_model_path
-    )
-    recommender_available = True
-except ImportError as e:
-    import warnings
-    warnings.warn(f"Error importing recommendation system: {str(e)}")
-    recommender_available = False
+from recommendation_system.client import RecommenderClient, RecommenderServerError, RecommenderUnavailableError
+
+# With a recommender server (`python -m recommendation_system.server`) the
+# model lives in that process and workers only hold a client connected to
+# its Unix domain socket
+RECOMMENDER_SERVER_SOCKET = getattr(settings, 'RECOMMENDER_SERVER_SOCKET', None)
+
+def import_recommender():
+    """
+    Import the in-process recommender into this module
+    
+    Skipped at import time when a recommender server is configured, so web
+    workers never load numpy, pandas or scikit-learn; the build_recommender
+    command still calls it to train the model the server loads.
+    
+    Returns:
+        bool: True if the recommendation system could be imported
+    """
+    global DoctorRecommender, ModelHolder, batch_preprocess_doctors, preprocess_doctor_data
+    global save_model, load_model, read_manifest, get_current_version, get_model_path, MODEL_SCHEMA_VERSION
+    # Wrap the import in a try-except block to handle potential import errors
+    try:
+        from recommendation_system.doctor_recommender import DoctorRecommender
+        from recommendation_system.model_holder import ModelHolder
+        from recommendation_system.utils import (
+            batch_preprocess_doctors,
+            preprocess_doctor_data,
+            save_model,
+            load_model,
+            read_manifest,
+            get_current_version,
+            get_model_path,
+            MODEL_SCHEMA_VERSION
+        )
+        return True
+    except ImportError as e:
+        import warnings
+        warnings.warn(f"Error importing recommendation system: {str(e)}")
+        return False
+
+recommender_available = False if RECOMMENDER_SERVER_SOCKET else import_recommender()
+recommender_client = RecommenderClient(RECOMMENDER_SERVER_SOCKET) if RECOMMENDER_SERVER_SOCKET else None
+
+# Errors of a recommender server that is down, restarting, too slow or has
+# no model loaded yet (OSError covers a missing socket and lost
+# connections); views then answer from the database like without a model
+RECOMMENDER_SERVER_ERRORS = (OSError, FutureTimeoutError, RecommenderUnavailableError, RecommenderServerError)
 
 logger = logging.getLogger(__name__)
 
-# Global variable to store the recommender model
-recommender = None
+# Upper bound on the number of queries accepted by the batch endpoint
+MAX_BATCH_QUERIES = 500
+
+# Number of neighbors the served recommender is built with
+RECOMMENDER_NEIGHBORS = 50
+
+# In shared mode every worker memory-maps the model published by the
+# build_recommender management command instead of training its own
+SHARED_MODEL = getattr(settings, 'RECOMMENDER_SHARED_MODEL', False)
+
+# Seconds between checks for a newly published shared model
+SHARED_MODEL_POLL_SECONDS = 5
+
+# Seconds between checks for doctors saved by other workers, when every
+# worker trains its own model
+CATALOG_POLL_SECONDS = 5
+
+# Doctors read from the database and preprocessed at a time while training
+TRAINING_CHUNK_SIZE = getattr(settings, 'RECOMMENDER_TRAINING_CHUNK_SIZE', 2000)
+
+# Worker processes encoding and indexing the catalog while training
+FIT_JOBS = getattr(settings, 'RECOMMENDER_FIT_JOBS', 1)
+
+# Nearest-neighbor backend of the recommender and its tuning parameters
+RECOMMENDER_INDEX = getattr(settings, 'RECOMMENDER_INDEX', 'brute')
+RECOMMENDER_INDEX_PARAMS = getattr(settings, 'RECOMMENDER_INDEX_PARAMS', {})
+
+def create_recommender():
+    """Create an unfitted recommender configured from the settings"""
+    return DoctorRecommender(
+        n_neighbors=RECOMMENDER_NEIGHBORS,
+        precompute_neighbors=True,
+        index=RECOMMENDER_INDEX,
+        index_params=RECOMMENDER_INDEX_PARAMS,
+        n_jobs=FIT_JOBS
+    )
+
+def fit_recommender(doctors):
+    """Fit a new recommender on a doctor store, logging the recall of approximate neighbor indexes"""
+    recommender = create_recommender()
+    recommender.fit_store(doctors)
+    if RECOMMENDER_INDEX != 'brute':
+        logger.info(f"Recommender index recall against brute force: {recommender.evaluate_index_recall()}")
+    return recommender
+
+def iter_training_chunks(chunk_size=TRAINING_CHUNK_SIZE):
+    """
+    Preprocessed doctors read from the database chunk_size rows at a time
+    
+    Rows are fetched as plain dictionaries with .values(), holding the same
+    fields in the same order as DoctorSerializer output, and streamed with
+    .iterator() so the queryset never caches the whole catalog.
+    """
+    fields = list(DoctorSerializer().fields)
+    rows = Doctor.objects.order_by('pk').values(*fields).iterator(chunk_size=chunk_size)
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            yield batch_preprocess_doctors(chunk)
+            chunk = []
+    if chunk:
+        yield batch_preprocess_doctors(chunk)
+
+def load_training_data():
+    """Stream every doctor in the database into a columnar store for training"""
+    return DoctorRecommender.store_from_chunks(iter_training_chunks(), n_jobs=FIT_JOBS)
+
+def build_recommender(publish):
+    """
+    Load or train the recommender model; runs in the background builder thread
+    
+    In shared mode the published model is only attached to, never trained
+    here. Otherwise a saved model matching the current catalog is returned as-is. Otherwise
+    a stale saved model (or, failing that, a recommender with only the simple
+    fallback fitted) is published to serve requests while the KNN model is
+    retrained. Doctors saved while the build ran are upserted before the
+    model is returned.
+    
+    Args:
+        publish: Callback that swaps in an interim model
+        
+    Returns:
+        The fitted recommender, or None if training failed
+    """
+    try:
+        model_path = get_model_path()
+        if SHARED_MODEL:
+            recommender = load_model(model_path)
+            if recommender is None:
+                logger.warning("No published recommender found, run `manage.py build_recommender`")
+            return recommender
+        
+        catalog_state = get_catalog_state()
+        fingerprint = get_catalog_fingerprint(catalog_state)
+        # Reuse the saved model unless it is stale or was built with other settings
+        loaded_recommender = load_model(model_path, fingerprint=fingerprint)
+        if (
+            isinstance(loaded_recommender, DoctorRecommender)
+            and loaded_recommender.n_neighbors == RECOMMENDER_NEIGHBORS
+            and loaded_recommender.index_type == RECOMMENDER_INDEX
+            and loaded_recommender.index_params == RECOMMENDER_INDEX_PARAMS
+        ):
+            apply_updates_since(loaded_recommender, catalog_state[2])
+            track_catalog_state(loaded_recommender, catalog_state)
+            return loaded_recommender
+        
+        # Keep serving the previous model, if there is one, while retraining
+        stale_recommender = load_model(model_path)
+        if recommender_holder.get() is None and isinstance(stale_recommender, DoctorRecommender):
+            publish(stale_recommender)
+        
+        doctors = load_training_data()
+        
+        # Serve simple filtering until the KNN model is ready
+        if recommender_holder.get() is None:
+            interim_recommender = DoctorRecommender(n_neighbors=RECOMMENDER_NEIGHBORS, n_jobs=FIT_JOBS)
+            interim_recommender.simple_recommender.fit_store(doctors.copy())
+            publish(interim_recommender)
+        
+        # Fit model
+        new_recommender = fit_recommender(doctors)
+        
+        # Save the model
+        save_model(new_recommender, model_path, fingerprint=fingerprint)
+        apply_updates_since(new_recommender, catalog_state[2])
+        track_catalog_state(new_recommender, catalog_state)
+        return new_recommender
+    
+    except Exception as e:
+        logger.error(f"Error training recommender: {str(e)}")
+        return None
+    finally:
+        # The builder thread owns its own database connection
+        connection.close()
+
+# Model published by train_and_publish_recommender, with the catalog state it was built from
+PublishedBuild = namedtuple('PublishedBuild', ['recommender', 'catalog_state'])
+
+def train_and_publish_recommender(force=False, previous=None):
+    """
+    Train the recommender from the database and publish it as the saved model
+    
+    Run by the single builder process (the build_recommender management
+    command) that shared-mode workers and recommender servers load their
+    model from. Doctor profile edits change the catalog fingerprint, so
+    they are republished like additions.
+    
+    Args:
+        force: Retrain even if the published model matches the current catalog
+        previous: Build returned by an earlier call in this process. If
+            doctors were only added or edited since, they are upserted into
+            its model instead of retraining the whole catalog.
+        
+    Returns:
+        Tuple of (published version, or None if the published model was up
+        to date; build to pass as previous to the next call)
+    """
+    model_path = get_model_path()
+    catalog_state = get_catalog_state()
+    fingerprint = get_catalog_fingerprint(catalog_state)
+    manifest = read_manifest(model_path)
+    if (
+        not force
+        and manifest is not None
+        and manifest.get('schema_version') == MODEL_SCHEMA_VERSION
+        and manifest.get('fingerprint') == fingerprint
+    ):
+        return None, previous
+    
+    if not force and previous is not None and catalog_only_grew(previous.catalog_state):
+        recommender = previous.recommender
+        apply_updates_since(recommender, previous.catalog_state[2])
+    else:
+        recommender = fit_recommender(load_training_data())
+    if not save_model(recommender, model_path, fingerprint=fingerprint):
+        raise RuntimeError(f"Could not save the recommender to {model_path}")
+    return get_current_version(model_path), PublishedBuild(recommender, catalog_state)
+
+# Holder for the recommender model served by this process
+recommender_holder = ModelHolder(build_recommender, name="doctor recommender") if recommender_available else None
 
 def get_recommender():
-    """Get or initialize the recommender model"""
-    global recommender
+    """
+    Get the recommender model, starting a background build if none is loaded
+    
+    Never blocks on training: returns None (or an interim model) until the
+    background build has swapped a model in. In shared mode, a newly
+    published model is picked up within SHARED_MODEL_POLL_SECONDS. Otherwise
+    doctors saved by other workers reach this worker's model within
+    CATALOG_POLL_SECONDS. With a recommender server, the client is returned
+    and the server does all of this.
+    """
+    if recommender_client is not None:
+        return recommender_client
     
     # If recommendation system is not available, return None
     if not recommender_available:
         logger.warning("Recommendation system is not available due to import errors")
         return None
     
+    recommender = recommender_holder.get()
+    if SHARED_MODEL:
+        poll_shared_recommender(recommender)
+    elif recommender is None:
+        recommender_holder.rebuild_async()
+    else:
+        poll_catalog_updates(recommender)
+    
+    return recommender
+
+# Monotonic time of the last check for a newly published shared model
+_last_shared_model_check = None
+
+def poll_shared_recommender(recommender):
+    """Reload the shared model in the background once a new version is published"""
+    global _last_shared_model_check
+    now = time.monotonic()
+    if _last_shared_model_check is not None and now - _last_shared_model_check < SHARED_MODEL_POLL_SECONDS:
+        return
+    _last_shared_model_check = now
+    
+    published_version = get_current_version(get_model_path())
+    if recommender is None or (published_version is not None and published_version != recommender.artifact_version):
+        recommender_holder.rebuild_async()
+
+# Model of this worker and the catalog state (see get_catalog_state) it
+# holds every doctor of, with the monotonic time of the last check
+_catalog_sync = None
+_last_catalog_check = None
+_catalog_sync_lock = threading.Lock()
+
+def track_catalog_state(recommender, catalog_state):
+    """Record that a model holds every doctor saved up to catalog_state"""
+    global _catalog_sync
+    _catalog_sync = (recommender, catalog_state)
+
+def poll_catalog_updates(recommender):
+    """
+    Upsert the doctors saved by other workers into this worker's model
+    
+    sync_doctor_to_recommender only updates the worker that saved the
+    doctor, so the catalog state is compared with the one the model was
+    last brought up to date with. Added and edited doctors are upserted
+    without retraining; a deleted doctor leaves no updated_at behind, so it
+    starts a rebuild instead. A model swapped in without a known state
+    starts from the current one.
+    """
+    global _last_catalog_check
+    now = time.monotonic()
+    if _last_catalog_check is not None and now - _last_catalog_check < CATALOG_POLL_SECONDS:
+        return
+    # Concurrent requests skip the check another request is already making
+    if not _catalog_sync_lock.acquire(blocking=False):
+        return
+    try:
+        _last_catalog_check = now
+        catalog_state = get_catalog_state()
+        if _catalog_sync is None or _catalog_sync[0] is not recommender:
+            track_catalog_state(recommender, catalog_state)
+            return
+        synced_state = _catalog_sync[1]
+        if catalog_state == synced_state:
+            return
+        if not catalog_only_grew(synced_state):
+            recommender_holder.rebuild_async()
+            return
+        # Edits saved after catalog_state was read are applied again next time, which is harmless
+        apply_updates_since(recommender, synced_state[2])
+        track_catalog_state(recommender, catalog_state)
+    except Exception as e:
+        logger.error(f"Error applying catalog updates to the recommender: {str(e)}")
+    finally:
+        _catalog_sync_lock.release()
+
+def sync_doctor_to_recommender(doctor):
+    """
+    Apply a created or updated doctor to the served recommender without retraining
+    
+    The change is visible to this worker's recommendations immediately and
+    to other workers' once they poll the catalog (see poll_catalog_updates). The
+    saved model is not rewritten here: the save bumps the doctor's
+    updated_at, which changes the catalog fingerprint, so the next build
+    (a restarted worker, or the builder process in shared and server modes)
+    reads the edit from the database instead of reusing the stale artifact. In
+    shared mode nothing is updated here, since that would give this worker
+    a private copy of the shared arrays; the same goes for a recommender
+    server, which reloads what the builder publishes.
+    """
+    if not recommender_available or SHARED_MODEL:
+        return
+    
+    recommender = recommender_holder.get()
     if recommender is None:
-        # Try to load existing model
+        # Nothing loaded yet; the build in progress (or the next one) picks the doctor up
+        return
+    
+    try:
+        recommender.upsert_doctor(preprocess_doctor_data(DoctorSerializer(doctor).data))
+    except Exception as e:
+        logger.error(f"Error updating recommender for doctor {doctor.id}: {str(e)}")
+
+def get_catalog_state():
+    """Tuple of (doctor count, latest id, latest updated_at) of the doctor catalog"""
+    doctor_count = Doctor.objects.count()
+    latest_id = Doctor.objects.order_by('-id').values_list('id', flat=True).first()
+    last_update = (
+        Doctor.objects.filter(updated_at__isnull=False)
+        .order_by('-updated_at')
+        .values_list('updated_at', flat=True)
+        .first()
+    )
+    return doctor_count, latest_id, last_update
+
+def get_catalog_fingerprint(catalog_state=None):
+    """
+    Cheap fingerprint of the doctor catalog, used to detect stale model artifacts
+    
+    Covers added and deleted doctors through the count and latest id, and
+    edited ones through the latest updated_at.
+    
+    Args:
+        catalog_state: Result of get_catalog_state(), read now if not given
+    """
+    doctor_count, latest_id, last_update = catalog_state or get_catalog_state()
+    return f"{doctor_count}:{latest_id}:{last_update.isoformat() if last_update else ''}"
+
+def catalog_only_grew(catalog_state):
+    """True if no doctor counted in an earlier get_catalog_state() has been deleted since"""
+    doctor_count, latest_id, _ = catalog_state
+    if latest_id is None:
+        return doctor_count == 0
+    return Doctor.objects.filter(id__lte=latest_id).count() == doctor_count
+
+def apply_updates_since(recommender, last_update):
+    """
+    Upsert the doctors saved after last_update into a built recommender
+    
+    Brings a model up to date without retraining. Builds also use it for
+    edits made while they read the catalog, which find no model to sync to.
+    Doctors the model already holds are replaced by the same data.
+    """
+    updated = Doctor.objects.filter(updated_at__isnull=False)
+    if last_update is not None:
+        updated = updated.filter(updated_at__gt=last_update)
+    for doctor in updated.order_by('pk'):
+        recommender.upsert_doctor(preprocess_doctor_data(DoctorSerializer(doctor).data))
+
+# Request parameter -> (field, operator) of the filter expression it adds
+DOCTOR_FILTER_PARAMS = {
+    'fee_min': ('fee', 'gte'),
+    'fee_max': ('fee', 'lte'),
+    'rating_min': ('rating', 'gte'),
+    'rating_max': ('rating', 'lte'),
+    'experience_min': ('experience', 'gte'),
+    'experience_max': ('experience', 'lte'),
+    'availability': ('availability', 'eq'),
+    'hospital': ('hospital', 'eq'),
+}
+
+# Filter expression field -> Doctor model field
+DOCTOR_FILTER_FIELDS = {
+    'specialization': 'specialization',
+    'availability': 'availability',
+    'hospital': 'hospital_id',
+    'fee': 'fee',
+    'rating': 'rating',
+    'experience': 'experience',
+}
+
+# Fields returned by the doctor listing
+DOCTOR_LIST_FIELDS = ("id", "name", "specialization", "experience", "availability", "fee", "rating")
+
+# Cache key of the generation number that is part of every doctor listing
+# cache key; bumping it invalidates all cached listings, filtered or not
+DOCTOR_LIST_VERSION_KEY = "doctors_version"
+
+def doctor_list_cache_key(specialization, filters):
+    """Cache key of a doctor listing under the current listing generation"""
+    # A generation dropped by the cache restarts from the clock, never from a used number
+    version = cache.get_or_set(DOCTOR_LIST_VERSION_KEY, time.time_ns(), timeout=None)
+    cache_key = f"doctors_{version}_{specialization}" if specialization else f"doctors_{version}_all"
+    if filters:
+        cache_key += "_" + hashlib.md5(json.dumps(filters, sort_keys=True).encode()).hexdigest()
+    return cache_key
+
+def invalidate_doctor_lists():
+    """Drop every cached doctor listing after a doctor is created or edited"""
+    try:
+        cache.incr(DOCTOR_LIST_VERSION_KEY)
+    except ValueError:
+        cache.set(DOCTOR_LIST_VERSION_KEY, time.time_ns(), timeout=None)
+
+def parse_doctor_filters(params):
+    """
+    Build a filter expression from request parameters
+    
+    Simple parameters (see DOCTOR_FILTER_PARAMS) and an optional `filter`
+    holding a full expression, as an object or JSON text, are combined with
+    AND. Expressions look like {"field": "fee", "gte": 300, "lte": 800},
+    {"field": "availability", "in": [...]} or {"and"/"or": [...]} and
+    {"not": {...}}; see recommendation_system.filters.FilterIndex.
+    
+    Args:
+        params: Query parameters or request body
+        
+    Returns:
+        Filter expression, or None if no filter was given
+        
+    Raises:
+        ValueError: If a parameter is malformed
+    """
+    conditions = []
+    for param, (field, operator) in DOCTOR_FILTER_PARAMS.items():
+        value = params.get(param)
+        if value is None or (isinstance(value, str) and not value.strip()):
+            continue
+        if field in ('fee', 'rating', 'experience'):
+            try:
+                value = float(value)
+            except (TypeError, ValueError):
+                raise ValueError(f"{param} must be a number")
+        conditions.append({'field': field, operator: value})
+    
+    expression = params.get('filter')
+    if isinstance(expression, str) and expression.strip():
         try:
-            model_path = get_model_path()
-            # Try to load existing model, but don't use it if it has the old n_neighbors value
-            loaded_recommender = load_model(model_path)
-            
-            # Create a new model with larger n_neighbors value
-            recommender = DoctorRecommender(n_neighbors=50)
-            
+            expression = json.loads(expression)
+        except ValueError:
+            raise ValueError("filter must be a JSON object")
+    if expression:
+        if not isinstance(expression, dict):
+            raise ValueError("filter must be a JSON object")
+        conditions.append(expression)
+    
+    if not conditions:
+        return None
+    return conditions[0] if len(conditions) == 1 else {'and': conditions}
+
+def filters_to_q(expression):
+    """
+    Translate a filter expression into a Q object for database fallbacks
+    
+    Mirrors the recommender's filter index: categorical fields match
+    ignoring case and numeric fields take eq/gt/gte/lt/lte bounds.
+    
+    Raises:
+        ValueError: If the expression is malformed
+    """
+    if not isinstance(expression, dict) or not expression:
+        raise ValueError(f"A filter must be a non-empty object, got {expression!r}")
+    
+    for operator in ('and', 'or'):
+        if operator in expression:
+            operands = expression[operator]
+            if len(expression) != 1 or not isinstance(operands, list) or not operands:
+                raise ValueError(f"'{operator}' must be the only key and hold a non-empty list")
+            q = filters_to_q(operands[0])
+            for operand in operands[1:]:
+                q = (q & filters_to_q(operand)) if operator == 'and' else (q | filters_to_q(operand))
+            return q
+    
+    if 'not' in expression:
+        if len(expression) != 1:
+            raise ValueError("'not' must be the only key of its filter")
+        return ~filters_to_q(expression['not'])
+    
+    field = expression.get('field')
+    if field not in DOCTOR_FILTER_FIELDS:
+        raise ValueError(f"Unknown filter field '{field}', expected one of {list(DOCTOR_FILTER_FIELDS)}")
+    model_field = DOCTOR_FILTER_FIELDS[field]
+    categorical = field in ('specialization', 'availability', 'hospital')
+    
+    def lookup(value):
+        """Equality condition on the field"""
+        if field == 'hospital':
             try:
-                # Get all doctors from database
-                doctors = Doctor.objects.all()
-                doctors_data = DoctorSerializer(doctors, many=True).data
-                
-                # Preprocess and fit model
-                processed_data = batch_preprocess_doctors(doctors_data)
-                recommender.fit(processed_data)
-                
-                # Save the model
-                save_model(recommender, model_path)
-                
-            except Exception as e:
-                logger.error(f"Error training recommender: {str(e)}")
-                recommender = None
-        except Exception as e:
-            logger.error(f"Error initializing recommender: {str(e)}")
-            recommender = None
+                return Q(**{model_field: int(float(value))})
+            except (TypeError, ValueError):
+                return Q(pk__in=[])
+        if categorical:
+            return Q(**{f"{model_field}__iexact": str(value).strip()})
+        return Q(**{model_field: value})
     
-    return recommender
+    q = Q()
+    conditions = {key: value for key, value in expression.items() if key != 'field'}
+    if not conditions:
+        raise ValueError(f"Filter on '{field}' has no condition")
+    for operator, operand in conditions.items():
+        if operator == 'in' and categorical:
+            if not isinstance(operand, list):
+                raise ValueError(f"'in' on '{field}' needs a list")
+            condition = Q(pk__in=[])
+            for value in operand:
+                condition |= lookup(value)
+        elif operator == 'contains' and categorical:
+            condition = Q(**{f"{model_field}__icontains": str(operand).strip()})
+        elif operator == 'eq' and categorical:
+            condition = lookup(operand)
+        elif operator in ('eq', 'gt', 'gte', 'lt', 'lte') and not categorical:
+            try:
+                bound = float(operand)
+            except (TypeError, ValueError):
+                raise ValueError(f"'{operator}' on '{field}' needs a number, got {operand!r}")
+            condition = Q(**{model_field: bound}) if operator == 'eq' else Q(**{f"{model_field}__{operator}": bound})
+        else:
+            raise ValueError(f"Unknown operator '{operator}' for '{field}'")
+        q &= condition
+    return q
 
 @api_view(['GET'])
 def get_doctors(request):
     """
     Get all doctors or filter by specialization
+    
+    Filter parameters (fee_min, fee_max, rating_min, rating_max,
+    experience_min, experience_max, availability, hospital and a JSON
+    `filter` expression) are answered from the recommender's in-memory
+    filter index when a model is loaded, without a database round trip.
+    Doctors are listed by id either way.
     """
     specialization = request.GET.get('specialization', '').strip().lower()
     
+    try:
+        filters = parse_doctor_filters(request.GET)
+        filter_q = filters_to_q(filters) if filters else None
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    
+    if filters:
+        recommender = get_recommender()
+        if recommender is not None:
+            if specialization:
+                filters = {'and': [filters, {'field': 'specialization', 'contains': specialization}]}
+            try:
+                doctors = recommender.filter_doctors(filters)
+            except ValueError as e:
+                return JsonResponse({"error": str(e)}, status=400)
+            except RECOMMENDER_SERVER_ERRORS as e:
+                logger.warning(f"Recommender server unavailable, filtering in the database: {str(e)}")
+            else:
+                doctor_list = [{field: doctor.get(field) for field in DOCTOR_LIST_FIELDS} for doctor in doctors]
+                # The model lists doctors in store row order; match the database's id order
+                doctor_list.sort(key=lambda doctor: doctor['id'])
+                return JsonResponse(doctor_list, safe=False)
+    
     # Check cache first
-    cache_key = f"doctors_{specialization}" if specialization else "doctors_all"
+    cache_key = doctor_list_cache_key(specialization, filters)
     cached_data = cache.get(cache_key)
 
     if cached_data:
@@ -90,11 +627,10 @@ def get_doctors(request):
         doctors = Doctor.objects.filter(specialization__icontains=specialization)
     else:
         doctors = Doctor.objects.all()
+    if filter_q is not None:
+        doctors = doctors.filter(filter_q)
 
-    doctor_list = list(doctors.values(
-        "id", "name", "specialization", "experience", 
-        "availability", "fee", "rating"
-    ))
+    doctor_list = list(doctors.order_by('pk').values(*DOCTOR_LIST_FIELDS))
 
     # Store result in cache
     cache.set(cache_key, doctor_list, timeout=300)  # Cache for 5 minutes
@@ -160,8 +696,19 @@ def doctor_details_view(request, id):
 def recommend_doctors(request):
     """
     Recommend doctors based on query condition using KNN model
+    
+    The query may combine several conditions with optional weights, e.g.
+    `asthma, hypertension:2`; they are scored together in one pass.
+    An optional `specialization` parameter restricts the results to doctors
+    of that specialization (case-insensitive). Filter parameters (see
+    get_doctors) are applied before ranking. With `facets=true` the response
+    also holds counts per specialization, fee bucket and rating bucket over
+    every doctor matching the query (not available from the database
+    fallback).
     """
     query = request.GET.get('query', '').strip()
+    specialization = request.GET.get('specialization', '').strip() or None
+    include_facets = request.GET.get('facets', '').strip().lower() in ('1', 'true', 'yes')
     sort_by = request.GET.get('sort_by', 'similarity')  # Default to similarity-based sorting
     limit = int(request.GET.get('limit', 20))  # Default to 20, allow overriding
     
@@ -171,6 +718,13 @@ def recommend_doctors(request):
             status=status.HTTP_400_BAD_REQUEST
         )
     
+    try:
+        filters = parse_doctor_filters(request.GET)
+        if filters:
+            filters_to_q(filters)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
     try:
         # Get or initialize recommender
         recommender = get_recommender()
@@ -181,47 +735,286 @@ def recommend_doctors(request):
             return simple_doctor_search(request)
         
         # Get recommendations with sorting
-        recommendations = recommender.recommend_doctors(
-            query=query,
-            sort_by=sort_by,
-            min_score=0.1,
-            limit=limit  # Use the provided limit parameter
-        )
+        facets = None
+        if include_facets:
+            # Facets are counted in the same pass over the candidates
+            batch_results, batch_facets = recommender.recommend_with_facets(
+                [query],
+                specialization=specialization,
+                sort_by=sort_by,
+                min_score=0.1,
+                limit=limit,
+                filters=filters
+            )
+            recommendations, facets = batch_results[0], batch_facets[0]
+        else:
+            recommendations = recommender.recommend_doctors(
+                query=query,
+                specialization=specialization,
+                sort_by=sort_by,
+                min_score=0.1,
+                limit=limit,  # Use the provided limit parameter
+                filters=filters
+            )
         
         if not recommendations:
             # Fallback to simple search if no recommendations
             return simple_doctor_search(request)
         
-        return Response({
+        response = {
             'recommended_doctors': recommendations,
             'query': query,
+            'specialization': specialization,
+            'filters': filters,
             'sort_by': sort_by,
             'results_count': len(recommendations),
             'using_ml_recommendations': True
-        })
+        }
+        if include_facets:
+            response['facets'] = facets
+        return Response(response)
+    
+    except ValueError as e:
+        # Malformed condition weights
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         
     except Exception as e:
         logger.error(f"Error in doctor recommendation: {str(e)}")
         # Fallback to simple search on error
         return simple_doctor_search(request)
 
+@api_view(['POST'])
+def recommend_doctors_batch(request):
+    """
+    Recommend doctors for many query conditions in a single request
+    
+    Expects a JSON body like {"queries": ["asthma", "diabetes"], "sort_by": "rating", "limit": 10},
+    optionally with a "specialization" every result must have, filter
+    parameters (see get_doctors) and "facets": true to add facet counts to
+    every result (see recommend_doctors)
+    """
+    queries = request.data.get('queries')
+    specialization = str(request.data.get('specialization') or '').strip() or None
+    include_facets = request.data.get('facets') in (True, 1, '1', 'true')
+    sort_by = request.data.get('sort_by', 'similarity')  # Default to similarity-based sorting
+    
+    if not isinstance(queries, list) or not queries:
+        return Response(
+            {'error': 'Please provide a non-empty list of queries'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    if len(queries) > MAX_BATCH_QUERIES:
+        return Response(
+            {'error': f'At most {MAX_BATCH_QUERIES} queries are allowed per request'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    try:
+        limit = int(request.data.get('limit', 20))  # Default to 20, allow overriding
+    except (TypeError, ValueError):
+        return Response(
+            {'error': 'limit must be an integer'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    try:
+        filters = parse_doctor_filters(request.data)
+        if filters:
+            filters_to_q(filters)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    # Weighted queries may also be given as {"condition": weight} objects or lists of conditions
+    queries = [query if isinstance(query, (dict, list)) else str(query).strip() for query in queries]
+    
+    try:
+        recommender = get_recommender()
+        batch_results = None
+        
+        if recommender is not None:
+            # One vectorized neighbor search for the whole batch
+            search_args = dict(
+                specialization=specialization,
+                sort_by=sort_by,
+                min_score=0.1,
+                limit=limit,
+                filters=filters
+            )
+            non_empty = [query for query in queries if query]
+            try:
+                if include_facets:
+                    batch_results, batch_facets = recommender.recommend_with_facets(non_empty, **search_args)
+                else:
+                    batch_results, batch_facets = recommender.recommend_many(non_empty, **search_args), [None] * len(non_empty)
+            except RECOMMENDER_SERVER_ERRORS as e:
+                logger.warning(f"Recommender server unavailable, using simple search: {str(e)}")
+            else:
+                # Keep empty queries in place so results line up with the request
+                batch_iter = iter(zip(batch_results, batch_facets))
+                batch_results, batch_facets = zip(*[next(batch_iter) if query else ([], None) for query in queries])
+                using_ml = True
+        
+        if batch_results is None:
+            # Fallback to simple search if recommender is not available
+            if recommender is None:
+                logger.warning("Recommendation system not available, using simple search")
+            batch_results = [
+                search_doctors_in_db(query, sort_by, specialization, filters) if query else []
+                for query in queries
+            ]
+            batch_facets = [None] * len(queries)
+            using_ml = False
+        
+        results = []
+        for query, recommendations, facets in zip(queries, batch_results, batch_facets):
+            result = {
+                'query': query,
+                'recommended_doctors': recommendations,
+                'results_count': len(recommendations)
+            }
+            if include_facets:
+                result['facets'] = facets
+            results.append(result)
+        
+        return Response({
+            'results': results,
+            'specialization': specialization,
+            'filters': filters,
+            'sort_by': sort_by,
+            'using_ml_recommendations': using_ml
+        })
+    
+    except ValueError as e:
+        # Malformed condition weights
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+    except Exception as e:
+        logger.error(f"Error in batch doctor recommendation: {str(e)}")
+        return Response(
+            {'error': 'An error occurred while recommending doctors'},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+@api_view(['GET'])
+def recommendation_cache_stats(request):
+    """
+    Hit/miss counters of the recommendation result cache of this worker
+    
+    Counters start over whenever a new model is swapped in. With a
+    recommender server, these are the server's counters and the model
+    version is its artifact version.
+    """
+    if recommender_client is not None:
+        try:
+            return Response({
+                'cache': recommender_client.cache_stats(),
+                'model_version': recommender_client.model_version()
+            })
+        except Exception as e:
+            logger.error(f"Error reading recommender server stats: {str(e)}")
+            return Response({'cache': None, 'model_version': None})
+    
+    recommender = recommender_holder.get() if recommender_available else None
+    if recommender is None:
+        return Response({'cache': None, 'model_version': None})
+    
+    return Response({
+        'cache': recommender.cache_stats(),
+        'model_version': recommender_holder.version
+    })
+
+def query_condition_names(query):
+    """
+    Lowercased conditions of a query, ignoring weights
+    
+    Queries may list several conditions separated by commas, each with an
+    optional weight after a colon ("asthma, hypertension:2"), or be a list
+    of conditions or a {condition: weight} object.
+    """
+    if isinstance(query, (dict, list)):
+        names = [str(name) for name in query]
+    else:
+        names = [re.sub(r':\s*[-+0-9.eE]+\s*$', '', part) for part in str(query).split(',')]
+    return [name.lower().strip() for name in names if name.strip()]
+
+def search_doctors_in_db(query, sort_by='experience', specialization=None, filters=None):
+    """
+    Search doctors by name, specialization and conditions directly in the database
+    
+    Doctors matching any condition of a multi-condition query are returned;
+    weights only affect ML recommendations.
+    
+    Args:
+        query: Search text, possibly with several conditions (see query_condition_names)
+        sort_by: Sorting criteria - "experience", "rating" or "fee"
+        specialization: Optional specialization the doctors must have (case-insensitive)
+        filters: Optional filter expression the doctors must match
+        
+    Returns:
+        List of serialized doctors with matched conditions
+    """
+    terms = query_condition_names(query) or [str(query).lower()]
+    
+    # Search in name, specialization, and conditions
+    search = Q()
+    for term in terms:
+        search |= (
+            Q(name__icontains=term) |
+            Q(specialization__icontains=term) |
+            Q(conditions_treated__icontains=term)
+        )
+    doctors = Doctor.objects.filter(search)
+    if specialization:
+        doctors = doctors.filter(specialization__iexact=specialization)
+    if filters:
+        doctors = doctors.filter(filters_to_q(filters))
+    
+    # Serialize doctors
+    serialized_doctors = []
+    for doctor in doctors:
+        doctor_data = DoctorSerializer(doctor).data
+        conditions = doctor_data.get('conditions_treated', [])
+        
+        # Ensure conditions is a list
+        if isinstance(conditions, str):
+            conditions = [c.strip() for c in conditions.split(',')]
+        
+        # Find matched conditions
+        matched_conditions = [
+            cond for cond in conditions
+            if any(term in cond.lower() for term in terms)
+        ]
+        
+        doctor_data['matched_conditions'] = matched_conditions
+        doctor_data['treats_searched_condition'] = bool(matched_conditions)
+        
+        serialized_doctors.append(doctor_data)
+    
+    # Sort based on criteria
+    if sort_by.lower() == 'rating':
+        serialized_doctors.sort(key=lambda x: (-x.get('rating', 0), -x.get('experience', 0)))
+    elif sort_by.lower() == 'fee':
+        serialized_doctors.sort(key=lambda x: (x.get('fee', float('inf'))))
+    else:  # Default to experience
+        serialized_doctors.sort(key=lambda x: (-x.get('experience', 0), -x.get('rating', 0)))
+    
+    return serialized_doctors
+
 def simple_doctor_search(request):
     """
     Simple search fallback when ML recommendations fail
     """
     query = request.GET.get('query', '').strip().lower()
+    specialization = request.GET.get('specialization', '').strip() or None
     sort_by = request.GET.get('sort_by', 'experience')  # Default to experience-based sorting
     limit = int(request.GET.get('limit', 20))  # Default to 20, allow overriding
     
     try:
-        # Search in name, specialization, and conditions
-        doctors = Doctor.objects.filter(
-            Q(name__icontains=query) |
-            Q(specialization__icontains=query) |
-            Q(conditions_treated__icontains=query)
-        )
+        filters = parse_doctor_filters(request.GET)
+        serialized_doctors = search_doctors_in_db(query, sort_by, specialization, filters)
         
-        if not doctors.exists():
+        if not serialized_doctors:
             return Response({
                 'recommended_doctors': [],
                 'query': query,
@@ -230,35 +1023,6 @@ def simple_doctor_search(request):
                 'message': f'No doctors found for "{query}"'
             })
         
-        # Serialize doctors
-        serialized_doctors = []
-        for doctor in doctors:
-            doctor_data = DoctorSerializer(doctor).data
-            conditions = doctor_data.get('conditions_treated', [])
-            
-            # Ensure conditions is a list
-            if isinstance(conditions, str):
-                conditions = [c.strip() for c in conditions.split(',')]
-            
-            # Find matched conditions
-            matched_conditions = [
-                cond for cond in conditions
-                if query in cond.lower()
-            ]
-            
-            doctor_data['matched_conditions'] = matched_conditions
-            doctor_data['treats_searched_condition'] = bool(matched_conditions)
-            
-            serialized_doctors.append(doctor_data)
-        
-        # Sort based on criteria
-        if sort_by.lower() == 'rating':
-            serialized_doctors.sort(key=lambda x: (-x.get('rating', 0), -x.get('experience', 0)))
-        elif sort_by.lower() == 'fee':
-            serialized_doctors.sort(key=lambda x: (x.get('fee', float('inf'))))
-        else:  # Default to experience
-            serialized_doctors.sort(key=lambda x: (-x.get('experience', 0), -x.get('rating', 0)))
-        
         return Response({
             'recommended_doctors': serialized_doctors,
             'query': query,
@@ -324,6 +1088,8 @@ def manage_doctor_profile(request, email=None):
                 mobile_number=user.mobile_number,
                 specialization="General"
             )
+            sync_doctor_to_recommender(doctor)
+            invalidate_doctor_lists()
         
         if request.method == 'GET':
             # Return doctor profile details
@@ -334,9 +1100,9 @@ def manage_doctor_profile(request, email=None):
             serializer = DoctorSerializer(doctor, data=request.data, partial=True)
             if serializer.is_valid():
                 serializer.save()
+                sync_doctor_to_recommender(doctor)
                 # Clear related cache keys
-                cache.delete(f"doctors_all")
-                cache.delete(f"doctors_{doctor.specialization.lower()}")
+                invalidate_doctor_lists()
                 cache.delete("specialization_options")
                 
                 return Response(serializer.data)
@@ -171,3 +171,28 @@ CORS_ALLOWED_ORIGINS = [
 # AUTH_USER_MODEL = 'user_management.HealthcareUser'
 # settings.py
 
+
+# Doctor recommender: when True, web workers attach read-only (memory-mapped)
+# to the model published by `python manage.py build_recommender` instead of
+# each training and holding their own copy
+RECOMMENDER_SHARED_MODEL = False
+
+# Nearest-neighbor backend of the doctor recommender: 'brute' (exact),
+# 'inverted' (impact-ordered postings, sub-linear for condition queries) or
+# 'ivf' (clustered, approximate), with backend-specific tuning parameters
+RECOMMENDER_INDEX = 'brute'
+RECOMMENDER_INDEX_PARAMS = {}
+
+# Doctors read from the database per chunk while training the recommender;
+# bounds the Python objects alive during training
+RECOMMENDER_TRAINING_CHUNK_SIZE = 2000
+
+# Worker processes used to encode and index the catalog while training the
+# recommender; None uses one per CPU, 1 trains in the calling process
+RECOMMENDER_FIT_JOBS = 1
+
+# Unix domain socket of a recommender server started with
+# `python -m recommendation_system.server --socket PATH`; when set, web
+# workers send recommendation requests to it instead of loading the model
+# (which `manage.py build_recommender` publishes for the server)
+RECOMMENDER_SERVER_SOCKET = None
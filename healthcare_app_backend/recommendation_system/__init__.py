@@ -1,18 +1,44 @@
-from .doctor_recommender import DoctorRecommender, SimpleRecommender
-from .utils import (
-    save_model, 
-    load_model, 
-    preprocess_doctor_data, 
-    batch_preprocess_doctors,
-    get_model_path
-)
+import importlib
 
-__all__ = [
-    'DoctorRecommender',
-    'SimpleRecommender',
-    'save_model',
-    'load_model',
-    'preprocess_doctor_data',
-    'batch_preprocess_doctors',
-    'get_model_path'
-] 
\ No newline at end of file
+# Public name -> submodule defining it. Submodules are imported on first
+# access, so processes that only use the lightweight client (e.g. web
+# workers talking to a recommender server) never import numpy, pandas or
+# scikit-learn.
+_EXPORTS = {
+    'DoctorRecommender': 'doctor_recommender',
+    'SimpleRecommender': 'doctor_recommender',
+    'DoctorStore': 'doctor_store',
+    'FilterIndex': 'filters',
+    'ModelHolder': 'model_holder',
+    'NeighborIndex': 'neighbors',
+    'BruteForceIndex': 'neighbors',
+    'IVFIndex': 'neighbors',
+    'InvertedIndex': 'neighbors',
+    'create_index': 'neighbors',
+    'evaluate_recall': 'neighbors',
+    'ShardedRecommender': 'sharding',
+    'shard_of': 'sharding',
+    'RecommenderClient': 'client',
+    'RecommenderServer': 'server',
+    'TextSearchIndex': 'text_search',
+    'TrigramIndex': 'trigrams',
+    'save_model': 'utils',
+    'load_model': 'utils',
+    'preprocess_doctor_data': 'utils',
+    'batch_preprocess_doctors': 'utils',
+    'get_model_path': 'utils',
+    'MODEL_SCHEMA_VERSION': 'utils',
+}
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f'.{module}', __name__), name)
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(_EXPORTS))
+
+__all__ = list(_EXPORTS)
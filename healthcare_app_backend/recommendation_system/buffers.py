@@ -0,0 +1,128 @@
+import math
+from typing import Any, Hashable, Tuple
+
+import numpy as np
+try:
+    from scipy import sparse
+except ImportError:
+    sparse = None
+
+class AppendBuffers:
+    """
+    Spare capacity behind the arrays of an index that grow one row at a time
+    
+    numpy arrays cannot grow in place, so np.append copies the whole array
+    and every incremental update costs time proportional to the catalog.
+    Arrays grown through append() or resize() are instead views of a larger
+    buffer kept under a key. While the array handed back in is still that
+    view, new values are written into the spare capacity; the buffer is only
+    reallocated, GROWTH times larger, once it is full, so growing an array
+    by n values costs amortized O(n).
+    
+    Values are only ever written past the end of the views handed out, so
+    another owner sharing an earlier view (e.g. a DoctorStore.copy()) never
+    sees it change. Arrays the buffers did not hand out (memory maps, arrays
+    rebuilt at compaction) are copied into a new buffer on their first append.
+    """
+    # Factor by which a full buffer grows, and the least room it gains
+    GROWTH = 1.25
+    MIN_SLACK = 16
+    
+    def __init__(self):
+        # Key -> (buffer, shape of the view handed out)
+        self._buffers = {}
+    
+    def __getstate__(self) -> dict:
+        # Pickled owners (e.g. shards sent to worker processes) carry only their views
+        return {'_buffers': {}}
+    
+    def clear(self) -> None:
+        """Release every buffer, e.g. after the owner rebuilt its arrays"""
+        self._buffers.clear()
+    
+    def append(self, key: Hashable, array: np.ndarray, values: Any, dtype: Any = None) -> np.ndarray:
+        """
+        A 1D array with values appended
+        
+        Args:
+            key: Name of the buffer, unique within the owner
+            array: Current array; the previous return value for the same key
+                to reuse its buffer
+            values: Scalar or 1D values to append
+            dtype: Dtype of the result; the dtype of array by default
+        
+        Returns:
+            The appended array, a view of the key's buffer
+        """
+        values = np.asarray(values, dtype=dtype or array.dtype).ravel()
+        grown = self.resize(key, array, (len(array) + len(values),), dtype)
+        grown[len(array):] = values
+        return grown
+    
+    def resize(self, key: Hashable, array: np.ndarray, shape: Tuple[int, ...], dtype: Any = None) -> np.ndarray:
+        """
+        A writable array of the given shape holding array in its leading cells
+        
+        Args:
+            key: Name of the buffer, unique within the owner
+            array: Current array; the previous return value for the same key
+                to reuse its buffer
+            shape: New shape, at least that of array along every axis
+            dtype: Dtype of the result; the dtype of array by default
+        
+        Returns:
+            View of the key's buffer; cells beyond array are zero
+        """
+        dtype = np.dtype(dtype or array.dtype)
+        buffer = self._held_buffer(key, array, dtype)
+        capacity = buffer.shape if buffer is not None else array.shape
+        if buffer is None or any(size > room for size, room in zip(shape, capacity)):
+            capacity = tuple(
+                room if size <= room else max(math.ceil(size * self.GROWTH), size + self.MIN_SLACK)
+                for size, room in zip(shape, capacity)
+            )
+            grown = np.zeros(capacity, dtype=dtype)
+            grown[tuple(slice(0, size) for size in array.shape)] = array
+            buffer = grown
+        self._buffers[key] = (buffer, tuple(shape))
+        return buffer[tuple(slice(0, size) for size in shape)]
+    
+    def append_csr_rows(self, key: Hashable, matrix, rows):
+        """
+        A CSR matrix with the rows of another appended
+        
+        Args:
+            key: Name of the buffers, unique within the owner
+            matrix: Current CSR matrix; the previous return value for the
+                same key to reuse its buffers
+            rows: CSR matrix of the rows to append
+        
+        Returns:
+            CSR matrix over views of the key's buffers, as wide as the wider
+            of the two matrices
+        """
+        nnz = matrix.indptr[-1]
+        data = self.append((key, 'data'), matrix.data[:nnz], rows.data)
+        indices = self.append((key, 'indices'), matrix.indices[:nnz], rows.indices)
+        indptr = self.append((key, 'indptr'), matrix.indptr, nnz + rows.indptr[1:])
+        return sparse.csr_matrix(
+            (data, indices, indptr),
+            shape=(matrix.shape[0] + rows.shape[0], max(matrix.shape[1], rows.shape[1])),
+            copy=False
+        )
+    
+    def _held_buffer(self, key: Hashable, array: np.ndarray, dtype: np.dtype) -> np.ndarray:
+        """The key's buffer if array is the view last handed out for it, else None"""
+        entry = self._buffers.get(key)
+        if entry is None:
+            return None
+        buffer, shape = entry
+        if (
+            array.base is not buffer
+            or array.shape != shape
+            or array.dtype != dtype
+            or array.strides != buffer.strides
+            or array.__array_interface__['data'][0] != buffer.__array_interface__['data'][0]
+        ):
+            return None
+        return buffer
@@ -0,0 +1,275 @@
+import itertools
+import socket
+import threading
+from concurrent.futures import Future
+from typing import Any, Dict, List, Tuple
+import logging
+
+from .protocol import (
+    METHOD_KINDS,
+    REPLY_INVALID,
+    REPLY_OK,
+    REPLY_UNAVAILABLE,
+    ProtocolError,
+    pack_frame,
+    read_frame,
+)
+
+logger = logging.getLogger(__name__)
+
+class RecommenderUnavailableError(RuntimeError):
+    """The recommender server has no model loaded yet"""
+
+class RecommenderServerError(RuntimeError):
+    """The recommender server failed to answer a request"""
+
+def _reply_error(kind: int, message: Any) -> Exception:
+    """Exception raised to the caller for an error reply"""
+    if kind == REPLY_INVALID:
+        return ValueError(message)
+    if kind == REPLY_UNAVAILABLE:
+        return RecommenderUnavailableError(message)
+    return RecommenderServerError(message)
+
+class _Connection:
+    """
+    One pipelined connection to the recommender server
+    
+    Requests are written as soon as they are submitted; a reader thread
+    resolves the future of each request when its reply arrives. If the
+    connection breaks, every request still in flight fails with
+    ConnectionError.
+    """
+    def __init__(self, socket_path: str, connect_timeout: float):
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self.socket.settimeout(connect_timeout)
+            self.socket.connect(socket_path)
+            self.socket.settimeout(None)
+        except OSError:
+            self.socket.close()
+            raise
+        self.closed = False
+        self._reader = self.socket.makefile('rb')
+        self._request_ids = itertools.count(1)
+        # Request id -> Future of every request awaiting its reply
+        self._pending = {}
+        self._lock = threading.Lock()
+        # Keeps frames of concurrent senders from interleaving
+        self._send_lock = threading.Lock()
+        threading.Thread(target=self._read_replies, name="recommender-client-reader", daemon=True).start()
+    
+    @property
+    def in_flight(self) -> int:
+        """Number of requests awaiting their reply"""
+        return len(self._pending)
+    
+    def submit(self, kind: int, arguments: Dict[str, Any]) -> Future:
+        """Send a request without waiting for its reply"""
+        future = Future()
+        with self._lock:
+            if self.closed:
+                raise ConnectionError("Connection to the recommender server is closed")
+            request_id = next(self._request_ids) & 0xFFFFFFFF
+            self._pending[request_id] = future
+        try:
+            frame = pack_frame(request_id, kind, arguments)
+        except ProtocolError:
+            with self._lock:
+                self._pending.pop(request_id, None)
+            raise
+        try:
+            with self._send_lock:
+                self.socket.sendall(frame)
+        except OSError as e:
+            self._fail(e)
+        return future
+    
+    def _read_replies(self) -> None:
+        """Resolve pending requests with their replies until the connection ends"""
+        try:
+            while True:
+                frame = read_frame(self._reader)
+                if frame is None:
+                    raise ConnectionError("Recommender server closed the connection")
+                request_id, kind, value = frame
+                with self._lock:
+                    future = self._pending.pop(request_id, None)
+                if future is None:
+                    continue
+                if kind == REPLY_OK:
+                    future.set_result(value)
+                else:
+                    future.set_exception(_reply_error(kind, value))
+        except (OSError, ValueError, ProtocolError) as e:
+            self._fail(e)
+        finally:
+            self._reader.close()
+    
+    def _fail(self, error: Exception) -> None:
+        """Close the connection and fail every request still in flight"""
+        with self._lock:
+            was_closed = self.closed
+            self.closed = True
+            pending, self._pending = self._pending, {}
+        if not was_closed:
+            logger.info("Connection to the recommender server ended: %s", str(error))
+            self.close()
+        for future in pending.values():
+            future.set_exception(ConnectionError(f"Recommender server connection lost: {error}"))
+    
+    def close(self) -> None:
+        """Close the socket; the reader thread then fails any pending requests"""
+        self.closed = True
+        try:
+            self.socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.socket.close()
+
+class RecommenderClient:
+    """
+    Client of a recommender server (see recommendation_system.server)
+    
+    Offers the query methods of DoctorRecommender, answered by the server
+    process over its Unix domain socket. Connections are opened lazily and
+    pooled: a request goes to an idle connection, or a new one while fewer
+    than pool_size are open; beyond that requests are pipelined on the
+    least busy connection. Broken connections are dropped from the pool and
+    replaced on demand. Safe to share between threads.
+    
+    Only the standard library is imported, so processes using the client
+    never load numpy, pandas or scikit-learn.
+    """
+    def __init__(self, socket_path: str, pool_size: int = 4, timeout: float = 10.0):
+        """
+        Initialize the client
+        
+        Args:
+            socket_path: Path of the server's Unix domain socket
+            pool_size: Most connections opened to the server
+            timeout: Seconds to wait for a connection or a reply
+        """
+        self.socket_path = socket_path
+        self.pool_size = max(int(pool_size), 1)
+        self.timeout = timeout
+        self._connections = []
+        self._lock = threading.Lock()
+    
+    def _connection(self) -> _Connection:
+        """Pooled connection for the next request"""
+        with self._lock:
+            self._connections = [connection for connection in self._connections if not connection.closed]
+            least_busy = min(self._connections, key=lambda connection: connection.in_flight, default=None)
+            if least_busy is not None and (least_busy.in_flight == 0 or len(self._connections) >= self.pool_size):
+                return least_busy
+            connection = _Connection(self.socket_path, self.timeout)
+            self._connections.append(connection)
+            return connection
+    
+    def submit(self, method: str, **arguments) -> Future:
+        """
+        Send a request without waiting for the reply
+        
+        Args:
+            method: Server method, see protocol.METHODS
+            **arguments: Keyword arguments of the method
+        
+        Returns:
+            Future resolved with the decoded reply, or failing with
+            ValueError (malformed request), RecommenderUnavailableError,
+            RecommenderServerError or ConnectionError
+        """
+        kind = METHOD_KINDS.get(method)
+        if kind is None:
+            raise ValueError(f"Unknown recommender server method: {method}")
+        return self._connection().submit(kind, arguments)
+    
+    def call(self, method: str, **arguments) -> Any:
+        """Send a request and wait for its reply; see submit"""
+        return self.submit(method, **arguments).result(self.timeout)
+    
+    def recommend_doctors(
+        self,
+        query: str,
+        specialization: str = None,
+        sort_by: str = None,
+        min_score: float = 0.1,
+        limit: int = 10,
+        filters: Dict[str, Any] = None
+    ) -> List[Dict[str, Any]]:
+        """Recommend doctors for one query; see DoctorRecommender.recommend_doctors"""
+        return self.recommend_many(
+            [query],
+            specialization=specialization,
+            sort_by=sort_by,
+            min_score=min_score,
+            limit=limit,
+            filters=filters
+        )[0]
+    
+    def recommend_many(
+        self,
+        queries: List[Any],
+        specialization: str = None,
+        sort_by: str = None,
+        min_score: float = 0.1,
+        limit: int = 10,
+        filters: Dict[str, Any] = None
+    ) -> List[List[Dict[str, Any]]]:
+        """Recommend doctors for a batch of queries; see DoctorRecommender.recommend_many"""
+        return self.call(
+            'recommend_many',
+            queries=list(queries),
+            specialization=specialization,
+            sort_by=sort_by,
+            min_score=min_score,
+            limit=limit,
+            filters=filters
+        )
+    
+    def recommend_with_facets(
+        self,
+        queries: List[Any],
+        specialization: str = None,
+        sort_by: str = None,
+        min_score: float = 0.1,
+        limit: int = 10,
+        filters: Dict[str, Any] = None
+    ) -> Tuple[List[List[Dict[str, Any]]], List[Dict[str, Any]]]:
+        """Recommend doctors with facet counts; see DoctorRecommender.recommend_with_facets"""
+        results, facets = self.call(
+            'recommend_with_facets',
+            queries=list(queries),
+            specialization=specialization,
+            sort_by=sort_by,
+            min_score=min_score,
+            limit=limit,
+            filters=filters
+        )
+        return results, facets
+    
+    def filter_doctors(self, filters: Dict[str, Any] = None, sort_by: str = None, limit: int = None) -> List[Dict[str, Any]]:
+        """Doctors matching a filter expression; see DoctorRecommender.filter_doctors"""
+        return self.call('filter_doctors', filters=filters, sort_by=sort_by, limit=limit)
+    
+    def cache_stats(self) -> Dict[str, Any]:
+        """Result cache counters of the served model"""
+        return self.call('cache_stats')
+    
+    def model_version(self) -> str:
+        """Artifact version of the served model"""
+        return self.call('model_version')
+    
+    def close(self) -> None:
+        """Close every pooled connection"""
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for connection in connections:
+            connection.close()
+    
+    def __enter__(self) -> 'RecommenderClient':
+        return self
+    
+    def __exit__(self, *exc_info) -> None:
+        self.close()
@@ -1,106 +1,630 @@
 import numpy as np
 # Modified imports to avoid ComplexWarning issue
 try:
-    from sklearn.neighbors import NearestNeighbors
+    from scipy import sparse
     from sklearn.preprocessing import StandardScaler, MultiLabelBinarizer
 except ImportError:
     # Fallback for newer numpy versions where ComplexWarning might not be available
     import warnings
     warnings.warn("Using simplified implementation due to sklearn import error")
-    NearestNeighbors = None
+    sparse = None
     StandardScaler = None
     MultiLabelBinarizer = None
 
 import pandas as pd
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterable, Tuple
+from collections import defaultdict
+import bisect
+import copy
+import json
 import logging
+import threading
+
+from .buffers import AppendBuffers
+from .doctor_store import DoctorStore, RowIdIndex, gather_ranges
+from .filters import FilterIndex
+from .locks import ReadWriteLock
+from .neighbors import create_index, evaluate_recall, normalize_rows
+from .parallel import process_map, resolve_jobs, shard_bounds
+from .partitions import SpecializationPartition, build_partitions, specialization_key
+from .result_cache import ResultCache
+from .text_search import TextSearchIndex, tokenize
+from .trigrams import TrigramIndex
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+def parse_query_terms(query: Any) -> List[Tuple[str, float]]:
+    """
+    Split a query into normalized (condition, weight) terms
+    
+    A query is a condition, several conditions separated by commas with
+    optional weights after a colon ("asthma, hypertension:2"), a list of
+    conditions or a dictionary of condition -> weight. Conditions are
+    lowercased and stripped; repeated conditions add up their weights.
+    
+    Raises:
+        ValueError: If a weight is not a positive number
+    """
+    if isinstance(query, dict):
+        items = list(query.items())
+    elif isinstance(query, (list, tuple)):
+        items = [(condition, 1.0) for condition in query]
+    else:
+        items = []
+        for part in str(query).split(','):
+            condition, separator, weight = part.rpartition(':')
+            try:
+                items.append((condition, float(weight)) if separator else (part, 1.0))
+            except ValueError:
+                # The colon is part of the condition name
+                items.append((part, 1.0))
+    
+    weights = {}
+    for condition, weight in items:
+        condition = str(condition).lower().strip()
+        if not condition:
+            continue
+        try:
+            weight = float(weight)
+        except (TypeError, ValueError):
+            raise ValueError(f"Weight of '{condition}' must be a number, got {weight!r}")
+        if not weight > 0:
+            raise ValueError(f"Weight of '{condition}' must be positive, got {weight!r}")
+        weights[condition] = weights.get(condition, 0.0) + weight
+    return list(weights.items())
+
+def _index_shard(doctors: DoctorStore) -> Tuple[Dict[str, np.ndarray], FilterIndex, TextSearchIndex]:
+    """Key postings, filter index and text index of a doctor store; runs in the fit worker processes"""
+    return SimpleRecommender.key_postings(doctors), FilterIndex.build(doctors), TextSearchIndex.build(doctors)
+
+def _encode_doctors(doctors_data: List[Dict[str, Any]]) -> DoctorStore:
+    """Normalize a chunk of doctor dictionaries into a store; runs in the fit worker processes"""
+    return DoctorStore.from_records([DoctorRecommender._normalize_doctor(doctor) for doctor in doctors_data])
+
+def format_query_terms(terms: List[Tuple[str, float]]) -> str:
+    """Canonical query string of parsed terms; a single unweighted condition is just its name"""
+    return ', '.join(
+        condition if weight == 1 else f'{condition}:{weight:.12g}'
+        for condition, weight in sorted(terms)
+    )
+
 class SimpleRecommender:
     """
     A simple recommendation system based on filtering and sorting
     """
-    def __init__(self):
-        self.doctors_df = None
+    # Separator for the key blob; never present in a lowercased query
+    KEY_SEPARATOR = '\x00'
+    # Numeric fields results can be ordered by, and the value of doctors missing one
+    SORT_DEFAULTS = {'experience': 0.0, 'rating': 0.0, 'fee': np.inf}
+    # Smallest catalog indexed on several processes
+    PARALLEL_MIN_ROWS = 100000
+    # Tiers recommend_doctors matches a query in, best first: condition or
+    # specialization keys containing the query, then the free-text index
+    KEY_TIER = 0
+    TEXT_TIER = 1
+    
+    def __init__(self, n_jobs: int = 1):
+        """
+        Initialize the recommender
         
+        Args:
+            n_jobs: Worker processes building the indexes of catalogs of at
+                least PARALLEL_MIN_ROWS doctors; None uses one per CPU, 1
+                (default) builds them in this process
+        """
+        self.n_jobs = n_jobs
+        # Columnar doctor records; DoctorRecommender shares the same store
+        self.doctors = None
+        # Inverted index: normalized condition/specialization key -> row ids
+        self.index_keys = []
+        self.postings = []
+        # All keys joined into one string for substring lookups
+        self._key_blob = ''
+        self._key_starts = np.array([], dtype=np.int64)
+        # Trigram index over the keys, to correct misspelled query conditions
+        self.key_trigrams = TrigramIndex()
+        # Keys of other recommenders (the other shards of a ShardedRecommender)
+        # that spelling correction also knows, joined like the key blob
+        self.correction_keys = set()
+        self._correction_blob = ''
+        # Rows of replaced or removed doctors stay in place, flagged inactive,
+        # until the next compaction
+        self.active_rows = np.array([], dtype=bool)
+        # Number of rows flagged inactive, so compaction checks need no scan
+        self.n_inactive_rows = 0
+        self.row_by_id = RowIdIndex()
+        # Bitset and range indexes over the filterable fields of every row
+        self.filter_index = None
+        # BM25 index over the text fields, for queries no key contains
+        self.text_index = None
+        # Spare capacity of the active flags and postings grown by upserts
+        self._buffers = AppendBuffers()
+    
     def fit(self, doctors_data: List[Dict[str, Any]]) -> None:
-        """Load the doctor data into a DataFrame"""
-        self.doctors_df = pd.DataFrame(doctors_data)
-        # Ensure numeric fields are properly formatted
-        for field in ['experience', 'rating', 'fee']:
-            if field in self.doctors_df.columns:
-                self.doctors_df[field] = pd.to_numeric(self.doctors_df[field], errors='coerce').fillna(0)
-        logger.info(f"Simple recommender loaded with {len(self.doctors_df)} doctors")
+        """Load the doctor data into a columnar store and build the inverted, filter and text indexes"""
+        self.fit_store(DoctorStore.from_records(doctors_data))
+    
+    def fit_store(self, doctors: DoctorStore) -> None:
+        """Build the inverted, filter and text indexes over an existing doctor store"""
+        self._load_store(doctors)
+        self._build_indexes()
+        logger.info(f"Simple recommender loaded with {len(self.doctors)} doctors")
+    
+    def _load_store(self, doctors: DoctorStore, active_rows: np.ndarray = None) -> None:
+        """Keep the doctor store and index its live rows by doctor id"""
+        self.doctors = doctors
+        if active_rows is None:
+            active_rows = np.ones(len(doctors), dtype=bool)
+        self.active_rows = np.array(active_rows, dtype=bool)
+        self.n_inactive_rows = len(self.active_rows) - int(np.count_nonzero(self.active_rows))
+        self.row_by_id = RowIdIndex.build(doctors, self.active_rows)
+        self._buffers.clear()
+    
+    def upsert_doctor(self, doctor: Dict[str, Any]) -> None:
+        """
+        Add a doctor, or replace the existing doctor with the same id
+        
+        The new row is appended and indexed under its keys; a replaced row is
+        only flagged inactive until the next compact().
+        
+        Args:
+            doctor: Preprocessed doctor dictionary with an 'id'
+        """
+        if self.doctors is None:
+            self.fit([doctor])
+            return
+        
+        self.remove_doctor(doctor['id'])
+        
+        new_row = self.doctors.append(doctor)
+        self.filter_index.append(doctor)
+        self.text_index.append(doctor)
+        self.active_rows = self._buffers.append('active_rows', self.active_rows, True)
+        self.row_by_id[doctor['id']] = new_row
+        
+        keys_added = False
+        for key in self._row_keys(doctor.get('conditions_treated'), doctor.get('specialization')):
+            position = bisect.bisect_left(self.index_keys, key)
+            if position < len(self.index_keys) and self.index_keys[position] == key:
+                self.postings[position] = self._buffers.append(('postings', key), self.postings[position], new_row)
+            else:
+                self.index_keys.insert(position, key)
+                self.postings.insert(position, np.array([new_row], dtype=np.int32))
+                self.key_trigrams.add(key)
+                keys_added = True
+        if keys_added:
+            self._build_key_blob()
+    
+    def remove_doctor(self, doctor_id: Any) -> bool:
+        """
+        Remove a doctor from future recommendations
+        
+        Returns:
+            bool: True if the doctor was present
+        """
+        row = self.row_by_id.pop(doctor_id, None)
+        if row is None:
+            return False
+        self.active_rows[row] = False
+        self.n_inactive_rows += 1
+        return True
+    
+    def compact(self) -> None:
+        """Drop inactive rows and rebuild the inverted, filter and text indexes over the live ones"""
+        if self.doctors is None or self.n_inactive_rows == 0:
+            return
+        live_rows = np.flatnonzero(self.active_rows)
+        self._load_store(self.doctors.take(live_rows))
+        self._build_indexes()
+    
+    def get_state(self) -> Tuple[Dict[str, np.ndarray], Dict[str, Any]]:
+        """Export the inverted, filter and text indexes as flat arrays and JSON-serializable metadata"""
+        lengths = np.array([len(posting) for posting in self.postings], dtype=np.int64)
+        arrays = {
+            'postings': np.concatenate(self.postings) if self.postings else np.array([], dtype=np.int32),
+            'posting_offsets': np.concatenate(([0], np.cumsum(lengths))).astype(np.int64),
+            'active_rows': self.active_rows,
+        }
+        metadata = {'index_keys': self.index_keys}
+        if self.filter_index is not None:
+            filter_arrays, metadata['filters'] = self.filter_index.get_state()
+            arrays.update({f'filter_{name}': array for name, array in filter_arrays.items()})
+        if self.text_index is not None:
+            text_arrays, metadata['text'] = self.text_index.get_state()
+            arrays.update({f'text_{name}': array for name, array in text_arrays.items()})
+        return arrays, metadata
+    
+    def restore(self, doctors: DoctorStore, arrays: Dict[str, np.ndarray], metadata: Dict[str, Any]) -> None:
+        """
+        Restore the recommender from get_state output without rebuilding the index
+        
+        Args:
+            doctors: The doctor store the index was built over
+            arrays: Arrays produced by get_state
+            metadata: Metadata produced by get_state
+        """
+        self._load_store(doctors, arrays.get('active_rows'))
+        postings = arrays['postings']
+        offsets = np.asarray(arrays['posting_offsets'])
+        self.index_keys = list(metadata['index_keys'])
+        # Postings stay views into the (possibly memory-mapped) array
+        self.postings = [postings[offsets[i]:offsets[i + 1]] for i in range(len(self.index_keys))]
+        self._build_key_blob()
+        self._build_key_trigrams()
+        if 'filters' in metadata:
+            self.filter_index = FilterIndex.from_state(
+                {name[len('filter_'):]: array for name, array in arrays.items() if name.startswith('filter_')},
+                metadata['filters']
+            )
+        else:
+            self.filter_index = FilterIndex.build(self.doctors)
+        if 'text' in metadata:
+            self.text_index = TextSearchIndex.from_state(
+                {name[len('text_'):]: array for name, array in arrays.items() if name.startswith('text_')},
+                metadata['text']
+            )
+        else:
+            self.text_index = TextSearchIndex.build(self.doctors)
+        logger.info(f"Simple recommender restored with {len(self.doctors)} doctors")
+    
+    @staticmethod
+    def _row_keys(conditions: Any, specialization: Any) -> set:
+        """Normalized index keys for a single doctor row"""
+        keys = set()
+        if isinstance(conditions, list):
+            keys.update(str(c).lower() for c in conditions)
+        elif isinstance(conditions, str):
+            keys.add(conditions.lower())
+        if isinstance(specialization, str):
+            keys.add(specialization.lower())
+        keys.discard('')
+        return keys
+    
+    def _build_indexes(self) -> None:
+        """
+        Build the inverted, filter and text indexes over the doctor store
+        
+        Catalogs of at least PARALLEL_MIN_ROWS doctors are split into row
+        shards that are indexed on n_jobs worker processes; the shard
+        indexes are then merged into the same indexes a single build makes.
+        """
+        n_jobs = resolve_jobs(self.n_jobs)
+        if n_jobs <= 1 or len(self.doctors) < self.PARALLEL_MIN_ROWS:
+            key_postings, self.filter_index, self.text_index = _index_shard(self.doctors)
+            self._build_index(key_postings)
+            return
+        
+        bounds = shard_bounds(len(self.doctors), n_jobs)
+        shards = list(process_map(
+            _index_shard,
+            (self.doctors.slice_rows(start, stop) for start, stop in bounds),
+            n_jobs
+        ))
+        merged_postings = defaultdict(list)
+        for (start, _), (key_postings, _, _) in zip(bounds, shards):
+            for key, rows in key_postings.items():
+                merged_postings[key].append(rows + np.int32(start))
+        self._build_index({key: np.concatenate(rows) for key, rows in merged_postings.items()})
+        self.filter_index = FilterIndex.merge([filter_index for _, filter_index, _ in shards])
+        self.text_index = TextSearchIndex.merge([text_index for _, _, text_index in shards])
+        logger.info(f"Indexed {len(self.doctors)} doctors in {len(bounds)} shards on {n_jobs} processes")
+    
+    @classmethod
+    def key_postings(cls, doctors: DoctorStore) -> Dict[str, np.ndarray]:
+        """Sorted rows of every condition and specialization key of a doctor store"""
+        postings = defaultdict(list)
+        conditions = doctors.values('conditions_treated')
+        specializations = doctors.values('specialization')
+        
+        for row, (row_conditions, specialization) in enumerate(zip(conditions, specializations)):
+            for key in cls._row_keys(row_conditions, specialization):
+                postings[key].append(row)
+        return {key: np.array(rows, dtype=np.int32) for key, rows in postings.items()}
+    
+    def _build_index(self, key_postings: Dict[str, np.ndarray]) -> None:
+        """
+        Build the inverted index from condition and specialization keys
+        
+        Each distinct key maps to the sorted row ids of the doctors that
+        treat it or hold it as their specialization. The keys are also
+        concatenated into a single separator-delimited string, so "contains"
+        lookups scan the (small) key vocabulary instead of the whole catalog.
+        
+        Args:
+            key_postings: Sorted rows of every key, see key_postings
+        """
+        self.index_keys = sorted(key_postings)
+        self.postings = [key_postings[key] for key in self.index_keys]
+        self._build_key_blob()
+        self._build_key_trigrams()
+    
+    def _build_key_blob(self) -> None:
+        """Join the index keys into one string and record where each key starts"""
+        self._key_blob = self.KEY_SEPARATOR.join(self.index_keys)
+        key_lengths = np.array([len(key) + 1 for key in self.index_keys], dtype=np.int64)
+        self._key_starts = np.concatenate(([0], np.cumsum(key_lengths)[:-1])) if len(key_lengths) else key_lengths
+    
+    def _build_key_trigrams(self) -> None:
+        """Index the keys and the correction keys for spelling correction"""
+        self.key_trigrams = TrigramIndex(self.index_keys)
+        for key in sorted(self.correction_keys):
+            self.key_trigrams.add(key)
+    
+    def add_correction_keys(self, keys: Iterable[str]) -> bool:
+        """
+        Make keys of other recommenders known to spelling correction
+        
+        A ShardedRecommender gives every shard the keys of all shards, so a
+        query term is corrected the same way whichever shard answers it.
+        
+        Args:
+            keys: Normalized condition and specialization keys
+        
+        Returns:
+            bool: True if any key was new
+        """
+        new_keys = set(keys) - self.correction_keys
+        if not new_keys:
+            return False
+        self.correction_keys.update(new_keys)
+        self._correction_blob = self.KEY_SEPARATOR.join(sorted(self.correction_keys))
+        for key in sorted(new_keys):
+            self.key_trigrams.add(key)
+        return True
+    
+    def _matching_rows(self, query_lower: str) -> np.ndarray:
+        """Row ids of doctors whose condition or specialization contains the query"""
+        if self.KEY_SEPARATOR in query_lower or not self.index_keys:
+            return np.array([], dtype=np.int64)
+        
+        # Find every key containing the query by scanning the key blob
+        matched_keys = set()
+        position = self._key_blob.find(query_lower)
+        while position != -1:
+            key_id = int(np.searchsorted(self._key_starts, position, side='right')) - 1
+            matched_keys.add(key_id)
+            # Skip to the next key, one match per key is enough
+            next_start = self._key_starts[key_id] + len(self.index_keys[key_id]) + 1
+            position = self._key_blob.find(query_lower, next_start)
+        
+        if not matched_keys:
+            return np.array([], dtype=np.int64)
+        rows = np.unique(np.concatenate([self.postings[key_id] for key_id in matched_keys]))
+        return rows[self.active_rows[rows]]
+    
+    def _specialization_rows(self, specialization: str) -> np.ndarray:
+        """Row ids of doctors whose specialization is exactly the given one, ignoring case"""
+        key = specialization_key(specialization)
+        position = bisect.bisect_left(self.index_keys, key)
+        if position == len(self.index_keys) or self.index_keys[position] != key:
+            return np.array([], dtype=np.int64)
+        # The key may also be a condition name, so check the specialization itself
+        rows = self.postings[position]
+        specializations = self.doctors.values('specialization', rows)
+        return rows[np.fromiter(
+            (specialization_key(value) == key for value in specializations),
+            dtype=bool,
+            count=len(rows)
+        )]
+    
+    def filter_mask(self, filters: Dict[str, Any]) -> np.ndarray:
+        """
+        Boolean mask of the active rows matching a filter expression
+        
+        Args:
+            filters: Filter expression, see FilterIndex
+        
+        Returns:
+            Mask over the rows of the doctor store; empty if nothing is fitted
+        
+        Raises:
+            ValueError: If the expression is malformed
+        """
+        if self.filter_index is None:
+            # Unfitted, e.g. a shard that was assigned no doctors
+            return np.zeros(0, dtype=bool)
+        return self.filter_index.mask(filters) & self.active_rows
+    
+    def sort_values(self, field: str, rows: np.ndarray) -> np.ndarray:
+        """Values of a SORT_DEFAULTS field for the given rows, read from the doctor store"""
+        return self.doctors.sort_key(field, rows, default=self.SORT_DEFAULTS[field])
+    
+    def _sort_rows(self, rows: np.ndarray, sort_by: str) -> np.ndarray:
+        """Ordering of rows by experience (default), rating or fee; doctors without a fee come last"""
+        if sort_by == "fee":
+            # Lower fee preferred
+            return np.argsort(self.sort_values('fee', rows), kind='stable')
+        experience = self.sort_values('experience', rows)
+        rating = self.sort_values('rating', rows)
+        if sort_by == "rating":
+            return np.lexsort((-experience, -rating))
+        # Default to experience
+        return np.lexsort((-rating, -experience))
+    
+    def filter_doctors(self, filters: Dict[str, Any] = None, sort_by: str = None, limit: int = None) -> List[Dict[str, Any]]:
+        """
+        Doctors matching a filter expression, without a query
+        
+        Args:
+            filters: Filter expression, see FilterIndex; all doctors if None
+            sort_by: Sorting criteria - "experience", "rating" or "fee"; row order if None
+            limit: Maximum number of doctors to return; all by default
+        
+        Returns:
+            List of matching doctors
+        
+        Raises:
+            ValueError: If the expression is malformed
+        """
+        if self.doctors is None:
+            return []
+        rows = np.flatnonzero(self.filter_mask(filters) if filters else self.active_rows)
+        if sort_by:
+            rows = rows[self._sort_rows(rows, sort_by.lower())]
+        return self.doctors.records(rows[:limit])
+    
+    def correct_term(self, term: str) -> str:
+        """
+        Closest condition or specialization key to a misspelled query term
+        
+        A term is only corrected when no key contains it and one of its
+        words appears in no key, so partial and free-text queries are kept.
+        
+        Args:
+            term: Lowercased query term
+        
+        Returns:
+            The closest key, or the term itself if there is no close one
+        """
+        if (
+            not term
+            or term in self._key_blob
+            or term in self._correction_blob
+            or all(word in self.key_trigrams.words for word in tokenize(term))
+        ):
+            return term
+        match = self.key_trigrams.closest(term)
+        if match is None:
+            return term
+        logger.info("Corrected query term '%s' to '%s'", term, match[0])
+        return match[0]
+    
+    def _query_terms(self, query: Any) -> List[str]:
+        """Lowercased, spelling-corrected conditions of a (possibly multi-condition) query; weights are ignored"""
+        terms = [condition for condition, _ in parse_query_terms(query)] or [str(query).lower()]
+        return [self.correct_term(term) for term in terms]
+    
+    def _candidate_rows(self, terms: List[str], specialization: str = None, allowed_rows: np.ndarray = None) -> np.ndarray:
+        """Active rows matching any query condition, a specialization and a filter mask"""
+        # Look up doctors who treat one of the conditions via the inverted index
+        matching_rows = self._matching_rows(terms[0])
+        if len(terms) > 1:
+            matching_rows = np.unique(np.concatenate([matching_rows] + [self._matching_rows(term) for term in terms[1:]]))
+        if specialization:
+            matching_rows = np.intersect1d(matching_rows, self._specialization_rows(specialization))
+        if allowed_rows is not None:
+            matching_rows = matching_rows[allowed_rows[matching_rows]]
+        return matching_rows
+    
+    def _text_rows(self, query: Any, specialization: str = None, allowed_rows: np.ndarray = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Active rows matching any query word in the text index, with their BM25 scores"""
+        rows, scores = self.text_index.search(parse_query_terms(query) or [(str(query), 1.0)])
+        keep = self.active_rows[rows]
+        if specialization:
+            keep &= np.isin(rows, self._specialization_rows(specialization))
+        if allowed_rows is not None:
+            keep &= allowed_rows[rows]
+        return rows[keep], scores[keep]
+    
+    def _match_rows(self, query: Any, specialization: str = None, allowed_rows: np.ndarray = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Rows matching a query, trying the condition keys before the free text
+        
+        Returns:
+            Tuple of (rows, BM25 scores); scores is None when a condition or
+            specialization key contains the query
+        """
+        rows = self._candidate_rows(self._query_terms(query), specialization, allowed_rows)
+        if len(rows) or self.text_index is None:
+            return rows, None
+        return self._text_rows(query, specialization, allowed_rows)
+    
+    def facet_counts(self, query: str, specialization: str = None, filters: Dict[str, Any] = None) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Facet counts of every doctor matching a query, see FilterIndex.facet_counts
+        
+        Raises:
+            ValueError: If the filter expression or a query weight is malformed
+        """
+        if self.doctors is None:
+            return None
+        allowed_rows = self.filter_mask(filters) if filters else None
+        return self.filter_index.facet_counts(self._match_rows(query, specialization, allowed_rows)[0])
     
     def recommend_doctors(self, 
                          query: str, 
                          sort_by: str = "experience", 
-                         limit: int = 10) -> List[Dict[str, Any]]:
+                         limit: int = 10,
+                         specialization: str = None,
+                         filters: Dict[str, Any] = None) -> List[Dict[str, Any]]:
         """
         Recommends doctors based on filtering and sorting
         
+        Doctors with a condition or specialization containing the query are
+        returned first; when there are none, the query is matched word by
+        word against the text index (e.g. "chest pain heart").
+        
         Args:
-            query: The disease/condition to search for
-            sort_by: Sorting criteria - "experience", "rating", or "fee"
+            query: The disease/condition to search for; several conditions
+                match doctors treating any of them (see parse_query_terms)
+            sort_by: Sorting criteria - "experience", "rating", or "fee";
+                "similarity" orders free-text matches by relevance and
+                falls back to experience otherwise
             limit: Maximum number of doctors to return
-            
+            specialization: Optional specialization the doctors must have
+            filters: Optional filter expression the doctors must match, see FilterIndex
+        
         Returns:
             List of recommended doctors
+        
+        Raises:
+            ValueError: If the filter expression or a query weight is malformed
+        """
+        tier, recommendations, best_score = self.recommend_tier(query, sort_by, limit, specialization, filters)
+        if tier == self.TEXT_TIER:
+            # Free-text scores are reported relative to the best match
+            for doctor in recommendations:
+                doctor['similarity_score'] = doctor['similarity_score'] / best_score
+        return recommendations
+    
+    def recommend_tier(self,
+                       query: str,
+                       sort_by: str = "experience",
+                       limit: int = 10,
+                       specialization: str = None,
+                       filters: Dict[str, Any] = None) -> Tuple[int, List[Dict[str, Any]], float]:
+        """
+        recommend_doctors with the tier the doctors were matched in, for
+        merging the recommendations of several recommenders
+        
+        Returns:
+            Tuple of (tier, recommendations, best score). The tier is
+            KEY_TIER, TEXT_TIER or None if nothing matches. Free-text
+            recommendations carry their raw BM25 score as similarity_score,
+            and best score is the highest BM25 score of every match (None
+            for key matches).
+        
+        Raises:
+            ValueError: If the filter expression or a query weight is malformed
         """
-        if self.doctors_df is None or len(self.doctors_df) == 0:
+        if self.doctors is None or len(self.doctors) == 0:
             logger.warning("No doctor data available for recommendations")
-            return []
+            return None, [], None
         
         # Normalize the sort_by parameter
         sort_by = sort_by.lower() if sort_by else "experience"
         
-        # Convert query to lowercase for case-insensitive matching
-        query_lower = query.lower()
+        # Lowercase conditions for case-insensitive matching
+        terms = self._query_terms(query)
+        allowed_rows = self.filter_mask(filters) if filters else None
         
         try:
-            # Filter doctors who treat the given condition
-            # First ensure conditions_treated is in string format for filtering
-            self.doctors_df['conditions_str'] = self.doctors_df['conditions_treated'].apply(
-                lambda x: ','.join(x) if isinstance(x, list) else str(x)
-            )
-            
-            # Filter doctors
-            matching_docs = self.doctors_df[
-                self.doctors_df['conditions_str'].str.lower().str.contains(query_lower, na=False) |
-                self.doctors_df['specialization'].str.lower().str.contains(query_lower, na=False)
-            ]
+            matching_rows, text_scores = self._match_rows(query, specialization, allowed_rows)
             
-            if len(matching_docs) == 0:
+            if len(matching_rows) == 0:
                 logger.info(f"No doctors found for condition: {query}")
-                return []
+                return None, [], None
+            
+            if text_scores is not None:
+                recommendations = self._text_recommendations(matching_rows, text_scores, query, sort_by, limit)
+                return self.TEXT_TIER, recommendations, float(text_scores.max())
             
             # Sort doctors based on the chosen criteria
-            if sort_by == "experience":
-                sorted_docs = matching_docs.sort_values(
-                    by=["experience", "rating"], 
-                    ascending=[False, False]
-                )
-            elif sort_by == "rating":
-                sorted_docs = matching_docs.sort_values(
-                    by=["rating", "experience"], 
-                    ascending=[False, False]
-                )
-            elif sort_by == "fee":
-                sorted_docs = matching_docs.sort_values(
-                    by=["fee"], 
-                    ascending=[True]  # Lower fee preferred
-                )
-            else:
-                # Default to experience
-                sorted_docs = matching_docs.sort_values(
-                    by=["experience", "rating"], 
-                    ascending=[False, False]
-                )
+            order = self._sort_rows(matching_rows, sort_by)
             
-            # Convert to list of dictionaries
-            recommendations = sorted_docs.head(limit).to_dict('records')
+            # Materialize only the rows that are returned
+            recommendations = self.doctors.records(matching_rows[order[:max(limit, 0)]])
             
             # Add matched conditions and similarity score
             for doctor in recommendations:
@@ -111,52 +635,165 @@ class SimpleRecommender:
                 # Find matching conditions
                 matched_conditions = [
                     cond for cond in conditions
-                    if query_lower in cond.lower()
+                    if any(term in cond.lower() for term in terms)
                 ]
                 
                 doctor['matched_conditions'] = matched_conditions
                 doctor['similarity_score'] = 1.0 if matched_conditions else 0.5
-                
-                # Clean up temporary field
-                if 'conditions_str' in doctor:
-                    del doctor['conditions_str']
             
             logger.info(f"Found {len(recommendations)} recommendations with simple filtering")
-            return recommendations
-            
+            return self.KEY_TIER, recommendations, None
+        
         except Exception as e:
             logger.error(f"Error in simple recommendation: {str(e)}")
-            return []
+            return None, [], None
+    
+    def _text_recommendations(
+        self,
+        rows: np.ndarray,
+        scores: np.ndarray,
+        query: Any,
+        sort_by: str,
+        limit: int
+    ) -> List[Dict[str, Any]]:
+        """
+        Recommendations from free-text matches
+        
+        Args:
+            rows: Rows matched by the text index
+            scores: BM25 scores of the rows
+            query: The query the rows were matched for
+            sort_by: "similarity" or "relevance" ranks by score, other criteria as in _sort_rows
+            limit: Maximum number of doctors to return
+        
+        Returns:
+            List of doctors, similarity_score being the raw BM25 score
+        """
+        limit = max(limit, 0)
+        if sort_by in ("similarity", "relevance"):
+            # Only the top rows need ordering; ties keep row order
+            top = np.argpartition(-scores, limit - 1)[:limit] if 0 < limit < len(rows) else np.arange(len(rows))
+            order = top[np.lexsort((rows[top], -scores[top]))][:limit]
+        else:
+            order = self._sort_rows(rows, sort_by)[:limit]
+        
+        recommendations = self.doctors.records(rows[order])
+        query_tokens = {self.text_index.terms[term_id] for term_id in self.text_index.query_tokens(
+            parse_query_terms(query) or [(str(query), 1.0)]
+        )}
+        for doctor, score in zip(recommendations, scores[order].tolist()):
+            conditions = doctor.get('conditions_treated', [])
+            if isinstance(conditions, str):
+                conditions = [c.strip() for c in conditions.split(',')]
+            doctor['matched_conditions'] = [cond for cond in conditions if query_tokens.intersection(tokenize(cond))]
+            doctor['similarity_score'] = score
+        
+        logger.info(f"Found {len(recommendations)} recommendations with free-text search")
+        return recommendations
 
 class DoctorRecommender:
-    def __init__(self, n_neighbors: int = 20):
+    # Compact once this fraction of rows belongs to replaced/removed doctors
+    COMPACTION_DEAD_FRACTION = 0.2
+    # ... or after this many incremental updates, to refresh scaler statistics
+    COMPACTION_INTERVAL = 1000
+    # Sort orders answered exactly over every matching doctor rather than
+    # by re-sorting the nearest neighbors
+    EXACT_SORT_ORDERS = ('experience', 'rating', 'fee')
+    
+    def __init__(
+        self,
+        n_neighbors: int = 20,
+        cache_size: int = 1024,
+        precompute_neighbors: bool = False,
+        index: str = 'brute',
+        index_params: Dict[str, Any] = None,
+        n_jobs: int = 1
+    ):
         """
         Initialize the DoctorRecommender with KNN model
         
         Args:
             n_neighbors (int): Number of neighbors to consider for KNN
+            cache_size (int): Number of recommendation results kept in the
+                LRU result cache; 0 disables caching
+            precompute_neighbors (bool): Precompute the nearest doctors of
+                every known condition at fit time, so condition-only queries
+                become a table lookup instead of a neighbor search
+            index (str): Nearest-neighbor backend, 'brute' (exact), 'inverted'
+                or 'ivf' (approximate, sub-linear query time)
+            index_params (dict): Tuning parameters of the backend, e.g.
+                {'n_jobs': 4} for 'brute' or {'n_lists': 1024, 'n_probe': 16} for 'ivf'
+            n_jobs (int): Worker processes building the simple recommender's
+                indexes of large catalogs at fit and compaction time; None
+                uses one per CPU, 1 builds them in this process
         """
         self.n_neighbors = n_neighbors
-        self.simple_recommender = SimpleRecommender()
+        self.precompute_neighbors = precompute_neighbors
+        self.index_type = index
+        self.index_params = dict(index_params or {})
+        self.n_jobs = n_jobs
+        self.simple_recommender = SimpleRecommender(n_jobs=n_jobs)
+        self.result_cache = ResultCache(cache_size) if cache_size else None
         
         # Check if sklearn components are available
-        if NearestNeighbors is None or StandardScaler is None or MultiLabelBinarizer is None:
+        if sparse is None or StandardScaler is None or MultiLabelBinarizer is None:
             logger.warning("Scikit-learn components not available - using simple recommender only")
             self.use_sklearn = False
         else:
-            # Initialize sklearn components
-            self.knn_model = NearestNeighbors(
-                n_neighbors=n_neighbors,
-                metric='cosine',
-                algorithm='brute'
-            )
+            # Initialize sklearn components; the neighbor indexes search the
+            # feature matrix in place instead of copying it like
+            # NearestNeighbors does, so a memory-mapped matrix stays shared
+            self.knn_model = create_index(index, index_params)
             self.scaler = StandardScaler()
-            self.mlb = MultiLabelBinarizer()
+            self.mlb = MultiLabelBinarizer(sparse_output=True)
             self.use_sklearn = True
-            
-        self.feature_names = []
-        self.doctors_df = None
         
+        self.feature_names = []
+        self.numeric_features = []
+        self.feature_matrix = None
+        self.updates_since_compaction = 0
+        # Queries share the model state; incremental updates take it exclusively
+        self._lock = ReadWriteLock()
+        # Column lookups for building sparse query vectors
+        self.condition_columns = {}
+        self.specialization_columns = {}
+        # Columnar doctor records, shared with the simple recommender
+        self.doctors = None
+        # Version directory of the saved artifact this model was loaded from
+        self.artifact_version = None
+        # Precomputed neighbors per condition column: table row i holds the
+        # nearest rows of a one-hot query on neighbor_table_columns[i],
+        # padded with index -1
+        self.neighbor_table_rows = None
+        self.neighbor_table_columns = None
+        self.neighbor_table_distances = None
+        self.neighbor_table_indices = None
+        # Partition key (normalized specialization) -> SpecializationPartition,
+        # searched instead of the full catalog by specialization-scoped queries
+        self.partitions = None
+        # CSC copy of the condition/specialization columns, listing the rows
+        # that share a feature with a query; rebuilt on first use after a fit
+        # or compaction, rows appended since then are always candidates.
+        # Queries only hold the read lock, so the build has its own mutex
+        self._column_postings = None
+        self._column_postings_lock = threading.Lock()
+        # Spare capacity of the feature matrix arrays grown by upserts
+        self._buffers = AppendBuffers()
+    
+    @property
+    def active_rows(self) -> np.ndarray:
+        """
+        Rows of the doctor store still served; rows of replaced or removed
+        doctors stay in the feature matrix, flagged inactive, until the next
+        compaction. Shared with the simple recommender.
+        """
+        return self.simple_recommender.active_rows
+    
+    @property
+    def row_by_id(self) -> RowIdIndex:
+        """Row of every live doctor by id, shared with the simple recommender"""
+        return self.simple_recommender.row_by_id
+    
     def _preprocess_conditions(self, conditions: List[str]) -> List[str]:
         """Preprocess conditions to standardize format"""
         if not conditions:
@@ -165,67 +802,131 @@ class DoctorRecommender:
             conditions = [c.strip() for c in conditions.split(',')]
         return [c.lower().strip() for c in conditions]
     
-    def _create_feature_matrix(self, doctors_data: List[Dict[str, Any]]) -> np.ndarray:
+    @staticmethod
+    def _normalize_doctor(doctor: Dict[str, Any]) -> Dict[str, Any]:
+        """Make conditions_treated a list of strings, so it is stored as a flattened list column"""
+        conditions = doctor.get('conditions_treated')
+        if isinstance(conditions, str):
+            conditions = [c.strip() for c in conditions.split(',')]
+        elif isinstance(conditions, list):
+            conditions = [str(c) for c in conditions]
+        else:
+            conditions = []
+        return {**doctor, 'conditions_treated': conditions}
+    
+    def _create_feature_matrix(self, doctors: DoctorStore):
         """
-        Create a feature matrix from doctors data
+        Create a sparse feature matrix from the doctor store
+        
+        The matrix is laid out as [scaled numeric | conditions | specializations]
+        and kept in CSR form throughout, so memory grows with the number of
+        non-zeros rather than doctors x vocabulary. Every block is built from
+        the store's columns, without materializing the doctors as records.
+        Rows are L2-normalized and stored as float32, so cosine similarity is
+        a plain dot product and the values take half the memory of float64.
         
         Args:
-            doctors_data: List of doctor dictionaries
-            
+            doctors: Columnar store of the normalized doctors
+        
         Returns:
-            Feature matrix as numpy array
+            Feature matrix as a scipy CSR matrix with unit rows
         """
         if not self.use_sklearn:
             # If sklearn isn't available, return empty matrix
             return np.array([])
-            
-        # Convert to DataFrame for easier processing
-        df = pd.DataFrame(doctors_data)
-        self.doctors_df = df.copy()
         
-        # Preprocess conditions treated
-        df['conditions_treated'] = df['conditions_treated'].apply(self._preprocess_conditions)
-        
-        # Create binary features for conditions
-        conditions_matrix = self.mlb.fit_transform(df['conditions_treated'])
-        conditions_df = pd.DataFrame(
-            conditions_matrix,
-            columns=[f'treats_{c}' for c in self.mlb.classes_]
-        )
-        
-        # Create binary features for specialization
-        specialization_dummies = pd.get_dummies(
-            df['specialization'],
-            prefix='spec'
-        )
+        n_doctors = len(doctors)
         
         # Numeric features to scale
         numeric_features = ['experience', 'rating']
-        # Add fee if available
-        if 'fee' in df.columns:
-            numeric_features.append('fee')
-        # Add patients_treated if available
-        if 'patients_treated' in df.columns:
-            numeric_features.append('patients_treated')
-            
-        numeric_df = df[numeric_features].fillna(0)
+        # Add fee and patients_treated if available
+        numeric_features.extend(field for field in ('fee', 'patients_treated') if field in doctors.kinds)
         
-        # Scale numeric features
-        scaled_numeric = self.scaler.fit_transform(numeric_df)
-        scaled_numeric_df = pd.DataFrame(
-            scaled_numeric,
-            columns=numeric_features
+        # Scale numeric features; only a handful of columns, so the dense
+        # intermediate is negligible next to the condition block
+        scaled_numeric = sparse.csr_matrix(self.scaler.fit_transform(self._numeric_values(doctors, numeric_features)))
+        
+        # Create binary features for conditions from the flattened condition
+        # codes; only the distinct conditions of the store's dictionary are
+        # normalized, then every item is mapped through its code
+        if doctors.kinds.get('conditions_treated') == 'list':
+            row_offsets = np.asarray(doctors.list_row_offsets('conditions_treated'))
+            dictionary = [condition.lower().strip() for condition in doctors.dictionary('conditions_treated')]
+            dictionary_codes, condition_classes = pd.factorize(np.array(dictionary, dtype=object), sort=True)
+            condition_codes = dictionary_codes[doctors.list_codes('conditions_treated')]
+        else:
+            row_conditions = [self._preprocess_conditions(value) for value in doctors.values('conditions_treated')]
+            row_offsets = np.concatenate(([0], np.cumsum([len(value) for value in row_conditions]))).astype(np.int64)
+            conditions = [condition for value in row_conditions for condition in value]
+            condition_codes, condition_classes = pd.factorize(np.array(conditions, dtype=object), sort=True)
+        conditions_matrix = sparse.csr_matrix(
+            (np.ones(len(condition_codes)), (np.repeat(np.arange(n_doctors), np.diff(row_offsets)), condition_codes)),
+            shape=(n_doctors, len(condition_classes))
+        )
+        # A condition listed twice by a doctor is still a single binary feature
+        conditions_matrix.sum_duplicates()
+        conditions_matrix.data[:] = 1.0
+        classes = np.empty(len(condition_classes), dtype=object)
+        classes[:] = list(condition_classes)
+        self.mlb.classes_ = classes
+        
+        # Create binary features for specialization from category codes
+        if doctors.kinds.get('specialization') == 'category':
+            dictionary = np.array(doctors.dictionary('specialization'), dtype=object)
+            dictionary_codes, spec_values = pd.factorize(dictionary, sort=True)
+            # The trailing -1 keeps doctors without a specialization (code -1) uncoded
+            spec_codes = np.append(dictionary_codes, -1)[doctors.category_codes('specialization')]
+        else:
+            spec_codes, spec_values = pd.factorize(np.array(doctors.values('specialization'), dtype=object), sort=True)
+        has_spec = np.flatnonzero(spec_codes >= 0)
+        specialization_matrix = sparse.csr_matrix(
+            (np.ones(len(has_spec)), (has_spec, spec_codes[has_spec])),
+            shape=(n_doctors, len(spec_values))
         )
         
         # Combine all features
-        feature_matrix = pd.concat([
-            scaled_numeric_df,
-            conditions_df,
-            specialization_dummies
-        ], axis=1)
+        feature_matrix = sparse.hstack([
+            scaled_numeric,
+            conditions_matrix,
+            specialization_matrix
+        ], format='csr', dtype=np.float64)
+        
+        self.numeric_features = numeric_features
+        condition_offset = len(numeric_features)
+        spec_offset = condition_offset + len(self.mlb.classes_)
+        self.condition_columns = {
+            condition: condition_offset + i
+            for i, condition in enumerate(self.mlb.classes_)
+        }
+        self.specialization_columns = {
+            str(spec): spec_offset + i
+            for i, spec in enumerate(spec_values)
+        }
+        self.feature_names = (
+            numeric_features +
+            [f'treats_{c}' for c in self.mlb.classes_] +
+            [f'spec_{s}' for s in spec_values]
+        )
         
-        self.feature_names = feature_matrix.columns.tolist()
-        return feature_matrix.values
+        self.updates_since_compaction = 0
+        return normalize_rows(feature_matrix)
+    
+    @staticmethod
+    def _numeric_values(doctors: DoctorStore, numeric_features: List[str]) -> np.ndarray:
+        """Unscaled numeric features of every row of the doctor store, missing values as 0"""
+        return np.column_stack([doctors.numeric(field, default=0.0) for field in numeric_features])
+    
+    def _columns_from_feature_names(self) -> None:
+        """Rebuild the condition/specialization column lookups from feature_names"""
+        self.condition_columns = {}
+        self.specialization_columns = {}
+        for column, name in enumerate(self.feature_names):
+            if column < len(self.numeric_features):
+                continue
+            if name.startswith('treats_'):
+                self.condition_columns[name[len('treats_'):]] = column
+            elif name.startswith('spec_'):
+                self.specialization_columns[name[len('spec_'):]] = column
     
     def fit(self, doctors_data: List[Dict[str, Any]]) -> None:
         """
@@ -241,56 +942,697 @@ class DoctorRecommender:
                 - patients_treated (optional)
                 - fee (optional)
         """
+        self.fit_store(self.store_from_chunks([doctors_data]))
+    
+    @classmethod
+    def store_from_chunks(cls, chunks: Iterable[List[Dict[str, Any]]], n_jobs: int = 1) -> DoctorStore:
+        """
+        Normalize chunks of doctor dictionaries into a columnar store for fit_store
+        
+        Chunks are consumed as they are encoded, so a generator reading the
+        doctors from the database in pages keeps only a few pages of
+        dictionaries alive.
+        
+        Args:
+            chunks: Iterable of lists of doctor dictionaries
+            n_jobs: Worker processes normalizing and encoding the chunks;
+                None uses one per CPU, 1 (default) encodes them in this process
+        
+        Returns:
+            DoctorStore of the normalized doctors
+        """
+        return DoctorStore.concat(list(process_map(_encode_doctors, chunks, resolve_jobs(n_jobs))))
+    
+    def fit_store(self, doctors: DoctorStore) -> None:
+        """
+        Fit the KNN model over a doctor store built by store_from_chunks
+        
+        The recommender takes ownership of the store; fitting another
+        recommender on the same doctors needs a copy().
+        
+        Args:
+            doctors: Columnar store of normalized doctors
+        """
         try:
-            # Always fit the simple recommender as a fallback
-            self.simple_recommender.fit(doctors_data)
+            # Always fit the simple recommender as a fallback; both share its doctor store
+            self.simple_recommender.fit_store(doctors)
+            self.doctors = self.simple_recommender.doctors
             
             # Only attempt sklearn model fit if available
             if self.use_sklearn:
-                logger.info("Creating feature matrix for %d doctors", len(doctors_data))
-                feature_matrix = self._create_feature_matrix(doctors_data)
+                logger.info("Creating feature matrix for %d doctors", len(doctors))
+                feature_matrix = self._create_feature_matrix(doctors)
                 
-                if feature_matrix.size > 0:
+                if feature_matrix.shape[0] > 0:
                     logger.info("Fitting KNN model with feature matrix of shape %s", feature_matrix.shape)
                     self.knn_model.fit(feature_matrix)
+                    self.feature_matrix = feature_matrix
+                    self._column_postings = None
+                    self._buffers.clear()
+                    self._build_partitions()
+                    if self.precompute_neighbors:
+                        self._build_neighbor_table()
                     logger.info("KNN model fitted successfully")
                 else:
                     logger.warning("Empty feature matrix, KNN model not fitted")
-            
+        
         except Exception as e:
             logger.error("Error fitting KNN model: %s", str(e))
             logger.info("Will use simple recommender instead")
     
-    def _get_query_features(self, query: str, specialization: str = None) -> np.ndarray:
-        """Create feature vector for a query"""
+    def upsert_doctor(self, doctor: Dict[str, Any]) -> None:
+        """
+        Add a doctor, or replace the existing doctor with the same id, without refitting
+        
+        The doctor's feature row is appended (growing the condition and
+        specialization vocabulary as needed) and the scaler statistics are
+        updated incrementally. Replaced rows are flagged inactive and dropped
+        at the next compaction, which also rescales all numeric features.
+        
+        Args:
+            doctor: Preprocessed doctor dictionary with an 'id'
+        """
+        if doctor.get('id') is None:
+            raise ValueError("Doctor must have an 'id' to be added to the recommender")
+        
+        doctor = self._normalize_doctor(doctor)
+        with self._lock.write():
+            self._invalidate_results()
+            # The simple recommender appends the row and deactivates the replaced one
+            replaced_row = self.row_by_id.get(doctor['id'])
+            self.simple_recommender.upsert_doctor(doctor)
+            self.doctors = self.simple_recommender.doctors
+            
+            if self.use_sklearn and self.feature_matrix is not None:
+                affected_columns = self._row_condition_columns(replaced_row)
+                self._append_row(doctor)
+                affected_columns.update(self._row_condition_columns(len(self.doctors) - 1))
+                self._refresh_neighbor_table(affected_columns)
+                self.updates_since_compaction += 1
+                self._maybe_compact()
+    
+    def remove_doctor(self, doctor_id: Any) -> bool:
+        """
+        Remove a doctor from future recommendations without refitting
+        
+        Returns:
+            bool: True if the doctor was present
+        """
+        with self._lock.write():
+            self._invalidate_results()
+            removed_row = self.row_by_id.get(doctor_id)
+            removed = self.simple_recommender.remove_doctor(doctor_id)
+            
+            if self.use_sklearn and self.feature_matrix is not None:
+                affected_columns = self._row_condition_columns(removed_row)
+                self._refresh_neighbor_table(affected_columns)
+                self.updates_since_compaction += 1
+                self._maybe_compact()
+            return removed
+    
+    def _row_condition_columns(self, row: int = None) -> set:
+        """Feature columns of the conditions a row treats"""
+        if row is None:
+            return set()
+        conditions = self.doctors.values('conditions_treated', [row])[0] or []
+        return {
+            self.condition_columns[condition]
+            for condition in self._preprocess_conditions(conditions)
+            if condition in self.condition_columns
+        }
+    
+    def _build_partitions(self) -> None:
+        """Split the feature rows by specialization, each partition with its own index"""
+        self.partitions = build_partitions(
+            self.feature_matrix,
+            self.doctors.values('specialization'),
+            self.index_type,
+            self.index_params
+        )
+        logger.info("Built %d specialization partitions", len(self.partitions))
+    
+    def _build_neighbor_table(self) -> None:
+        """Precompute the nearest doctors of every known condition in one batched search"""
+        columns = np.array(sorted(self.condition_columns.values()), dtype=np.int64)
+        self.neighbor_table_columns = columns
+        self.neighbor_table_rows = {int(column): row for row, column in enumerate(columns)}
+        self.neighbor_table_distances = np.ones((len(columns), self.n_neighbors), dtype=np.float64)
+        self.neighbor_table_indices = np.full((len(columns), self.n_neighbors), -1, dtype=np.int64)
+        self._fill_neighbor_table(np.arange(len(columns)))
+        logger.info("Precomputed neighbors for %d conditions", len(columns))
+    
+    def _fill_neighbor_table(self, table_rows: np.ndarray) -> None:
+        """Recompute the given table rows with a batched neighbor search"""
+        if len(table_rows) == 0:
+            return
+        query_matrix = sparse.csr_matrix(
+            (np.ones(len(table_rows)), (np.arange(len(table_rows)), self.neighbor_table_columns[table_rows])),
+            shape=(len(table_rows), len(self.feature_names))
+        )
+        distances, indices = self._search_neighbors(query_matrix)
+        for table_row, row_distances, row_indices in zip(table_rows, distances, indices):
+            found = len(row_indices)
+            self.neighbor_table_distances[table_row, :found] = row_distances
+            self.neighbor_table_distances[table_row, found:] = 1.0
+            self.neighbor_table_indices[table_row, :found] = row_indices
+            self.neighbor_table_indices[table_row, found:] = -1
+    
+    def _refresh_neighbor_table(self, columns: set) -> None:
+        """
+        Update the precomputed neighbors of conditions touched by an incremental update
+        
+        A one-hot condition query only scores rows that treat the condition,
+        so adding or removing a row changes only the table rows of the
+        conditions that row treats.
+        """
+        if self.neighbor_table_rows is None or not columns:
+            return
+        
+        # Loaded tables may be read-only memory maps
+        if not self.neighbor_table_distances.flags.writeable:
+            self.neighbor_table_distances = np.array(self.neighbor_table_distances)
+        if not self.neighbor_table_indices.flags.writeable:
+            self.neighbor_table_indices = np.array(self.neighbor_table_indices)
+        
+        new_columns = sorted(column for column in columns if column not in self.neighbor_table_rows)
+        if new_columns:
+            for column in new_columns:
+                self.neighbor_table_rows[column] = len(self.neighbor_table_rows)
+            self.neighbor_table_columns = np.concatenate((self.neighbor_table_columns, new_columns)).astype(np.int64)
+            self.neighbor_table_distances = np.vstack((
+                self.neighbor_table_distances,
+                np.ones((len(new_columns), self.n_neighbors))
+            ))
+            self.neighbor_table_indices = np.vstack((
+                self.neighbor_table_indices,
+                np.full((len(new_columns), self.n_neighbors), -1, dtype=np.int64)
+            ))
+        
+        self._fill_neighbor_table(np.array([self.neighbor_table_rows[column] for column in sorted(columns)], dtype=np.int64))
+    
+    def evaluate_index_recall(self, sample_size: int = 200, seed: int = 0) -> Dict[str, float]:
+        """
+        Measure recall and latency of the configured neighbor index against brute force
+        
+        Uses one-hot queries for a random sample of known conditions, the
+        same shape as the queries served by recommend_doctors.
+        
+        Args:
+            sample_size: Number of conditions to query
+            seed: Seed for sampling the conditions
+        
+        Returns:
+            Dictionary from neighbors.evaluate_recall, or None if the KNN model isn't fitted
+        """
+        with self._lock.read():
+            if not self.use_sklearn or self.feature_matrix is None or not self.condition_columns:
+                return None
+            
+            columns = np.array(sorted(self.condition_columns.values()), dtype=np.int64)
+            rng = np.random.default_rng(seed)
+            columns = rng.choice(columns, min(sample_size, len(columns)), replace=False)
+            queries = sparse.csr_matrix(
+                (np.ones(len(columns)), (np.arange(len(columns)), columns)),
+                shape=(len(columns), len(self.feature_names))
+            )
+            return evaluate_recall(self.knn_model, queries, self.n_neighbors)
+    
+    def _invalidate_results(self) -> None:
+        """Drop cached results once the catalog changes"""
+        if self.result_cache is not None:
+            self.result_cache.clear()
+    
+    def cache_stats(self) -> Dict[str, Any]:
+        """Hit/miss counters of the result cache, or None if caching is disabled"""
+        return self.result_cache.stats() if self.result_cache is not None else None
+    
+    def filter_doctors(self, filters: Dict[str, Any] = None, sort_by: str = None, limit: int = None) -> List[Dict[str, Any]]:
+        """
+        Doctors matching a filter expression, without a query
+        
+        Args:
+            filters: Filter expression, see FilterIndex; all doctors if None
+            sort_by: Sorting criteria - "experience", "rating" or "fee"; catalog order if None
+            limit: Maximum number of doctors to return; all by default
+        
+        Returns:
+            List of matching doctors
+        
+        Raises:
+            ValueError: If the filter expression is malformed
+        """
+        with self._lock.read():
+            return self.simple_recommender.filter_doctors(filters, sort_by=sort_by, limit=limit)
+    
+    def _add_feature_column(self, name: str) -> int:
+        """Append a new (empty) feature column and return its index"""
+        column = len(self.feature_names)
+        self.feature_names.append(name)
+        return column
+    
+    def _append_row(self, doctor: Dict[str, Any]) -> None:
+        """Append the feature row of a single doctor"""
+        # Grow the vocabulary with unseen conditions and specializations
+        columns = set()
+        for condition in self._preprocess_conditions(doctor.get('conditions_treated')):
+            if condition not in self.condition_columns:
+                self.condition_columns[condition] = self._add_feature_column(f'treats_{condition}')
+            columns.add(self.condition_columns[condition])
+        
+        specialization = doctor.get('specialization')
+        if isinstance(specialization, str):
+            if specialization not in self.specialization_columns:
+                self.specialization_columns[specialization] = self._add_feature_column(f'spec_{specialization}')
+            columns.add(self.specialization_columns[specialization])
+        
+        # Update the scaler statistics, then scale with them
+        numeric_row = np.array([[
+            pd.to_numeric(doctor.get(field), errors='coerce') for field in self.numeric_features
+        ]], dtype=np.float64)
+        numeric_row = np.nan_to_num(numeric_row, nan=0.0)
+        self.scaler.partial_fit(numeric_row)
+        scaled_row = self.scaler.transform(numeric_row)[0]
+        
+        columns = list(range(len(self.numeric_features))) + sorted(columns)
+        values = np.concatenate((scaled_row, np.ones(len(columns) - len(scaled_row))))
+        width = len(self.feature_names)
+        feature_row = normalize_rows(sparse.csr_matrix(
+            (values, ([0] * len(columns), columns)),
+            shape=(1, width)
+        ))
+        
+        # Append to the matrix arrays (widening it) in place of stacking a new matrix
+        self.feature_matrix = self._buffers.append_csr_rows('features', self.feature_matrix, feature_row)
+        if self.partitions is not None:
+            # Widen the partitions here, under the write lock, so that
+            # queries of the new width never change them
+            for partition in self.partitions.values():
+                partition.widen(width)
+        
+        # The simple recommender already added the doctor to the shared store
+        new_row = len(self.doctors) - 1
+        self.knn_model.partial_fit(self.feature_matrix, new_row)
+        
+        key = specialization_key(specialization)
+        if self.partitions is not None and key is not None:
+            if key in self.partitions:
+                self.partitions[key].append(new_row, feature_row)
+            else:
+                self.partitions[key] = SpecializationPartition.build(
+                    self.feature_matrix, [new_row], self.index_type, self.index_params
+                )
+    
+    def _maybe_compact(self) -> None:
+        """Compact when enough rows are dead or enough updates have accumulated"""
+        dead_rows = self.simple_recommender.n_inactive_rows
+        if (
+            dead_rows > self.COMPACTION_DEAD_FRACTION * len(self.active_rows)
+            or self.updates_since_compaction >= self.COMPACTION_INTERVAL
+        ):
+            self.compact()
+    
+    def compact(self) -> None:
+        """
+        Drop inactive rows and refresh the scaling of numeric features
+        
+        The scaler is refitted on the live doctors so that rows added
+        incrementally and the original catalog share the same statistics.
+        """
+        with self._lock.write():
+            self._invalidate_results()
+            # The simple recommender compacts the shared store and marks every row active
+            live_rows = np.flatnonzero(self.active_rows)
+            self.simple_recommender.compact()
+            self.doctors = self.simple_recommender.doctors
+            
+            if not self.use_sklearn or self.feature_matrix is None:
+                return
+            
+            if len(live_rows) == 0:
+                logger.warning("No doctors left after compaction, KNN model not refitted")
+                return
+            
+            self.scaler = StandardScaler()
+            scaled_numeric = sparse.csr_matrix(
+                self.scaler.fit_transform(self._numeric_values(self.doctors, self.numeric_features))
+            )
+            
+            # Condition and specialization features are binary, which undoes
+            # the row normalization of the stored matrix
+            binary_features = self.feature_matrix[live_rows][:, len(self.numeric_features):]
+            binary_features.data = np.ones_like(binary_features.data)
+            self.feature_matrix = normalize_rows(sparse.hstack([
+                scaled_numeric,
+                binary_features
+            ], format='csr', dtype=np.float64))
+            self._column_postings = None
+            self._buffers.clear()
+            
+            self.updates_since_compaction = 0
+            self.knn_model.fit(self.feature_matrix)
+            self._build_partitions()
+            if self.precompute_neighbors:
+                self._build_neighbor_table()
+            logger.info("Compacted recommender to %d doctors", len(live_rows))
+    
+    def get_state(self) -> Tuple[Dict[str, np.ndarray], Dict[str, Any]]:
+        """
+        Export the fitted model as plain numpy arrays and JSON-serializable metadata
+        
+        Returns:
+            Tuple of (arrays, metadata) suitable for utils.save_model
+        """
+        with self._lock.read():
+            return self._get_state()
+    
+    def _get_state(self) -> Tuple[Dict[str, np.ndarray], Dict[str, Any]]:
+        """get_state without locking"""
+        doctors = self.simple_recommender.doctors
+        doctor_arrays, doctor_metadata = doctors.get_state() if doctors is not None else ({}, None)
+        simple_arrays, simple_metadata = self.simple_recommender.get_state()
+        arrays = {f'doctors_{name}': array for name, array in doctor_arrays.items()}
+        arrays.update({f'simple_{name}': array for name, array in simple_arrays.items()})
+        metadata = {
+            'n_neighbors': self.n_neighbors,
+            'precompute_neighbors': self.precompute_neighbors,
+            'index': {'type': self.index_type, 'params': self.index_params},
+            'n_jobs': self.n_jobs,
+            'doctors': doctor_metadata,
+            'fitted': self.feature_matrix is not None,
+            'simple': simple_metadata,
+        }
+        
+        if self.use_sklearn and self.feature_matrix is not None:
+            arrays.update({
+                'feature_data': self.feature_matrix.data,
+                'feature_indices': self.feature_matrix.indices,
+                'feature_indptr': self.feature_matrix.indptr,
+                'scaler_mean': self.scaler.mean_,
+                'scaler_scale': self.scaler.scale_,
+                'scaler_var': self.scaler.var_,
+            })
+            metadata.update({
+                'feature_shape': list(self.feature_matrix.shape),
+                'feature_names': self.feature_names,
+                'numeric_features': self.numeric_features,
+                'condition_classes': [str(c) for c in self.mlb.classes_],
+                'scaler_samples_seen': int(np.max(self.scaler.n_samples_seen_)),
+                'updates_since_compaction': self.updates_since_compaction,
+            })
+            arrays.update({f'index_{name}': array for name, array in self.knn_model.get_state().items()})
+            if self.partitions is not None:
+                metadata['partitions'] = []
+                for position, (key, partition) in enumerate(self.partitions.items()):
+                    metadata['partitions'].append([key, list(partition.matrix.shape)])
+                    arrays.update({
+                        f'partition{position}_{name}': array
+                        for name, array in partition.get_state().items()
+                    })
+            if self.neighbor_table_rows is not None:
+                arrays.update({
+                    'table_columns': self.neighbor_table_columns,
+                    'table_distances': self.neighbor_table_distances,
+                    'table_indices': self.neighbor_table_indices,
+                })
+        return arrays, metadata
+    
+    @classmethod
+    def from_state(cls, arrays: Dict[str, np.ndarray], metadata: Dict[str, Any]) -> 'DoctorRecommender':
+        """
+        Rebuild a fitted model from the output of get_state without refitting
+        
+        Args:
+            arrays: Arrays produced by get_state (may be memory-mapped)
+            metadata: Metadata produced by get_state
+        
+        Returns:
+            DoctorRecommender ready to serve recommendations
+        """
+        model = cls(
+            n_neighbors=metadata['n_neighbors'],
+            precompute_neighbors=metadata.get('precompute_neighbors', False),
+            index=metadata.get('index', {}).get('type', 'brute'),
+            index_params=metadata.get('index', {}).get('params'),
+            n_jobs=metadata.get('n_jobs', 1)
+        )
+        if metadata.get('doctors') is None:
+            return model
+        
+        # Both recommenders read the same (possibly memory-mapped) doctor store
+        doctors = DoctorStore.from_state(
+            {name[len('doctors_'):]: array for name, array in arrays.items() if name.startswith('doctors_')},
+            metadata['doctors']
+        )
+        model.simple_recommender.restore(
+            doctors,
+            {name[len('simple_'):]: array for name, array in arrays.items() if name.startswith('simple_')},
+            metadata['simple']
+        )
+        model.doctors = doctors
+        
+        if not model.use_sklearn or not metadata.get('fitted') or 'feature_data' not in arrays:
+            return model
+        
+        # Restore the fitted preprocessing state
+        model.numeric_features = list(metadata['numeric_features'])
+        model.scaler.mean_ = np.asarray(arrays['scaler_mean'])
+        model.scaler.scale_ = np.asarray(arrays['scaler_scale'])
+        model.scaler.var_ = np.asarray(arrays['scaler_var'])
+        model.scaler.n_samples_seen_ = np.int64(metadata['scaler_samples_seen'])
+        model.scaler.n_features_in_ = len(model.numeric_features)
+        classes = np.empty(len(metadata['condition_classes']), dtype=object)
+        classes[:] = metadata['condition_classes']
+        model.mlb.classes_ = classes
+        model.feature_names = list(metadata['feature_names'])
+        model._columns_from_feature_names()
+        
+        # Restore incremental update bookkeeping; the simple recommender
+        # restored the active rows
+        model.updates_since_compaction = metadata.get('updates_since_compaction', 0)
+        
+        # The index only references the matrix and its stored arrays, so a
+        # memory-mapped artifact is shared rather than copied
+        model.feature_matrix = sparse.csr_matrix(
+            (arrays['feature_data'], arrays['feature_indices'], arrays['feature_indptr']),
+            shape=tuple(metadata['feature_shape']),
+            copy=False
+        )
+        model.knn_model.restore(
+            model.feature_matrix,
+            {name[len('index_'):]: array for name, array in arrays.items() if name.startswith('index_')}
+        )
+        
+        if 'partitions' in metadata:
+            model.partitions = {}
+            for position, (key, shape) in enumerate(metadata['partitions']):
+                prefix = f'partition{position}_'
+                model.partitions[key] = SpecializationPartition.from_state(
+                    {name[len(prefix):]: array for name, array in arrays.items() if name.startswith(prefix)},
+                    shape,
+                    model.index_type,
+                    model.index_params
+                )
+                model.partitions[key].widen(len(model.feature_names))
+        
+        if 'table_columns' in arrays:
+            model.neighbor_table_columns = arrays['table_columns']
+            model.neighbor_table_rows = {int(column): row for row, column in enumerate(model.neighbor_table_columns)}
+            model.neighbor_table_distances = arrays['table_distances']
+            model.neighbor_table_indices = arrays['table_indices']
+        return model
+    
+    def _normalize_query(self, query: Any) -> str:
+        """
+        Canonical lowercase form of a query, so equivalent searches share results
+        
+        Misspelled conditions are replaced by the closest known condition or
+        specialization, see SimpleRecommender.correct_term.
+        
+        Raises:
+            ValueError: If a query weight is malformed
+        """
+        if isinstance(query, str):
+            query = query.lower().strip()
+            # A known condition may itself contain a separator
+            if query in self.condition_columns:
+                return query
+            if not any(separator in query for separator in ',:'):
+                return self.simple_recommender.correct_term(query)
+        corrected = {}
+        for condition, weight in parse_query_terms(query):
+            condition = self.simple_recommender.correct_term(condition)
+            corrected[condition] = corrected.get(condition, 0.0) + weight
+        return format_query_terms(list(corrected.items()))
+    
+    def _query_terms(self, query: str) -> List[Tuple[str, float]]:
+        """(condition, weight) terms of a normalized query"""
+        if query in self.condition_columns:
+            return [(query, 1.0)]
+        return parse_query_terms(query)
+    
+    def _get_query_matrix(self, queries: List[str], specialization: str = None):
+        """
+        Create a sparse feature matrix with one row per query
+        
+        Every condition of a multi-condition query sets its column to the
+        condition's weight, so the whole batch is mapped to the vocabulary
+        in one pass and scored with a single similarity product.
+        """
         if not self.use_sklearn:
             # Return empty array if sklearn isn't available
             return np.array([])
-            
-        # Initialize zero vector
-        query_vector = np.zeros(len(self.feature_names))
         
-        # Process query conditions
-        query_conditions = [query.lower().strip()]
-        query_conditions_matrix = self.mlb.transform([query_conditions])
+        rows, columns, weights = [], [], []
         
-        # Get condition feature indices
-        condition_features = [
-            i for i, name in enumerate(self.feature_names)
-            if name.startswith('treats_')
-        ]
+        spec_columns = []
+        if specialization:
+            # Specializations are matched ignoring case and surrounding
+            # whitespace; every spelling in the catalog has its own column
+            key = specialization_key(specialization)
+            spec_columns = [
+                column for name, column in self.specialization_columns.items()
+                if specialization_key(name) == key
+            ]
         
-        # Set condition features
-        query_vector[condition_features] = query_conditions_matrix[0]
+        for row, query in enumerate(queries):
+            # Set condition features for the query conditions
+            for condition, weight in self._query_terms(query.lower().strip()):
+                condition_column = self.condition_columns.get(condition)
+                if condition_column is not None:
+                    rows.append(row)
+                    columns.append(condition_column)
+                    weights.append(weight)
+            # Set specialization feature if provided
+            for spec_column in spec_columns:
+                rows.append(row)
+                columns.append(spec_column)
+                weights.append(1.0)
         
-        # Set specialization feature if provided
-        if specialization:
-            spec_feature = f'spec_{specialization}'
-            if spec_feature in self.feature_names:
-                spec_idx = self.feature_names.index(spec_feature)
-                query_vector[spec_idx] = 1
+        return sparse.csr_matrix(
+            (np.array(weights, dtype=np.float64), (rows, columns)),
+            shape=(len(queries), len(self.feature_names))
+        )
+    
+    def _get_query_features(self, query: str, specialization: str = None):
+        """Create a sparse feature vector for a query"""
+        return self._get_query_matrix([query], specialization)
+    
+    def _build_recommendations(
+        self,
+        query: str,
+        distances: np.ndarray,
+        indices: np.ndarray,
+        sort_by: str = None,
+        min_score: float = 0.1,
+        limit: int = 10
+    ) -> List[Dict[str, Any]]:
+        """
+        Turn one row of neighbor search output into sorted recommendations
+        
+        Args:
+            query: The query condition the neighbors were searched for
+            distances: Cosine distances of the neighbors
+            indices: Row indices of the neighbors in the doctor store
+            sort_by: Sorting criteria - "experience", "rating", "fee", or "similarity" (default)
+            min_score: Minimum similarity score threshold
+            limit: Maximum number of recommendations to return
+        
+        Returns:
+            List of recommended doctors with similarity scores
+        """
+        # Convert distances to similarity scores (1 - distance)
+        similarities = 1 - np.asarray(distances).ravel()
+        
+        # Filter by minimum score
+        valid_indices = similarities >= min_score
+        rows = np.asarray(indices).ravel()[valid_indices]
+        scores = similarities[valid_indices]
+        
+        # Order only the rows that can make the returned top
+        order = self._sort_order(rows, scores, sort_by, limit=max(limit, 0))
+        rows = rows[order]
+        scores = scores[order]
+        
+        # Take all rows in one operation and attach the computed columns
+        recommendations = self.doctors.records(rows)
+        matched_conditions = self._matched_conditions(rows, query)
+        for doctor, score, matched in zip(recommendations, scores.tolist(), matched_conditions):
+            doctor['similarity_score'] = score
+            doctor['matched_conditions'] = matched
+        
+        return recommendations
+    
+    def _sort_order(self, rows: np.ndarray, scores: np.ndarray, sort_by: str = None, limit: int = None) -> np.ndarray:
+        """
+        Ordering of candidate rows by the requested criteria
+        
+        Ties fall back to the similarity score, then the row. With a limit,
+        partial selection on the primary key picks the rows that can make
+        the top limit, and only those are sorted.
+        
+        Args:
+            rows: Candidate rows of the doctor store
+            scores: Similarity score of each candidate
+            sort_by: Sorting criteria - "experience", "rating", "fee", or "similarity" (default)
+            limit: Number of positions to return; all by default
+        
+        Returns:
+            Positions into rows, best first
+        """
+        sort_by = sort_by.lower() if sort_by else "similarity"
+        
+        # Keys in priority order; smaller sorts first
+        sort_values = self.simple_recommender.sort_values
+        if sort_by == "experience":
+            keys = [-sort_values('experience', rows), -sort_values('rating', rows)]
+        elif sort_by == "rating":
+            keys = [-sort_values('rating', rows), -sort_values('experience', rows)]
+        elif sort_by == "fee":
+            keys = [sort_values('fee', rows)]
+        else:
+            # Default to similarity score
+            keys = []
+        keys += [-scores, rows]
+        
+        positions = np.arange(len(rows))
+        if limit is not None and limit < len(rows):
+            if limit == 0:
+                return positions[:0]
+            threshold = np.partition(keys[0], limit - 1)[limit - 1]
+            positions = np.flatnonzero(keys[0] <= threshold)
+        order = np.lexsort([key[positions] for key in reversed(keys)])
+        return positions[order][:limit]
+    
+    def _matched_conditions(self, rows: np.ndarray, query: str) -> List[List[str]]:
+        """Conditions of each given doctor that contain a query condition, in doctor order"""
+        if len(rows) == 0:
+            return []
+        
+        # Gather the flattened condition entries of the selected doctors
+        entries, lengths = gather_ranges(self.doctors.list_row_offsets('conditions_treated'), rows)
+        if len(entries) == 0:
+            return [[] for _ in range(len(rows))]
+        
+        # Test each distinct condition of the store's dictionary once rather than every entry
+        codes = self.doctors.list_codes('conditions_treated')[entries]
+        unique_codes, inverse = np.unique(codes, return_inverse=True)
+        terms = [condition for condition, _ in self._query_terms(query.lower())]
+        code_matches = np.fromiter(
+            (
+                any(term in condition.lower() for term in terms)
+                for condition in self.doctors.dictionary('conditions_treated', unique_codes)
+            ),
+            dtype=bool,
+            count=len(unique_codes)
+        )
+        entry_matches = code_matches[inverse]
         
-        return query_vector.reshape(1, -1)
+        # Split the matching entries back into one list per doctor
+        owners = np.repeat(np.arange(len(rows)), lengths)[entry_matches]
+        counts = np.bincount(owners, minlength=len(rows))
+        matched_values = self.doctors.list_items('conditions_treated', entries[entry_matches])
+        bounds = np.concatenate(([0], np.cumsum(counts))).tolist()
+        return [matched_values[start:stop] for start, stop in zip(bounds[:-1], bounds[1:])]
     
     def recommend_doctors(
         self,
@@ -298,99 +1640,564 @@ class DoctorRecommender:
         specialization: str = None,
         sort_by: str = None,
         min_score: float = 0.1,
-        limit: int = 10
+        limit: int = 10,
+        filters: Dict[str, Any] = None
     ) -> List[Dict[str, Any]]:
         """
         Recommend doctors based on query condition and optional specialization
         
         Args:
-            query: Condition or disease to search for
-            specialization: Optional specialization to filter by
+            query: Condition or disease to search for, or several weighted
+                ones, e.g. "asthma, hypertension:2" (see parse_query_terms)
+            specialization: Optional specialization; only doctors with this
+                specialization (ignoring case) are recommended
             sort_by: Sorting criteria - "experience", "rating", "fee", or "similarity" (default)
             min_score: Minimum similarity score threshold
             limit: Maximum number of recommendations to return
-            
+            filters: Optional filter expression the doctors must match, see FilterIndex
+        
         Returns:
             List of recommended doctors with similarity scores
+        
+        Raises:
+            ValueError: If the filter expression or a query weight is malformed
         """
-        # If sklearn isn't available, use simple recommender directly
-        if not self.use_sklearn:
-            logger.info("Using simple recommender as sklearn components aren't available")
-            return self.simple_recommender.recommend_doctors(
-                query=query, 
-                sort_by=sort_by or "experience", 
-                limit=limit
-            )
-            
-        try:
-            # Get query features
-            query_vector = self._get_query_features(query, specialization)
-            
-            # Find nearest neighbors
-            distances, indices = self.knn_model.kneighbors(query_vector)
+        return self.recommend_many(
+            [query],
+            specialization=specialization,
+            sort_by=sort_by,
+            min_score=min_score,
+            limit=limit,
+            filters=filters
+        )[0]
+    
+    def recommend_many(
+        self,
+        queries: List[str],
+        specialization: str = None,
+        sort_by: str = None,
+        min_score: float = 0.1,
+        limit: int = 10,
+        filters: Dict[str, Any] = None,
+        fallback: bool = True
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Recommend doctors for a batch of query conditions
+        
+        Results are served from the LRU result cache when possible; the
+        remaining queries are stacked into one query matrix and answered with
+        a single neighbor search, so per-call overhead is paid once per batch.
+        Queries are matched case-insensitively, ignoring surrounding whitespace.
+        Results sorted by experience, rating or fee are the exact top over
+        every doctor scoring at least min_score; results sorted by similarity
+        come from the nearest max(n_neighbors, limit) doctors. With filters,
+        the filter bitsets are evaluated first and every sort order is
+        exact over the matching doctors.
+        
+        Args:
+            queries: Conditions or diseases to search for; each may combine
+                several weighted conditions (see parse_query_terms)
+            specialization: Optional specialization; only doctors with this
+                specialization (ignoring case) are recommended
+            sort_by: Sorting criteria - "experience", "rating", "fee", or "similarity" (default)
+            min_score: Minimum similarity score threshold
+            limit: Maximum number of recommendations to return per query
+            filters: Optional filter expression the doctors must match, see FilterIndex
+            fallback: Answer queries the KNN model finds no doctor for with
+                the simple recommender; False leaves them empty (see
+                recommend_fallback)
+        
+        Returns:
+            One list of recommended doctors per query, in query order
+        
+        Raises:
+            ValueError: If the filter expression or a query weight is malformed
+        """
+        return self._recommend_cached(queries, specialization, sort_by, min_score, limit, filters, False, fallback)[0]
+    
+    def recommend_with_facets(
+        self,
+        queries: List[str],
+        specialization: str = None,
+        sort_by: str = None,
+        min_score: float = 0.1,
+        limit: int = 10,
+        filters: Dict[str, Any] = None,
+        fallback: bool = True
+    ) -> Tuple[List[List[Dict[str, Any]]], List[Dict[str, Any]]]:
+        """
+        Recommend doctors for a batch of query conditions, with facet counts
+        
+        Works like recommend_many, except that every query is answered from
+        its full candidate set (every doctor scoring at least min_score and
+        matching the specialization and filters), so similarity-sorted
+        results are exact too. The same candidate rows are counted per
+        specialization and per fee and rating bucket from the in-memory
+        filter index; see FilterIndex.facet_counts.
+        
+        Returns:
+            Tuple of (one list of recommended doctors per query, one facet
+            dictionary per query), in query order
+        
+        Raises:
+            ValueError: If the filter expression or a query weight is malformed
+        """
+        return self._recommend_cached(queries, specialization, sort_by, min_score, limit, filters, True, fallback)
+    
+    def recommend_fallback(
+        self,
+        queries: List[str],
+        specialization: str = None,
+        sort_by: str = None,
+        limit: int = 10,
+        filters: Dict[str, Any] = None,
+        facets: bool = False
+    ) -> List[Tuple[int, List[Dict[str, Any]], float, Dict[str, Any]]]:
+        """
+        Answer a batch of queries with the simple recommender alone
+        
+        This is the tier recommend_many falls back to for queries the KNN
+        model finds no doctor for. A ShardedRecommender runs it on every
+        shard once no shard found a KNN match, and merges the shards that
+        matched in the best tier.
+        
+        Returns:
+            One (tier, recommendations, best score, facet counts or None)
+            tuple per query, see SimpleRecommender.recommend_tier
+        
+        Raises:
+            ValueError: If the filter expression or a query weight is malformed
+        """
+        replies = []
+        with self._lock.read():
+            for query in queries:
+                query = self._normalize_query(query)
+                tier, recommendations, best_score = self.simple_recommender.recommend_tier(
+                    query, sort_by or "similarity", limit, specialization, filters
+                )
+                query_facets = self.simple_recommender.facet_counts(query, specialization, filters) if facets else None
+                replies.append((tier, recommendations, best_score, query_facets))
+        return replies
+    
+    def vocabulary(self) -> List[str]:
+        """Condition and specialization keys of the simple recommender's index"""
+        with self._lock.read():
+            return list(self.simple_recommender.index_keys)
+    
+    def add_correction_keys(self, keys: Iterable[str]) -> None:
+        """Make keys of other recommenders known to spelling correction, see SimpleRecommender.add_correction_keys"""
+        with self._lock.write():
+            if self.simple_recommender.add_correction_keys(keys):
+                # Queries may now be corrected differently
+                self._invalidate_results()
+    
+    def _recommend_cached(
+        self,
+        queries: List[str],
+        specialization: str,
+        sort_by: str,
+        min_score: float,
+        limit: int,
+        filters: Dict[str, Any],
+        facets: bool,
+        fallback: bool = True
+    ) -> Tuple[List[List[Dict[str, Any]]], List[Dict[str, Any]]]:
+        """Serve a batch from the result cache where possible and compute the rest"""
+        if not queries:
+            return [], [] if facets else None
+        
+        specialization = specialization_key(specialization)
+        sort_by = sort_by.lower() if sort_by else None
+        filters_key = json.dumps(filters, sort_keys=True) if filters else None
+        
+        with self._lock.read():
+            # Normalize so equivalent searches ("Diabetes ", "diabeties") share
+            # results; the vocabulary only changes under the lock
+            queries = [self._normalize_query(query) for query in queries]
             
-            # Convert distances to similarity scores (1 - distance)
-            similarities = 1 - distances.flatten()
+            if self.result_cache is None:
+                results, facet_counts = self._recommend_many(
+                    queries, specialization, sort_by, min_score, limit, filters, facets, fallback
+                )
+                return results, facet_counts
             
-            # Filter by minimum score
-            valid_indices = similarities >= min_score
-            recommended_indices = indices.flatten()[valid_indices]
-            scores = similarities[valid_indices]
+            # Entries are (recommendations, facet counts or None) pairs
+            keys = [(query, specialization, sort_by, min_score, limit, filters_key, facets, fallback) for query in queries]
+            entries = [self.result_cache.get(key) for key in keys]
+            missing = [i for i, entry in enumerate(entries) if entry is None]
+            if missing:
+                # Compute each distinct uncached query once
+                missing_queries = list(dict.fromkeys(queries[i] for i in missing))
+                results, facet_counts = self._recommend_many(
+                    missing_queries, specialization, sort_by, min_score, limit, filters, facets, fallback
+                )
+                computed = dict(zip(missing_queries, zip(results, facet_counts or [None] * len(results))))
+                for query, entry in computed.items():
+                    self.result_cache.put((query, specialization, sort_by, min_score, limit, filters_key, facets, fallback), entry)
+                for i in missing:
+                    entries[i] = computed[queries[i]]
+        
+        # Hand out deep copies so callers can never modify cached results,
+        # including the condition lists nested in every doctor
+        results = [copy.deepcopy(result) for result, _ in entries]
+        return results, [copy.deepcopy(entry_facets) for _, entry_facets in entries] if facets else None
+    
+    def _search_neighbors(
+        self,
+        query_matrix,
+        partition: SpecializationPartition = None,
+        n_neighbors: int = None
+    ) -> Tuple[List[np.ndarray], List[np.ndarray]]:
+        """
+        Nearest active neighbors of each query row
+        
+        Inactive rows (replaced or removed doctors) are over-fetched and then
+        dropped, so each query still gets up to n_neighbors live doctors.
+        
+        Args:
+            query_matrix: CSR matrix with one query per row
+            partition: Search only this specialization partition instead of
+                the full catalog
+            n_neighbors: Number of neighbors per query; self.n_neighbors by default
+        """
+        n_neighbors = n_neighbors or self.n_neighbors
+        if partition is None:
+            index, active_rows = self.knn_model, self.active_rows
+            dead_rows = self.simple_recommender.n_inactive_rows
+        else:
+            index, active_rows = partition, self.active_rows[partition.rows]
+            dead_rows = len(active_rows) - int(active_rows.sum())
+        distances, indices = index.kneighbors(query_matrix, n_neighbors=min(len(active_rows), n_neighbors + dead_rows))
+        
+        # Approximate indexes pad missing neighbors with index -1
+        live = indices >= 0
+        if dead_rows:
+            live &= active_rows[indices]
+        if partition is not None:
+            # Map partition rows back to rows of the doctor store
+            indices = np.where(live, partition.rows[np.maximum(indices, 0)], -1)
+        if dead_rows == 0 and live.all():
+            return list(distances), list(indices)
+        
+        return (
+            [row_distances[row_live][:n_neighbors] for row_distances, row_live in zip(distances, live)],
+            [row_indices[row_live][:n_neighbors] for row_indices, row_live in zip(indices, live)],
+        )
+    
+    def _find_neighbors(
+        self,
+        queries: List[str],
+        specialization: str = None,
+        n_neighbors: int = None
+    ) -> Tuple[List[np.ndarray], List[np.ndarray]]:
+        """
+        Nearest active neighbors of each query
+        
+        Condition-only queries for known conditions are answered from the
+        precomputed neighbor table; everything else goes through the
+        neighbor search in one batch. Specialization-scoped queries search
+        only the partition of that specialization, and find nothing if no
+        doctor has it.
+        
+        Args:
+            queries: Normalized query conditions
+            specialization: Optional specialization to search within
+            n_neighbors: Number of neighbors per query; self.n_neighbors by default
+        """
+        n_neighbors = n_neighbors or self.n_neighbors
+        distances = [None] * len(queries)
+        indices = [None] * len(queries)
+        
+        partition = None
+        if specialization and self.partitions is not None:
+            partition = self.partitions.get(specialization_key(specialization))
+            if partition is None:
+                return self._no_matches(len(queries))
+        use_table = (
+            self.neighbor_table_rows is not None
+            and not specialization
+            and n_neighbors <= self.n_neighbors
+        )
+        
+        pending = []
+        for position, query in enumerate(queries):
+            column = self.condition_columns.get(query.lower().strip())
+            table_row = self.neighbor_table_rows.get(column) if use_table and column is not None else None
+            if table_row is None:
+                pending.append(position)
+                continue
             
-            # Get recommended doctors
-            recommendations = []
-            for idx, score in zip(recommended_indices, scores):
-                doctor = self.doctors_df.iloc[idx].to_dict()
-                doctor['similarity_score'] = float(score)
-                doctor['matched_conditions'] = [
-                    cond for cond in doctor['conditions_treated']
-                    if query.lower() in cond.lower()
-                ]
-                recommendations.append(doctor)
+            row_indices = self.neighbor_table_indices[table_row][:n_neighbors]
+            # Drop padding and rows deactivated since the table row was computed
+            keep = row_indices >= 0
+            keep[keep] = self.active_rows[row_indices[keep]]
+            distances[position] = self.neighbor_table_distances[table_row][:n_neighbors][keep]
+            indices[position] = row_indices[keep]
+        
+        if pending:
+            query_matrix = self._get_query_matrix([queries[position] for position in pending], specialization)
+            pending_distances, pending_indices = self._search_neighbors(query_matrix, partition, n_neighbors)
+            for position, row_distances, row_indices in zip(pending, pending_distances, pending_indices):
+                distances[position] = row_distances
+                indices[position] = row_indices
+        
+        return distances, indices
+    
+    def _expand_neighbors(
+        self,
+        queries: List[str],
+        specialization: str,
+        min_score: float,
+        limit: int,
+        distances: List[np.ndarray],
+        indices: List[np.ndarray]
+    ) -> None:
+        """
+        Continue the search of queries left short of their limit
+        
+        Neighbors come nearest first, so once a query's farthest neighbor
+        scores below min_score no farther doctor can match and the query is
+        complete. A query is short when fewer than limit neighbors were
+        found and all of them pass min_score, e.g. because an approximate
+        index probed too few rows or padding and inactive rows were dropped
+        from its neighbors. Rather than searching again with more
+        neighbors, which would score the rows already found once more, the
+        search continues over the rows not found yet that share a feature
+        with the query (see _find_matching); with a positive min_score no
+        other row can match, so the query is then complete. The lists are
+        updated in place.
+        
+        Args:
+            queries: Normalized query conditions
+            specialization: Optional specialization to search within
+            min_score: Minimum similarity score of a result
+            limit: Number of results wanted per query
+            distances: Neighbor distances per query, from _find_neighbors
+            indices: Neighbor rows per query, from _find_neighbors
+        """
+        max_distance = 1.0 - min_score
+        pending = [
+            position for position in range(len(queries))
+            if len(distances[position]) < limit and bool(np.all(distances[position] <= max_distance))
+        ]
+        if pending:
+            logger.info("Continuing the neighbor search of %d queries short of %d results", len(pending), limit)
+        for position in pending:
+            unseen = np.ones(len(self.active_rows), dtype=bool)
+            unseen[indices[position]] = False
+            [more_distances], [more_indices] = self._find_matching([queries[position]], specialization, min_score, unseen)
+            distances[position] = np.concatenate((distances[position], more_distances))
+            indices[position] = np.concatenate((indices[position], more_indices))
+    
+    def _no_matches(self, n_queries: int) -> Tuple[List[np.ndarray], List[np.ndarray]]:
+        """Empty (distances, indices) lists for every query"""
+        return (
+            [np.array([], dtype=np.float64) for _ in range(n_queries)],
+            [np.array([], dtype=np.int64) for _ in range(n_queries)],
+        )
+    
+    def _find_matching(
+        self,
+        queries: List[str],
+        specialization: str = None,
+        min_score: float = 0.1,
+        row_mask: np.ndarray = None
+    ) -> Tuple[List[np.ndarray], List[np.ndarray]]:
+        """
+        Every active doctor whose similarity to each query is at least min_score
+        
+        Unlike _find_neighbors the result is not limited to the nearest
+        neighbors, so ordering it by experience, rating or fee is exact over
+        the whole catalog. Specialization-scoped queries score their whole
+        partition in one sparse product. Otherwise, with a positive
+        min_score only rows sharing a feature with the query can match, so
+        the candidates are gathered from the column postings. A row mask
+        (e.g. from the filter index) drops candidates before they are scored.
+        
+        Args:
+            queries: Normalized query conditions
+            specialization: Optional specialization to search within
+            min_score: Minimum similarity score of a match
+            row_mask: Optional boolean mask of the rows allowed to match
+        
+        Returns:
+            Tuple of (distances, indices) lists, one entry per query, unordered
+        """
+        partition = None
+        if specialization and self.partitions is not None:
+            partition = self.partitions.get(specialization_key(specialization))
+            if partition is None:
+                return self._no_matches(len(queries))
+        
+        query_matrix = normalize_rows(
+            self._get_query_matrix(queries, specialization),
+            dtype=self.feature_matrix.dtype
+        )
+        if partition is not None:
+            partition_active = self.active_rows[partition.rows]
+            if row_mask is not None:
+                partition_active = partition_active & row_mask[partition.rows]
+            postings = None
+        else:
+            postings = self._get_column_postings()
+        n_numeric = len(self.numeric_features)
+        
+        distances, indices = [], []
+        for position in range(len(queries)):
+            query = query_matrix[position]
+            if partition is not None:
+                scores = (partition.matrix @ query.T).toarray().ravel().astype(np.float64)
+                matched = partition_active & (scores >= min_score)
+                distances.append(1.0 - scores[matched])
+                indices.append(np.asarray(partition.rows[matched], dtype=np.int64))
+                continue
             
-            # Sort based on criteria
-            if sort_by:
-                sort_by = sort_by.lower()
-                
-                if sort_by == "experience":
-                    recommendations.sort(key=lambda x: (-x.get('experience', 0), -x.get('rating', 0)))
-                elif sort_by == "rating":
-                    recommendations.sort(key=lambda x: (-x.get('rating', 0), -x.get('experience', 0)))
-                elif sort_by == "fee":
-                    recommendations.sort(key=lambda x: x.get('fee', float('inf')))
-                else:
-                    # Default to similarity score
-                    recommendations.sort(key=lambda x: -x['similarity_score'])
+            if min_score > 0 and (len(query.indices) == 0 or query.indices.min() >= n_numeric):
+                # Rows appended since the postings were built are scored as well
+                appended = np.arange(postings.shape[0], self.feature_matrix.shape[0], dtype=np.int64)
+                rows = np.unique(np.concatenate([appended] + [
+                    postings.indices[postings.indptr[column]:postings.indptr[column + 1]]
+                    for column in query.indices - n_numeric
+                    if column < postings.shape[1]
+                ]))
+            elif row_mask is not None:
+                rows = np.flatnonzero(row_mask)
             else:
-                # Default to similarity score
-                recommendations.sort(key=lambda x: -x['similarity_score'])
-            
-            # Limit results
-            recommendations = recommendations[:limit]
-            
-            logger.info(
-                "Found %d KNN recommendations for query '%s'",
-                len(recommendations),
-                query
-            )
-            
-            # If KNN fails to find good recommendations, fall back to simple recommender
-            if not recommendations:
-                logger.info("KNN found no recommendations, falling back to simple filtering")
-                return self.simple_recommender.recommend_doctors(
-                    query=query, 
-                    sort_by=sort_by or "experience", 
-                    limit=limit
-                )
-                
-            return recommendations
-            
+                # Rows sharing no feature with the query can still match
+                rows = np.arange(self.feature_matrix.shape[0])
+            rows = rows[self.active_rows[rows]]
+            if row_mask is not None:
+                rows = rows[row_mask[rows]]
+            scores = (self.feature_matrix[rows] @ query.T).toarray().ravel().astype(np.float64)
+            matched = scores >= min_score
+            distances.append(1.0 - scores[matched])
+            indices.append(rows[matched].astype(np.int64))
+        return distances, indices
+    
+    def _get_column_postings(self):
+        """The CSC copy of the condition/specialization columns, built by the first query that needs it"""
+        postings = self._column_postings
+        if postings is None:
+            with self._column_postings_lock:
+                if self._column_postings is None:
+                    self._column_postings = sparse.csc_matrix(self.feature_matrix[:, len(self.numeric_features):])
+                postings = self._column_postings
+        return postings
+    
+    def _recommend_many(
+        self,
+        queries: List[str],
+        specialization: str,
+        sort_by: str,
+        min_score: float,
+        limit: int,
+        filters: Dict[str, Any] = None,
+        facets: bool = False,
+        fallback: bool = True
+    ) -> Tuple[List[List[Dict[str, Any]]], List[Dict[str, Any]]]:
+        """
+        recommend_many without locking or caching
+        
+        Returns:
+            Tuple of (recommendations per query, facet counts per query or
+            None if facets were not requested)
+        
+        Raises:
+            Exception: Errors of the KNN search when fallback is False
+        """
+        # Evaluated up front so a malformed expression reaches the caller
+        row_mask = self.simple_recommender.filter_mask(filters) if filters else None
+        
+        # If sklearn isn't available or the KNN model isn't fitted, use simple recommender directly
+        if not self.use_sklearn or self.feature_matrix is None:
+            if not fallback:
+                return [[] for _ in queries], [None] * len(queries) if facets else None
+            logger.info("Using simple recommender as the KNN model isn't available")
+            return self._simple_many(queries, specialization, sort_by, limit, filters, facets)
+        
+        try:
+            if sort_by in self.EXACT_SORT_ORDERS or row_mask is not None or facets:
+                # Every matching doctor, so the top by the sort key is exact
+                distances, indices = self._find_matching(queries, specialization, min_score, row_mask)
+            else:
+                # Find nearest neighbors for all queries at once, enough to fill the limit
+                n_neighbors = max(self.n_neighbors, limit)
+                distances, indices = self._find_neighbors(queries, specialization, n_neighbors)
+                self._expand_neighbors(queries, specialization, min_score, limit, distances, indices)
         except Exception as e:
+            if not fallback:
+                raise
             logger.error("Error in KNN recommendations: %s", str(e))
             # Fall back to simple recommender
             logger.info("Falling back to simple filtering due to KNN error")
-            return self.simple_recommender.recommend_doctors(
+            return self._simple_many(queries, specialization, sort_by, limit, filters, facets)
+        
+        results = []
+        facet_counts = [] if facets else None
+        for query, query_distances, query_indices in zip(queries, distances, indices):
+            try:
+                recommendations = self._build_recommendations(
+                    query,
+                    query_distances,
+                    query_indices,
+                    sort_by=sort_by,
+                    min_score=min_score,
+                    limit=limit
+                )
+                query_facets = self.simple_recommender.filter_index.facet_counts(query_indices) if facets else None
+                
+                logger.info(
+                    "Found %d KNN recommendations for query '%s'",
+                    len(recommendations),
+                    query
+                )
+                
+                # If KNN fails to find good recommendations, fall back to simple recommender
+                if not recommendations and fallback:
+                    logger.info("KNN found no recommendations, falling back to simple filtering")
+                    [recommendations], query_facets = self._simple_many(
+                        [query], specialization, sort_by, limit, filters, facets
+                    )
+                    query_facets = query_facets[0] if facets else None
+            
+            except Exception as e:
+                if not fallback:
+                    raise
+                logger.error("Error in KNN recommendations: %s", str(e))
+                # Fall back to simple recommender
+                logger.info("Falling back to simple filtering due to KNN error")
+                [recommendations], query_facets = self._simple_many(
+                    [query], specialization, sort_by, limit, filters, facets
+                )
+                query_facets = query_facets[0] if facets else None
+            results.append(recommendations)
+            if facets:
+                facet_counts.append(query_facets)
+        
+        return results, facet_counts
+    
+    def _simple_many(
+        self,
+        queries: List[str],
+        specialization: str,
+        sort_by: str,
+        limit: int,
+        filters: Dict[str, Any],
+        facets: bool
+    ) -> Tuple[List[List[Dict[str, Any]]], List[Dict[str, Any]]]:
+        """Recommendations, and facet counts if requested, of the simple recommender for every query"""
+        results = [
+            self.simple_recommender.recommend_doctors(
                 query=query,
-                sort_by=sort_by or "experience",
-                limit=limit
-            ) 
\ No newline at end of file
+                sort_by=sort_by or "similarity",
+                limit=limit,
+                specialization=specialization,
+                filters=filters
+            )
+            for query in queries
+        ]
+        return results, self._simple_facets(queries, specialization, filters) if facets else None
+    
+    def _simple_facets(self, queries: List[str], specialization: str, filters: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Facet counts of the simple recommender's matches for every query"""
+        return [self.simple_recommender.facet_counts(query, specialization, filters) for query in queries]
@@ -0,0 +1,625 @@
+import json
+import math
+from typing import Any, Dict, Iterable, List, Tuple
+
+import numpy as np
+
+from .buffers import AppendBuffers
+
+def _is_null(value: Any) -> bool:
+    """None and float NaN are stored as nulls"""
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+def _is_int(value: Any) -> bool:
+    return isinstance(value, (int, np.integer)) and not isinstance(value, (bool, np.bool_))
+
+def _is_number(value: Any) -> bool:
+    return _is_int(value) or isinstance(value, (float, np.floating))
+
+def _encode_strings(values: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """Encode strings into one UTF-8 byte blob plus start offsets"""
+    encoded = [value.encode('utf-8') for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(value) for value in encoded], out=offsets[1:])
+    blob = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+    return blob, offsets
+
+def _decode_strings(blob: np.ndarray, offsets: np.ndarray, indices: np.ndarray) -> List[str]:
+    """Decode the strings at the given indices of a blob"""
+    starts = offsets[indices].tolist()
+    ends = offsets[np.asarray(indices) + 1].tolist()
+    return [blob[start:end].tobytes().decode('utf-8') for start, end in zip(starts, ends)]
+
+def gather_ranges(offsets: np.ndarray, rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Flattened entry indices owned by the given rows of an offset array
+    
+    Returns:
+        Tuple of (entry indices, number of entries per row)
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    starts = offsets[rows]
+    lengths = offsets[rows + 1] - starts
+    total = int(lengths.sum())
+    entry_starts = np.cumsum(lengths) - lengths
+    entries = np.repeat(starts - entry_starts, lengths) + np.arange(total)
+    return entries.astype(np.int64), lengths
+
+def _int_dtype(low: int, high: int) -> np.dtype:
+    """Smallest signed integer dtype holding every value in [low, high]"""
+    for dtype in (np.int8, np.int16, np.int32):
+        info = np.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            return np.dtype(dtype)
+    return np.dtype(np.int64)
+
+def _code_dtype(size: int) -> np.dtype:
+    """Dtype of codes into a dictionary of the given size, -1 marking nulls"""
+    return _int_dtype(-1, size)
+
+def _float_values(values: np.ndarray) -> np.ndarray:
+    """
+    Decode a float column to float64
+    
+    float32 columns only hold values whose shortest decimal form round-trips
+    (e.g. a 4.7 rating), so they are widened through that decimal form rather
+    than a binary cast, which would turn 4.7 into 4.699999809.
+    """
+    if values.dtype != np.float32:
+        return np.asarray(values, dtype=np.float64)
+    # Few distinct values (ratings, fees) need decoding
+    unique_values, inverse = np.unique(values, return_inverse=True)
+    return unique_values.astype(str).astype(np.float64)[inverse.reshape(-1)]
+
+def _compact_floats(values: np.ndarray) -> np.ndarray:
+    """float32 copy of a float64 array if every value survives the round trip, else the array itself"""
+    narrowed = values.astype(np.float32)
+    return narrowed if np.array_equal(_float_values(narrowed), values, equal_nan=True) else values
+
+def _parse_numbers(values: List[Any]) -> np.ndarray:
+    """float64 array of values, NaN where a value is not a number"""
+    numbers = np.full(len(values), np.nan)
+    for position, value in enumerate(values):
+        try:
+            numbers[position] = float(value)
+        except (TypeError, ValueError):
+            pass
+    return numbers
+
+def _encode_dictionary(values: List[Any]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Dictionary-encode strings
+    
+    Returns:
+        Tuple of (codes, dictionary blob, dictionary offsets); distinct
+        strings are stored once in first-seen order and None gets code -1
+    """
+    dictionary = {}
+    codes = np.fromiter(
+        (-1 if value is None else dictionary.setdefault(value, len(dictionary)) for value in values),
+        dtype=np.int64, count=len(values)
+    )
+    data, offsets = _encode_strings(list(dictionary))
+    return codes.astype(_code_dtype(len(dictionary))), data, offsets
+
+def _decode_dictionary(column: Dict[str, np.ndarray], codes: np.ndarray) -> List[Any]:
+    """Strings of the given codes of a dictionary-encoded column; code -1 decodes to None"""
+    unique_codes, inverse = np.unique(np.asarray(codes), return_inverse=True)
+    present = unique_codes >= 0
+    words = [None] * len(unique_codes)
+    for position, word in zip(
+        np.flatnonzero(present).tolist(),
+        _decode_strings(column['data'], column['offsets'], unique_codes[present])
+    ):
+        words[position] = word
+    return [words[position] for position in inverse.reshape(-1).tolist()]
+
+def _concat_offsets(parts: List[np.ndarray]) -> np.ndarray:
+    """Join offset arrays (each starting at 0) into one running offset array"""
+    shifted = [np.zeros(1, dtype=np.int64)]
+    total = 0
+    for offsets in parts:
+        shifted.append(offsets[1:] + total)
+        total += int(offsets[-1])
+    return np.concatenate(shifted).astype(np.int64)
+
+def _concat_columns(kind: str, columns: List[Dict[str, np.ndarray]]) -> Dict[str, np.ndarray]:
+    """Join the encoded arrays of columns of the same kind"""
+    column = {'nulls': np.concatenate([part['nulls'] for part in columns]) if columns else np.array([], dtype=bool)}
+    if kind == 'int':
+        column['values'] = np.concatenate([part['values'] for part in columns]).astype(
+            np.result_type(np.int8, *[part['values'] for part in columns])
+        )
+        return column
+    if kind == 'float':
+        if all(part['values'].dtype == np.float32 for part in columns):
+            column['values'] = np.concatenate([part['values'] for part in columns]).astype(np.float32)
+        else:
+            column['values'] = np.concatenate([_float_values(part['values']) for part in columns])
+        return column
+    if kind in ('category', 'list'):
+        # Merge the dictionaries and remap every part's codes into the merged one
+        merged = {}
+        codes = []
+        for part in columns:
+            words = _decode_strings(part['data'], part['offsets'], np.arange(len(part['offsets']) - 1))
+            # The trailing -1 maps null codes (-1) to themselves
+            mapping = np.array([merged.setdefault(word, len(merged)) for word in words] + [-1], dtype=np.int64)
+            codes.append(mapping[part['codes']])
+        column['codes'] = (np.concatenate(codes) if codes else np.array([], dtype=np.int64)).astype(
+            _code_dtype(len(merged))
+        )
+        column['data'], column['offsets'] = _encode_strings(list(merged))
+        if kind == 'list':
+            column['row_offsets'] = _concat_offsets([part['row_offsets'] for part in columns])
+        return column
+    column['data'] = np.concatenate([part['data'] for part in columns]).astype(np.uint8)
+    column['offsets'] = _concat_offsets([part['offsets'] for part in columns])
+    return column
+
+class DoctorStore:
+    """
+    Append-only columnar table of doctor records
+    
+    Numeric fields are numpy arrays of the narrowest dtype that holds them
+    exactly (int8 to int64, float32 or float64). Strings live in one UTF-8
+    byte blob with offsets; low-cardinality strings (e.g. specialization)
+    are instead stored as integer codes into a dictionary of their distinct
+    values. Lists of strings (e.g. conditions_treated) are flattened into
+    per-row item offsets plus dictionary codes, so every distinct condition
+    is stored once. Fields that fit none of these are kept as JSON text.
+    Every column is made of plain numpy arrays, so a store can be saved as
+    .npy files and memory-mapped read-only by several processes at once.
+    """
+    # Most distinct values per present value for a string column to be dictionary-encoded
+    CATEGORY_MAX_FRACTION = 0.5
+    
+    def __init__(self):
+        self.n_rows = 0
+        # Column name -> kind ('int', 'float', 'str', 'category', 'list' or 'json')
+        self.kinds = {}
+        # Column name -> named arrays making up the column
+        self.columns = {}
+        # Column name -> {string: code} of its dictionary, built on the first append
+        self._dictionary_codes = {}
+        # Spare capacity of the columns grown by append
+        self._buffers = AppendBuffers()
+    
+    def __len__(self) -> int:
+        return self.n_rows
+    
+    @classmethod
+    def from_records(cls, records: List[Dict[str, Any]]) -> 'DoctorStore':
+        """Build a store from a list of doctor dictionaries"""
+        store = cls()
+        store.n_rows = len(records)
+        names = []
+        for record in records:
+            for name in record:
+                if name not in store.kinds:
+                    store.kinds[name] = None
+                    names.append(name)
+        for name in names:
+            store._set_column(name, [record.get(name) for record in records])
+        return store
+    
+    @classmethod
+    def from_chunks(cls, chunks: Iterable[List[Dict[str, Any]]]) -> 'DoctorStore':
+        """
+        Build a store from an iterable of record lists, one chunk at a time
+        
+        Each chunk is encoded into numpy columns as soon as it arrives, so
+        only one chunk is held as Python dictionaries at any time; the
+        encoded chunks are then concatenated column by column.
+        """
+        return cls.concat([cls.from_records(chunk) for chunk in chunks])
+    
+    @classmethod
+    def concat(cls, stores: List['DoctorStore']) -> 'DoctorStore':
+        """Store holding the rows of several stores, in order"""
+        store = cls()
+        store.n_rows = sum(len(part) for part in stores)
+        names = list(dict.fromkeys(name for part in stores for name in part.kinds))
+        for name in names:
+            # A chunk where the column is missing or all null says nothing about its kind
+            kinds = {
+                part.kinds[name] for part in stores
+                if name in part.kinds and not part.columns[name]['nulls'].all()
+            } or {next(part.kinds[name] for part in stores if name in part.kinds)}
+            if kinds == {'int', 'float'}:
+                kinds = {'float'}
+            if kinds == {'str', 'category'}:
+                # Small chunks rarely repeat values; keep the encoding holding most rows
+                category_rows = sum(len(part) for part in stores if part.kinds.get(name) == 'category')
+                kinds = {'category' if 2 * category_rows >= store.n_rows else 'str'}
+            if len(kinds) > 1:
+                # Chunks inferred different kinds; rare, so re-encode the Python values
+                store._set_column(name, [value for part in stores for value in part.values(name)])
+                continue
+            kind = kinds.pop()
+            columns = []
+            for part in stores:
+                if part.kinds.get(name) == kind:
+                    columns.append(part.columns[name])
+                    continue
+                # Re-encode the chunk's values (nulls, ints of a float column, ...) in the common kind
+                filler = cls()
+                filler.n_rows = len(part)
+                filler._set_column(name, part.values(name), kind)
+                columns.append(filler.columns[name])
+            store.kinds[name] = kind
+            store.columns[name] = _concat_columns(kind, columns)
+        return store
+    
+    def copy(self) -> 'DoctorStore':
+        """
+        Shallow copy sharing the column arrays
+        
+        Appends only write past the rows an array already holds (see
+        AppendBuffers), so appending to either store leaves the other unchanged.
+        """
+        store = DoctorStore()
+        store.n_rows = self.n_rows
+        store.kinds = dict(self.kinds)
+        store.columns = {name: dict(column) for name, column in self.columns.items()}
+        return store
+    
+    def _set_column(self, name: str, values: List[Any], kind: str = None) -> None:
+        """Encode a full column of Python values, inferring its kind if not given"""
+        nulls = np.fromiter((_is_null(value) for value in values), dtype=bool, count=len(values))
+        present = [value for value, null in zip(values, nulls) if not null]
+        
+        if kind is None:
+            if all(_is_int(value) for value in present):
+                kind = 'int'
+            elif all(_is_number(value) for value in present):
+                kind = 'float'
+            elif all(isinstance(value, str) for value in present):
+                repeated = len(set(present)) <= self.CATEGORY_MAX_FRACTION * len(present)
+                kind = 'category' if repeated else 'str'
+            elif all(
+                isinstance(value, list) and all(isinstance(item, str) for item in value)
+                for value in present
+            ):
+                kind = 'list'
+            else:
+                kind = 'json'
+        
+        column = {'nulls': nulls}
+        if kind == 'int':
+            values = np.array([0 if null else value for value, null in zip(values, nulls)], dtype=np.int64)
+            column['values'] = values.astype(_int_dtype(values.min(), values.max())) if len(values) else values
+        elif kind == 'float':
+            column['values'] = _compact_floats(
+                np.array([0 if null else value for value, null in zip(values, nulls)], dtype=np.float64)
+            )
+        elif kind == 'str':
+            column['data'], column['offsets'] = _encode_strings(['' if null else value for value, null in zip(values, nulls)])
+        elif kind == 'category':
+            column['codes'], column['data'], column['offsets'] = _encode_dictionary([
+                None if null else value for value, null in zip(values, nulls)
+            ])
+        elif kind == 'list':
+            row_lengths = [0 if null else len(value) for value, null in zip(values, nulls)]
+            column['row_offsets'] = np.zeros(len(values) + 1, dtype=np.int64)
+            np.cumsum(row_lengths, out=column['row_offsets'][1:])
+            items = [item for value, null in zip(values, nulls) if not null for item in value]
+            column['codes'], column['data'], column['offsets'] = _encode_dictionary(items)
+        else:
+            column['data'], column['offsets'] = _encode_strings([
+                'null' if null else json.dumps(value) for value, null in zip(values, nulls)
+            ])
+        
+        self.kinds[name] = kind
+        self.columns[name] = column
+        self._dictionary_codes.pop(name, None)
+    
+    def values(self, name: str, rows: np.ndarray = None) -> List[Any]:
+        """Python values of a column for the given rows (all rows by default)"""
+        if rows is None:
+            rows = np.arange(self.n_rows)
+        rows = np.asarray(rows, dtype=np.int64)
+        if name not in self.kinds:
+            return [None] * len(rows)
+        
+        kind = self.kinds[name]
+        column = self.columns[name]
+        if kind == 'int':
+            values = column['values'][rows].tolist()
+        elif kind == 'float':
+            values = _float_values(column['values'][rows]).tolist()
+        elif kind == 'str':
+            values = _decode_strings(column['data'], column['offsets'], rows)
+        elif kind == 'category':
+            values = _decode_dictionary(column, column['codes'][rows])
+        elif kind == 'list':
+            entries, lengths = gather_ranges(column['row_offsets'], rows)
+            items = _decode_dictionary(column, column['codes'][entries])
+            values = []
+            position = 0
+            for length in lengths.tolist():
+                values.append(items[position:position + length])
+                position += length
+        else:
+            values = [json.loads(value) for value in _decode_strings(column['data'], column['offsets'], rows)]
+        
+        nulls = column['nulls'][rows]
+        if nulls.any():
+            values = [None if null else value for value, null in zip(values, nulls.tolist())]
+        return values
+    
+    def records(self, rows: np.ndarray) -> List[Dict[str, Any]]:
+        """Materialize the given rows as doctor dictionaries, column by column"""
+        names = list(self.kinds)
+        columns = [self.values(name, rows) for name in names]
+        return [dict(zip(names, row_values)) for row_values in zip(*columns)]
+    
+    def numeric(self, name: str, default: float = 0.0) -> np.ndarray:
+        """A column as float64, with nulls and non-numeric values replaced by default"""
+        if name not in self.kinds:
+            return np.full(self.n_rows, default, dtype=np.float64)
+        
+        kind = self.kinds[name]
+        column = self.columns[name]
+        if kind in ('int', 'float'):
+            values = _float_values(column['values'])
+        else:
+            values = _parse_numbers(self.values(name))
+        values[column['nulls']] = np.nan
+        return np.where(np.isnan(values), default, values)
+    
+    def sort_key(self, name: str, rows: np.ndarray, default: float = 0.0) -> np.ndarray:
+        """
+        Numbers of a column for the given rows, to order rows by
+        
+        float32 columns are returned as stored, without decoding: a column is
+        only float32 when every value has its own float32 form, so the order
+        of the values is kept. Nulls and non-numeric values become default.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        if self.kinds.get(name) not in ('int', 'float'):
+            values = _parse_numbers(self.values(name, rows))
+            return np.where(np.isnan(values), default, values)
+        column = self.columns[name]
+        values = column['values'][rows]
+        if values.dtype.kind == 'i':
+            values = values.astype(np.float64)
+        # Nulls are stored as 0
+        if default != 0:
+            values = np.where(column['nulls'][rows], values.dtype.type(default), values)
+        return values
+    
+    def list_row_offsets(self, name: str) -> np.ndarray:
+        """Per-row item offsets of a list column"""
+        return self.columns[name]['row_offsets']
+    
+    def category_codes(self, name: str) -> np.ndarray:
+        """Dictionary codes of every row of a category column; -1 marks nulls"""
+        return self.columns[name]['codes']
+    
+    def list_codes(self, name: str) -> np.ndarray:
+        """Dictionary codes of the flattened items of a list column"""
+        return self.columns[name]['codes']
+    
+    def list_items(self, name: str, entries: np.ndarray) -> List[str]:
+        """Decode the given flattened items of a list column"""
+        column = self.columns[name]
+        return _decode_dictionary(column, column['codes'][entries])
+    
+    def dictionary(self, name: str, codes: np.ndarray = None) -> List[str]:
+        """
+        Decode dictionary entries of a category or list column
+        
+        Args:
+            name: Column name
+            codes: Codes to decode (the whole dictionary by default)
+        
+        Returns:
+            The distinct strings with these codes, in order
+        """
+        column = self.columns[name]
+        if codes is None:
+            codes = np.arange(len(column['offsets']) - 1)
+        return _decode_strings(column['data'], column['offsets'], np.asarray(codes, dtype=np.int64))
+    
+    def append(self, record: Dict[str, Any]) -> int:
+        """
+        Append a record and return its row index
+        
+        Values that do not fit their column's kind (or new fields) cause that
+        column to be re-encoded, which is O(rows) but rare.
+        """
+        row = self.n_rows
+        for name in list(self.kinds):
+            value = record.get(name)
+            if not self._append_value(name, value):
+                self._set_column(name, self.values(name) + [value])
+        for name in record:
+            if name not in self.kinds:
+                self._set_column(name, [None] * row + [record[name]])
+        self.n_rows += 1
+        return row
+    
+    def _dictionary_code(self, name: str, text: str) -> int:
+        """Code of a string in a column's dictionary, adding the string if it is new"""
+        codes = self._dictionary_codes.get(name)
+        if codes is None:
+            codes = self._dictionary_codes[name] = {word: code for code, word in enumerate(self.dictionary(name))}
+        code = codes.get(text)
+        if code is None:
+            column = self.columns[name]
+            data, offsets = _encode_strings([text])
+            column['data'] = self._buffers.append((name, 'data'), column['data'], data)
+            column['offsets'] = self._buffers.append((name, 'offsets'), column['offsets'], column['offsets'][-1] + offsets[-1])
+            code = codes[text] = len(codes)
+        return code
+    
+    def _append_value(self, name: str, value: Any) -> bool:
+        """Append a value to a column in place; False if it does not fit the column kind"""
+        kind = self.kinds[name]
+        column = self.columns[name]
+        null = _is_null(value)
+        
+        if kind == 'int' and not (null or _is_int(value)):
+            return False
+        if kind == 'float' and not (null or _is_number(value)):
+            return False
+        if kind in ('str', 'category') and not (null or isinstance(value, str)):
+            return False
+        if kind == 'list' and not (null or (isinstance(value, list) and all(isinstance(item, str) for item in value))):
+            return False
+        
+        if kind == 'int':
+            value = 0 if null else int(value)
+            dtype = np.promote_types(column['values'].dtype, _int_dtype(value, value))
+            column['values'] = self._buffers.append((name, 'values'), column['values'], value, dtype)
+        elif kind == 'float':
+            values = column['values']
+            value = 0.0 if null else float(value)
+            if values.dtype == np.float32 and _compact_floats(np.array([value])).dtype != np.float32:
+                # The value has no exact float32 form; widen the column
+                values = _float_values(values)
+            column['values'] = self._buffers.append((name, 'values'), values, value)
+        elif kind in ('category', 'list'):
+            if kind == 'list':
+                items = [] if null else value
+                codes = [self._dictionary_code(name, item) for item in items]
+                column['row_offsets'] = self._buffers.append(
+                    (name, 'row_offsets'), column['row_offsets'], column['row_offsets'][-1] + len(items)
+                )
+            else:
+                codes = [-1 if null else self._dictionary_code(name, value)]
+            dtype = np.promote_types(column['codes'].dtype, _code_dtype(len(column['offsets']) - 1))
+            column['codes'] = self._buffers.append((name, 'codes'), column['codes'], codes, dtype)
+        else:
+            text = ('' if null else value) if kind == 'str' else ('null' if null else json.dumps(value))
+            data, offsets = _encode_strings([text])
+            column['data'] = self._buffers.append((name, 'data'), column['data'], data)
+            column['offsets'] = self._buffers.append((name, 'offsets'), column['offsets'], column['offsets'][-1] + offsets[-1])
+        column['nulls'] = self._buffers.append((name, 'nulls'), column['nulls'], null)
+        return True
+    
+    def take(self, rows: np.ndarray) -> 'DoctorStore':
+        """New store holding only the given rows, in order"""
+        store = DoctorStore()
+        store.n_rows = len(rows)
+        for name, kind in self.kinds.items():
+            store._set_column(name, self.values(name, rows), kind)
+        return store
+    
+    def slice_rows(self, start: int, stop: int) -> 'DoctorStore':
+        """
+        New store holding rows start:stop
+        
+        Fixed-width arrays and blobs are sliced as views and dictionaries are
+        shared, so only the offsets are copied; pickling the slice (e.g. to
+        send it to a worker process) copies just the rows it holds.
+        """
+        store = DoctorStore()
+        store.n_rows = stop - start
+        for name, kind in self.kinds.items():
+            column = self.columns[name]
+            sliced = {'nulls': column['nulls'][start:stop]}
+            if kind in ('int', 'float'):
+                sliced['values'] = column['values'][start:stop]
+            elif kind in ('category', 'list'):
+                sliced['data'], sliced['offsets'] = column['data'], column['offsets']
+                if kind == 'category':
+                    sliced['codes'] = column['codes'][start:stop]
+                else:
+                    first, last = column['row_offsets'][start], column['row_offsets'][stop]
+                    sliced['row_offsets'] = np.asarray(column['row_offsets'][start:stop + 1] - first, dtype=np.int64)
+                    sliced['codes'] = column['codes'][first:last]
+            else:
+                first, last = column['offsets'][start], column['offsets'][stop]
+                sliced['offsets'] = np.asarray(column['offsets'][start:stop + 1] - first, dtype=np.int64)
+                sliced['data'] = column['data'][first:last]
+            store.kinds[name] = kind
+            store.columns[name] = sliced
+        return store
+    
+    def get_state(self) -> Tuple[Dict[str, np.ndarray], Dict[str, Any]]:
+        """Export the store as flat arrays and JSON-serializable metadata"""
+        arrays = {}
+        for index, name in enumerate(self.kinds):
+            for part, array in self.columns[name].items():
+                arrays[f'col{index}_{part}'] = array
+        metadata = {
+            'n_rows': self.n_rows,
+            'columns': [[name, kind] for name, kind in self.kinds.items()],
+        }
+        return arrays, metadata
+    
+    @classmethod
+    def from_state(cls, arrays: Dict[str, np.ndarray], metadata: Dict[str, Any]) -> 'DoctorStore':
+        """Rebuild a store from get_state output; arrays may be memory-mapped"""
+        store = cls()
+        store.n_rows = metadata['n_rows']
+        for index, (name, kind) in enumerate(metadata['columns']):
+            prefix = f'col{index}_'
+            store.kinds[name] = kind
+            store.columns[name] = {
+                array_name[len(prefix):]: array
+                for array_name, array in arrays.items()
+                if array_name.startswith(prefix)
+            }
+        return store
+
+class RowIdIndex:
+    """
+    Doctor id -> row lookup over the live rows of a doctor store
+    
+    Integer ids are kept as two numpy arrays sorted by id and found by
+    binary search, rather than as a dictionary holding Python objects for
+    every doctor. Ids added or removed after the build go to a small
+    dictionary that is consulted first, None marking a removed id; other
+    id types only use the dictionary.
+    """
+    def __init__(self):
+        self.ids = np.array([], dtype=np.int64)
+        self.rows = np.array([], dtype=np.int32)
+        # Doctor id -> row (None if removed) of changes since the build
+        self.changes = {}
+    
+    @classmethod
+    def build(cls, doctors: DoctorStore, active_rows: np.ndarray) -> 'RowIdIndex':
+        """Index the ids of the active rows; the last row wins for a repeated id"""
+        index = cls()
+        live_rows = np.flatnonzero(active_rows)
+        if doctors.kinds.get('id') != 'int':
+            if 'id' in doctors.kinds:
+                index.changes = dict(zip(doctors.values('id', live_rows), live_rows.tolist()))
+            return index
+        
+        column = doctors.columns['id']
+        live_rows = live_rows[~column['nulls'][live_rows]]
+        ids = column['values'][live_rows].astype(np.int64)
+        order = np.argsort(ids, kind='stable')
+        ids, rows = ids[order], live_rows[order]
+        last = np.append(ids[1:] != ids[:-1], True) if len(ids) else np.array([], dtype=bool)
+        index.ids = ids[last]
+        index.rows = rows[last].astype(np.int32)
+        return index
+    
+    def get(self, doctor_id: Any, default: int = None) -> int:
+        """Row of a doctor id, or default if the id has no live row"""
+        if doctor_id in self.changes:
+            row = self.changes[doctor_id]
+            return default if row is None else row
+        if not _is_int(doctor_id) or not -2**63 <= doctor_id < 2**63:
+            return default
+        position = int(np.searchsorted(self.ids, doctor_id))
+        if position < len(self.ids) and self.ids[position] == doctor_id:
+            return int(self.rows[position])
+        return default
+    
+    def pop(self, doctor_id: Any, default: int = None) -> int:
+        """Remove a doctor id and return its row, or default if it has none"""
+        row = self.get(doctor_id)
+        if row is None:
+            return default
+        self.changes[doctor_id] = None
+        return row
+    
+    def __setitem__(self, doctor_id: Any, row: int) -> None:
+        self.changes[doctor_id] = row
@@ -0,0 +1,376 @@
+import math
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .buffers import AppendBuffers
+from .doctor_store import DoctorStore
+
+def value_key(value: Any) -> str:
+    """Normalized key of a categorical value, or None if there is none"""
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return None
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    key = str(value).strip().lower()
+    return key or None
+
+def _pack(mask: np.ndarray) -> np.ndarray:
+    """Pack a boolean row mask into a little-endian bitset of uint64 words"""
+    packed = np.packbits(mask, bitorder='little')
+    words = np.zeros(((len(mask) + 63) // 64) * 8, dtype=np.uint8)
+    words[:len(packed)] = packed
+    return words.view(np.uint64)
+
+# Number of set bits of every byte value
+_POPCOUNT = np.array([bin(value).count('1') for value in range(256)], dtype=np.uint8)
+
+def _popcount(words: np.ndarray) -> np.ndarray:
+    """Number of set bits of each bitset along the last axis"""
+    return _POPCOUNT[np.ascontiguousarray(words).view(np.uint8)].sum(axis=-1, dtype=np.int64)
+
+def _unpack(words: np.ndarray, n_rows: int) -> np.ndarray:
+    """Boolean row mask of a bitset"""
+    return np.unpackbits(np.ascontiguousarray(words).view(np.uint8), count=n_rows, bitorder='little').astype(bool)
+
+class FilterIndex:
+    """
+    Bitset and range indexes over doctor attributes for composable filters
+    
+    Categorical fields keep one bitset per distinct (normalized) value,
+    packed into uint64 words. Numeric fields keep the rows that have a
+    value sorted by it, so a range is two binary searches. A filter
+    expression is evaluated into bitsets combined with vectorized AND, OR
+    and NOT; only the final bitset is expanded into rows.
+    
+    Expressions are JSON-style dictionaries:
+        {"field": "fee", "gte": 300, "lte": 800}
+        {"field": "specialization", "eq": "Cardiologist"}
+        {"field": "specialization", "contains": "cardio"}
+        {"field": "availability", "in": ["9 AM - 1 PM", "10 AM - 5 PM"]}
+        {"and": [...]}, {"or": [...]}, {"not": {...}}
+    
+    Categorical values are matched ignoring case and surrounding
+    whitespace; missing values never match. Rows appended after the index
+    was built are set in the bitsets right away and compared directly
+    against numeric ranges until the next build.
+    """
+    CATEGORICAL_FIELDS = ('specialization', 'availability', 'hospital')
+    RANGE_FIELDS = ('fee', 'rating', 'experience')
+    CATEGORICAL_OPERATORS = ('eq', 'in', 'contains')
+    RANGE_OPERATORS = ('eq', 'gt', 'gte', 'lt', 'lte')
+    # Numeric field -> bucket boundaries of its facet counts
+    FACET_BUCKETS = {
+        'fee': (300, 500, 1000, 2000),
+        'rating': (3.0, 4.0, 4.5),
+    }
+    
+    def __init__(self):
+        self.n_rows = 0
+        # Categorical field -> normalized value -> row of the field's bitsets
+        self.value_ids = {}
+        # Categorical field -> display label of each value (as first seen)
+        self.labels = {}
+        # Categorical field -> 2D uint64 array holding one bitset per value
+        self.bitsets = {}
+        # Numeric field -> float64 value of every row, NaN if missing
+        self.values = {}
+        # Numeric field -> rows with a value, ordered by value, and those values
+        self.sorted_rows = {}
+        self.sorted_values = {}
+        # Rows from this one on are not in the sorted arrays yet
+        self.unsorted_start = 0
+        # Spare capacity of the bitsets and values grown by append
+        self._buffers = AppendBuffers()
+    
+    @classmethod
+    def build(cls, doctors: DoctorStore) -> 'FilterIndex':
+        """Index the filterable fields of every row of a doctor store"""
+        index = cls()
+        index.n_rows = len(doctors)
+        
+        for field in cls.CATEGORICAL_FIELDS:
+            keys = pd.Series([value_key(value) for value in doctors.values(field)], dtype=object)
+            codes, uniques = pd.factorize(keys)
+            index.value_ids[field] = {key: value_id for value_id, key in enumerate(uniques)}
+            first_rows = np.unique(codes[codes >= 0], return_index=True)[1]
+            index.labels[field] = [str(value).strip() for value in doctors.values(field, np.flatnonzero(codes >= 0)[first_rows])]
+            bitsets = np.zeros((len(uniques), (index.n_rows + 63) // 64), dtype=np.uint64)
+            for value_id in range(len(uniques)):
+                bitsets[value_id] = _pack(codes == value_id)
+            index.bitsets[field] = bitsets
+        
+        for field in cls.RANGE_FIELDS:
+            index.values[field] = doctors.numeric(field, default=np.nan)
+        index._sort_ranges()
+        return index
+    
+    @classmethod
+    def merge(cls, indexes: List['FilterIndex']) -> 'FilterIndex':
+        """
+        Index of consecutive row shards, each indexed on its own
+        
+        Every shard but the last must hold a multiple of 64 rows, so the
+        shard bitsets are concatenated word by word. The result is the same
+        as building the index over all the rows at once.
+        """
+        index = cls()
+        index.n_rows = sum(shard.n_rows for shard in indexes)
+        n_words = (index.n_rows + 63) // 64
+        
+        for field in cls.CATEGORICAL_FIELDS:
+            # Values keep the order they are first seen in, as in build
+            value_ids, labels = {}, []
+            for shard in indexes:
+                for key, label in zip(shard.value_ids[field], shard.labels[field]):
+                    if key not in value_ids:
+                        value_ids[key] = len(labels)
+                        labels.append(label)
+            bitsets = np.zeros((len(labels), n_words), dtype=np.uint64)
+            start_word = 0
+            for shard in indexes:
+                shard_words = shard.bitsets[field].shape[1]
+                positions = [value_ids[key] for key in shard.value_ids[field]]
+                bitsets[positions, start_word:start_word + shard_words] = shard.bitsets[field]
+                start_word += shard.n_rows // 64
+            index.value_ids[field] = value_ids
+            index.labels[field] = labels
+            index.bitsets[field] = bitsets
+        
+        for field in cls.RANGE_FIELDS:
+            index.values[field] = np.concatenate([shard.values[field] for shard in indexes])
+        index._sort_ranges()
+        return index
+    
+    def _sort_ranges(self) -> None:
+        """Sort the rows of every numeric field by value"""
+        for field in self.RANGE_FIELDS:
+            values = self.values[field]
+            present = np.flatnonzero(~np.isnan(values))
+            order = present[np.argsort(values[present], kind='stable')]
+            self.sorted_rows[field] = order.astype(np.int32)
+            self.sorted_values[field] = values[order]
+        self.unsorted_start = self.n_rows
+    
+    def append(self, record: Dict[str, Any]) -> None:
+        """Index a record appended to the doctor store"""
+        row = self.n_rows
+        self.n_rows += 1
+        n_words = (self.n_rows + 63) // 64
+        
+        for field in self.CATEGORICAL_FIELDS:
+            key = value_key(record.get(field))
+            n_values = len(self.bitsets[field])
+            if key is not None and key not in self.value_ids[field]:
+                self.value_ids[field][key] = n_values
+                self.labels[field].append(str(record.get(field)).strip())
+                n_values += 1
+            # A writable view with room for the new row (loaded bitsets may be read-only memory maps)
+            bitsets = self._buffers.resize(('bitsets', field), self.bitsets[field], (n_values, n_words))
+            if key is not None:
+                bitsets[self.value_ids[field][key], row >> 6] |= np.uint64(1) << np.uint64(row & 63)
+            self.bitsets[field] = bitsets
+        
+        for field in self.RANGE_FIELDS:
+            try:
+                value = float(record.get(field))
+            except (TypeError, ValueError):
+                value = np.nan
+            self.values[field] = self._buffers.append(('values', field), self.values[field], value, np.float64)
+    
+    def mask(self, expression: Dict[str, Any]) -> np.ndarray:
+        """
+        Boolean mask of the rows matching a filter expression
+        
+        Raises:
+            ValueError: If the expression is malformed
+        """
+        return _unpack(self.evaluate(expression), self.n_rows)
+    
+    def evaluate(self, expression: Dict[str, Any]) -> np.ndarray:
+        """
+        Bitset of the rows matching a filter expression
+        
+        Raises:
+            ValueError: If the expression is malformed
+        """
+        if not isinstance(expression, dict) or not expression:
+            raise ValueError(f"A filter must be a non-empty object, got {expression!r}")
+        
+        if 'and' in expression or 'or' in expression:
+            operator = 'and' if 'and' in expression else 'or'
+            operands = expression[operator]
+            if len(expression) != 1 or not isinstance(operands, list) or not operands:
+                raise ValueError(f"'{operator}' must be the only key and hold a non-empty list")
+            result = self.evaluate(operands[0]).copy()
+            for operand in operands[1:]:
+                if operator == 'and':
+                    result &= self.evaluate(operand)
+                else:
+                    result |= self.evaluate(operand)
+            return result
+        
+        if 'not' in expression:
+            if len(expression) != 1:
+                raise ValueError("'not' must be the only key of its filter")
+            return ~self.evaluate(expression['not']) & self._all_rows()
+        
+        field = expression.get('field')
+        conditions = {key: value for key, value in expression.items() if key != 'field'}
+        if not conditions:
+            raise ValueError(f"Filter on '{field}' has no condition")
+        if field in self.CATEGORICAL_FIELDS:
+            return self._categorical(field, conditions)
+        if field in self.RANGE_FIELDS:
+            return self._range(field, conditions)
+        raise ValueError(
+            f"Unknown filter field '{field}', expected one of "
+            f"{list(self.CATEGORICAL_FIELDS + self.RANGE_FIELDS)}"
+        )
+    
+    def _all_rows(self) -> np.ndarray:
+        """Bitset with every row set"""
+        return _pack(np.ones(self.n_rows, dtype=bool))
+    
+    def _no_rows(self) -> np.ndarray:
+        """Bitset with no row set"""
+        return np.zeros((self.n_rows + 63) // 64, dtype=np.uint64)
+    
+    def _categorical(self, field: str, conditions: Dict[str, Any]) -> np.ndarray:
+        """Bitset of a field's equality, membership or substring conditions (ANDed)"""
+        result = self._all_rows()
+        value_ids = self.value_ids[field]
+        for operator, operand in conditions.items():
+            if operator == 'eq':
+                ids = [value_ids.get(value_key(operand))]
+            elif operator == 'in':
+                if not isinstance(operand, list):
+                    raise ValueError(f"'in' on '{field}' needs a list")
+                ids = [value_ids.get(value_key(value)) for value in operand]
+            elif operator == 'contains':
+                needle = value_key(operand) or ''
+                ids = [value_id for key, value_id in value_ids.items() if needle in key]
+            else:
+                raise ValueError(
+                    f"Unknown operator '{operator}' for '{field}', expected one of {list(self.CATEGORICAL_OPERATORS)}"
+                )
+            
+            ids = [value_id for value_id in ids if value_id is not None]
+            matched = np.bitwise_or.reduce(self.bitsets[field][ids], axis=0) if ids else self._no_rows()
+            result &= matched
+        return result
+    
+    def _range(self, field: str, conditions: Dict[str, Any]) -> np.ndarray:
+        """Bitset of the rows whose value satisfies every range condition"""
+        sorted_values = self.sorted_values[field]
+        start, stop = 0, len(sorted_values)
+        tail = self.values[field][self.unsorted_start:]
+        tail_matches = ~np.isnan(tail)
+        
+        for operator, operand in conditions.items():
+            if operator not in self.RANGE_OPERATORS:
+                raise ValueError(
+                    f"Unknown operator '{operator}' for '{field}', expected one of {list(self.RANGE_OPERATORS)}"
+                )
+            try:
+                bound = float(operand)
+            except (TypeError, ValueError):
+                raise ValueError(f"'{operator}' on '{field}' needs a number, got {operand!r}")
+            
+            if operator in ('eq', 'gte'):
+                start = max(start, int(np.searchsorted(sorted_values, bound, side='left')))
+            if operator == 'gt':
+                start = max(start, int(np.searchsorted(sorted_values, bound, side='right')))
+            if operator in ('eq', 'lte'):
+                stop = min(stop, int(np.searchsorted(sorted_values, bound, side='right')))
+            if operator == 'lt':
+                stop = min(stop, int(np.searchsorted(sorted_values, bound, side='left')))
+            tail_matches &= {
+                'eq': np.equal, 'gt': np.greater, 'gte': np.greater_equal,
+                'lt': np.less, 'lte': np.less_equal,
+            }[operator](tail, bound)
+        
+        mask = np.zeros(self.n_rows, dtype=bool)
+        mask[self.sorted_rows[field][start:max(start, stop)]] = True
+        mask[self.unsorted_start:] = tail_matches
+        return _pack(mask)
+    
+    def facet_counts(self, rows: np.ndarray) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Facet counts of a set of rows, e.g. the candidates of a query
+        
+        Specialization counts AND the rows' bitset with every value bitset
+        and count the set bits; fee and rating values are bucketed with one
+        binary search per row.
+        
+        Args:
+            rows: Rows of the doctor store to count
+        
+        Returns:
+            Dictionary with 'specialization' (value/count entries, most
+            common first) and 'fee' and 'rating' (min/max/count entries in
+            bucket order, with min inclusive and max exclusive, each with
+            the filter expression selecting it)
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        selected = np.zeros(self.n_rows, dtype=bool)
+        selected[rows] = True
+        counts = _popcount(self.bitsets['specialization'] & _pack(selected))
+        facets = {
+            'specialization': [
+                {'value': self.labels['specialization'][value_id], 'count': int(counts[value_id])}
+                for value_id in np.lexsort((np.arange(len(counts)), -counts))
+                if counts[value_id]
+            ]
+        }
+        
+        for field, boundaries in self.FACET_BUCKETS.items():
+            values = self.values[field][rows]
+            values = values[~np.isnan(values)]
+            counts = np.bincount(np.searchsorted(boundaries, values, side='right'), minlength=len(boundaries) + 1)
+            lows = (None,) + tuple(boundaries)
+            highs = tuple(boundaries) + (None,)
+            buckets = []
+            for low, high, count in zip(lows, highs, counts.tolist()):
+                bucket_filter = {'field': field}
+                if low is not None:
+                    bucket_filter['gte'] = low
+                if high is not None:
+                    bucket_filter['lt'] = high
+                buckets.append({'min': low, 'max': high, 'count': count, 'filter': bucket_filter})
+            facets[field] = buckets
+        return facets
+    
+    def get_state(self) -> Tuple[Dict[str, np.ndarray], Dict[str, Any]]:
+        """Export the index as flat arrays and JSON-serializable metadata"""
+        arrays = {}
+        for field in self.CATEGORICAL_FIELDS:
+            arrays[f'bitsets_{field}'] = self.bitsets[field]
+        for field in self.RANGE_FIELDS:
+            arrays[f'values_{field}'] = self.values[field]
+            arrays[f'sorted_rows_{field}'] = self.sorted_rows[field]
+            arrays[f'sorted_values_{field}'] = self.sorted_values[field]
+        metadata = {
+            'n_rows': self.n_rows,
+            'unsorted_start': self.unsorted_start,
+            'values': {field: list(self.value_ids[field]) for field in self.CATEGORICAL_FIELDS},
+            'labels': {field: list(self.labels[field]) for field in self.CATEGORICAL_FIELDS},
+        }
+        return arrays, metadata
+    
+    @classmethod
+    def from_state(cls, arrays: Dict[str, np.ndarray], metadata: Dict[str, Any]) -> 'FilterIndex':
+        """Rebuild the index from get_state output; arrays may be memory-mapped"""
+        index = cls()
+        index.n_rows = metadata['n_rows']
+        index.unsorted_start = metadata['unsorted_start']
+        for field in cls.CATEGORICAL_FIELDS:
+            index.value_ids[field] = {key: value_id for value_id, key in enumerate(metadata['values'][field])}
+            index.labels[field] = list(metadata['labels'][field])
+            index.bitsets[field] = arrays[f'bitsets_{field}']
+        for field in cls.RANGE_FIELDS:
+            index.values[field] = arrays[f'values_{field}']
+            index.sorted_rows[field] = arrays[f'sorted_rows_{field}']
+            index.sorted_values[field] = arrays[f'sorted_values_{field}']
+        return index
@@ -0,0 +1,98 @@
+from contextlib import contextmanager
+from typing import Iterator
+import threading
+
+class ReadWriteLock:
+    """
+    Lock held by any number of readers at once, or by a single writer
+    
+    Writers are preferred: once a writer is waiting, new readers wait behind
+    it, so a steady stream of queries cannot starve updates. Both sides are
+    reentrant, and the writer may also take the read side; a reader may not
+    upgrade to the write side, which would deadlock against other readers.
+    """
+    def __init__(self):
+        self._condition = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._waiting_writers = 0
+        self._writer = None
+        self._write_depth = 0
+        # Read depth of the current thread, and whether it counts as a reader
+        self._local = threading.local()
+    
+    @contextmanager
+    def read(self) -> Iterator[None]:
+        """Hold the lock shared with other readers"""
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+    
+    @contextmanager
+    def write(self) -> Iterator[None]:
+        """Hold the lock exclusively"""
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
+    
+    def acquire_read(self) -> None:
+        """Wait until no writer holds or waits for the lock, then take the read side"""
+        depth = getattr(self._local, 'depth', 0)
+        if depth:
+            self._local.depth = depth + 1
+            return
+        if self._writer == threading.get_ident():
+            # Reading under our own write lock needs no reader slot
+            self._local.depth, self._local.counted = 1, False
+            return
+        with self._condition:
+            while self._writer is not None or self._waiting_writers:
+                self._condition.wait()
+            self._readers += 1
+        self._local.depth, self._local.counted = 1, True
+    
+    def release_read(self) -> None:
+        """Release the read side taken by this thread"""
+        self._local.depth -= 1
+        if self._local.depth or not self._local.counted:
+            return
+        with self._condition:
+            self._readers -= 1
+            if self._readers == 0:
+                self._condition.notify_all()
+    
+    def acquire_write(self) -> None:
+        """
+        Wait until no other thread holds the lock, then take it exclusively
+        
+        Raises:
+            RuntimeError: If this thread holds only the read side
+        """
+        me = threading.get_ident()
+        with self._condition:
+            if self._writer == me:
+                self._write_depth += 1
+                return
+            if getattr(self._local, 'depth', 0):
+                raise RuntimeError("Cannot take the write lock while holding the read lock")
+            self._waiting_writers += 1
+            try:
+                while self._writer is not None or self._readers:
+                    self._condition.wait()
+            finally:
+                self._waiting_writers -= 1
+            self._writer = me
+            self._write_depth = 1
+    
+    def release_write(self) -> None:
+        """Release one level of the write side held by this thread"""
+        with self._condition:
+            if self._writer != threading.get_ident():
+                raise RuntimeError("Cannot release a write lock held by another thread")
+            self._write_depth -= 1
+            if self._write_depth == 0:
+                self._writer = None
+                self._condition.notify_all()
@@ -0,0 +1,100 @@
+import threading
+from typing import Any, Callable, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+class ModelHolder:
+    """
+    Holds the model currently being served and rebuilds it in the background
+    
+    Readers always get a fully built model (or None) from get(); a new model
+    only becomes visible once swap() replaces the reference in one step.
+    Builds are single-flight: while one is running, further rebuild
+    requests in the same process are ignored.
+    """
+    def __init__(self, builder: Callable[[Callable[[Any], None]], Any], name: str = "model"):
+        """
+        Initialize the holder
+        
+        Args:
+            builder: Callable that builds and returns a new model. It receives
+                a publish callback that can be used to serve an interim model
+                (e.g. a stale or fallback one) while the build continues.
+            name: Name used in log messages and for the worker thread
+        """
+        self.name = name
+        self._builder = builder
+        self._model = None
+        self._version = 0
+        self._lock = threading.Lock()
+        self._build_thread = None
+    
+    def get(self) -> Any:
+        """Return the model currently being served, or None if none is ready"""
+        return self._model
+    
+    @property
+    def version(self) -> int:
+        """Counter incremented every time a new model is swapped in"""
+        return self._version
+    
+    @property
+    def is_building(self) -> bool:
+        """Whether a background build is currently running"""
+        with self._lock:
+            return self._build_thread is not None
+    
+    def swap(self, model: Any) -> None:
+        """Atomically replace the served model"""
+        with self._lock:
+            self._model = model
+            self._version += 1
+        logger.info("Swapped in new %s (version %d)", self.name, self._version)
+    
+    def rebuild_async(self) -> bool:
+        """
+        Start a background build unless one is already running
+        
+        Returns:
+            bool: True if a new build was started, False if one was in flight
+        """
+        with self._lock:
+            if self._build_thread is not None:
+                return False
+            self._build_thread = threading.Thread(
+                target=self._run_build,
+                name=f"{self.name}-builder",
+                daemon=True
+            )
+            self._build_thread.start()
+        logger.info("Started background build of %s", self.name)
+        return True
+    
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait for the running build, if any, to finish
+        
+        Returns:
+            bool: True if no build is running anymore
+        """
+        with self._lock:
+            thread = self._build_thread
+        if thread is not None:
+            thread.join(timeout)
+            return not thread.is_alive()
+        return True
+    
+    def _run_build(self) -> None:
+        """Run the builder and publish its result"""
+        try:
+            model = self._builder(self.swap)
+            if model is not None:
+                self.swap(model)
+            else:
+                logger.warning("Background build of %s produced no model", self.name)
+        except Exception as e:
+            logger.error("Background build of %s failed: %s", self.name, str(e))
+        finally:
+            with self._lock:
+                self._build_thread = None
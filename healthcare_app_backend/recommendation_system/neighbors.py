@@ -0,0 +1,617 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Tuple
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+try:
+    from scipy import sparse
+except ImportError:
+    sparse = None
+
+logger = logging.getLogger(__name__)
+
+def row_norms(matrix) -> np.ndarray:
+    """Euclidean norm of every row of a sparse matrix"""
+    return np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1), dtype=np.float64).ravel())
+
+def normalize_rows(matrix, dtype=np.float32):
+    """
+    L2-normalize every row of a sparse matrix
+    
+    Norms are computed in float64 before casting, so the float32 result
+    has unit rows to within float32 precision. All-zero rows stay zero and
+    therefore have zero similarity to everything.
+    
+    Returns:
+        CSR matrix of the given dtype
+    """
+    matrix = sparse.csr_matrix(matrix, dtype=np.float64)
+    norms = row_norms(matrix)
+    norms[norms == 0] = 1.0
+    return sparse.csr_matrix(sparse.diags(1.0 / norms) @ matrix, dtype=dtype)
+
+def _top_k(block_similarities: np.ndarray, n_neighbors: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Indices and cosine distances of the n_neighbors most similar entries of each row
+    
+    Uses partial selection (argpartition) and only sorts the selected
+    entries, so the cost is linear in the row length rather than n log n.
+    
+    Returns:
+        Tuple of (indices, distances), nearest first
+    """
+    n_columns = block_similarities.shape[1]
+    if n_neighbors < n_columns:
+        candidates = np.argpartition(-block_similarities, n_neighbors - 1, axis=1)[:, :n_neighbors]
+    else:
+        candidates = np.broadcast_to(np.arange(n_columns), block_similarities.shape)
+    candidate_similarities = np.take_along_axis(block_similarities, candidates, axis=1)
+    order = np.argsort(-candidate_similarities, axis=1, kind='stable')
+    distances = 1.0 - np.take_along_axis(candidate_similarities, order, axis=1).astype(np.float64)
+    return np.take_along_axis(candidates, order, axis=1), np.clip(distances, 0.0, 2.0)
+
+def _select_top(columns: np.ndarray, similarities: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    The k most similar (column, similarity) pairs, most similar first
+    
+    Ties go to the lowest column, so the result does not depend on the
+    order of the input.
+    """
+    if k <= 0:
+        return columns[:0], similarities[:0]
+    if len(similarities) > k:
+        threshold = -np.partition(-similarities, k - 1)[k - 1]
+        above = np.flatnonzero(similarities > threshold)
+        tied = np.flatnonzero(similarities == threshold)
+        tied = tied[np.argsort(columns[tied], kind='stable')[:k - len(above)]]
+        keep = np.concatenate((above, tied))
+        columns, similarities = columns[keep], similarities[keep]
+    order = np.lexsort((columns, -similarities))
+    return columns[order], similarities[order]
+
+def _sparse_top_k(columns: np.ndarray, similarities: np.ndarray, n_columns: int, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Top k entries of a sparse similarity row whose missing entries are zero
+    
+    Only the explicit entries are selected from; zero-similarity rows are
+    filled in lowest index first, ahead of negative similarities. Queries
+    that share no feature with most rows therefore cost time proportional
+    to the rows they do share features with.
+    
+    Returns:
+        Tuple of (columns, similarities), k of each, most similar first
+    """
+    nonzero = similarities != 0
+    columns, similarities = columns[nonzero], similarities[nonzero]
+    positive = similarities > 0
+    top_columns, top_similarities = _select_top(columns[positive], similarities[positive], k)
+    need = k - len(top_columns)
+    if need > 0:
+        # The first need + len(columns) rows include at least need zero rows
+        zero_columns = np.setdiff1d(np.arange(min(n_columns, need + len(columns))), columns)[:need]
+        negative_columns, negative_similarities = _select_top(
+            columns[~positive], similarities[~positive], need - len(zero_columns)
+        )
+        top_columns = np.concatenate((top_columns, zero_columns, negative_columns))
+        top_similarities = np.concatenate((top_similarities, np.zeros(len(zero_columns)), negative_similarities))
+    return top_columns.astype(np.int64), top_similarities.astype(np.float64)
+
+# Worker threads shared by every index; scipy's sparse products release the GIL
+_thread_pool = None
+_thread_pool_lock = threading.Lock()
+
+def _get_thread_pool() -> ThreadPoolExecutor:
+    """Create the shared worker pool on first use"""
+    global _thread_pool
+    with _thread_pool_lock:
+        if _thread_pool is None:
+            _thread_pool = ThreadPoolExecutor(max_workers=os.cpu_count() or 1, thread_name_prefix='neighbors')
+        return _thread_pool
+
+def _row_block(matrix, start: int, stop: int):
+    """Rows start:stop of a CSR matrix as a view of its data and indices arrays"""
+    first, last = matrix.indptr[start], matrix.indptr[stop]
+    return sparse.csr_matrix(
+        (matrix.data[first:last], matrix.indices[first:last], matrix.indptr[start:stop + 1] - first),
+        shape=(stop - start, matrix.shape[1]),
+        copy=False
+    )
+
+class NeighborIndex:
+    """
+    Interface of the cosine nearest-neighbor indexes used by DoctorRecommender
+    
+    Indexes expect the rows of the matrix to be L2-normalized (see
+    normalize_rows), so cosine similarity is a plain dot product; queries
+    are normalized by the index. Indexes keep a reference to the feature
+    matrix rather than a copy, and export their own arrays through
+    get_state() so a saved model can be restored (and memory-mapped)
+    without rebuilding the index.
+    """
+    # Name used to select the index and to record it in saved models
+    name = None
+    
+    # Upper bound on the number of dense similarity cells computed at once
+    MAX_BLOCK_CELLS = 1 << 24
+    
+    def __init__(self, **params):
+        self.params = params
+        self.matrix = None
+    
+    def fit(self, matrix) -> 'NeighborIndex':
+        """Index every row of a CSR matrix with L2-normalized rows"""
+        raise NotImplementedError
+    
+    def partial_fit(self, matrix, start_row: int) -> 'NeighborIndex':
+        """
+        Index rows appended to the matrix since the last fit
+        
+        Args:
+            matrix: The full CSR matrix, including the new rows
+            start_row: First row that is not indexed yet
+        """
+        return self.fit(matrix)
+    
+    def kneighbors(self, queries, n_neighbors: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Find the nearest rows of each query by cosine distance
+        
+        Args:
+            queries: CSR matrix with one query per row
+            n_neighbors: Number of neighbors to return per query
+        
+        Returns:
+            Tuple of (distances, indices), each of shape (n_queries, k) with
+            k = min(n_neighbors, rows), ordered from nearest to farthest.
+            Approximate indexes pad missing neighbors with index -1 and an
+            infinite distance.
+        """
+        raise NotImplementedError
+    
+    def get_state(self) -> Dict[str, np.ndarray]:
+        """Arrays needed to restore the index over the same matrix"""
+        return {}
+    
+    def restore(self, matrix, arrays: Dict[str, np.ndarray]) -> 'NeighborIndex':
+        """Restore the index from get_state output; arrays may be memory-mapped"""
+        self.matrix = matrix
+        return self
+    
+    def _score_candidates(self, candidates: np.ndarray, query, n_neighbors: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Exact top neighbors of one normalized query among the given candidate rows"""
+        similarities = (self.matrix[candidates] @ query.T).toarray().T
+        order, distances = _top_k(similarities, min(n_neighbors, len(candidates)))
+        return distances[0], candidates[order[0]]
+
+class BruteForceIndex(NeighborIndex):
+    """
+    Exact cosine nearest-neighbor search over a sparse feature matrix
+    
+    Similarity is a single sparse product of the (normalized) matrix with
+    the normalized queries, followed by partial top-k selection over the
+    rows that share a feature with each query. Unlike
+    sklearn's NearestNeighbors, the index keeps a reference to the matrix
+    instead of copying it, so a matrix loaded with mmap stays shared between
+    all processes that attach to it.
+    
+    Catalogs of at least PARALLEL_MIN_ROWS rows are split into n_jobs row
+    blocks scored on the shared worker threads; each block keeps its own
+    top-k and the block winners are merged.
+    """
+    name = 'brute'
+    
+    # Smallest catalog scored on several threads
+    PARALLEL_MIN_ROWS = 100000
+    
+    def __init__(self, n_jobs: int = None):
+        """
+        Initialize the index
+        
+        Args:
+            n_jobs: Number of row blocks scored in parallel; defaults to the
+                number of CPUs, 1 disables threading
+        """
+        super().__init__(n_jobs=n_jobs)
+        self.n_jobs = n_jobs
+        # Row blocks of the matrix for parallel scoring, built on first use;
+        # concurrent queries build them once
+        self._blocks = None
+        self._blocks_lock = threading.Lock()
+    
+    def fit(self, matrix) -> 'BruteForceIndex':
+        self.matrix = matrix
+        self._blocks = None
+        return self
+    
+    def partial_fit(self, matrix, start_row: int) -> 'BruteForceIndex':
+        return self.fit(matrix)
+    
+    def restore(self, matrix, arrays: Dict[str, np.ndarray]) -> 'BruteForceIndex':
+        return self.fit(matrix)
+    
+    def _row_blocks(self) -> List[Tuple[int, Any]]:
+        """(first row, block) pairs covering the matrix; a single block below PARALLEL_MIN_ROWS"""
+        n_rows = self.matrix.shape[0]
+        n_jobs = self.n_jobs or os.cpu_count() or 1
+        if n_jobs <= 1 or n_rows < self.PARALLEL_MIN_ROWS:
+            return [(0, self.matrix)]
+        blocks = self._blocks
+        if blocks is None:
+            with self._blocks_lock:
+                if self._blocks is None:
+                    bounds = np.linspace(0, n_rows, n_jobs + 1).astype(np.int64)
+                    self._blocks = [
+                        (int(start), _row_block(self.matrix, start, stop))
+                        for start, stop in zip(bounds[:-1], bounds[1:])
+                    ]
+                blocks = self._blocks
+        return blocks
+    
+    def kneighbors(self, queries, n_neighbors: int) -> Tuple[np.ndarray, np.ndarray]:
+        n_rows = self.matrix.shape[0]
+        n_queries = queries.shape[0]
+        n_neighbors = min(n_neighbors, n_rows)
+        distances = np.empty((n_queries, n_neighbors), dtype=np.float64)
+        indices = np.empty((n_queries, n_neighbors), dtype=np.int64)
+        queries = normalize_rows(queries, dtype=self.matrix.dtype)
+        blocks = self._row_blocks()
+        
+        def search_block(block_start: int, block, query_block) -> Tuple[np.ndarray, np.ndarray]:
+            # block @ queries.T keeps the (large) matrix in CSR form, no copy;
+            # the product is sparse, one row per query after transposing
+            similarities = (block @ query_block.T).T.tocsr()
+            k = min(n_neighbors, block.shape[0])
+            block_indices = np.empty((query_block.shape[0], k), dtype=np.int64)
+            block_similarities = np.empty((query_block.shape[0], k), dtype=np.float64)
+            for position in range(query_block.shape[0]):
+                first, last = similarities.indptr[position], similarities.indptr[position + 1]
+                block_indices[position], block_similarities[position] = _sparse_top_k(
+                    similarities.indices[first:last], similarities.data[first:last], block.shape[0], k
+                )
+            return block_indices + block_start, block_similarities
+        
+        query_block_size = max(1, self.MAX_BLOCK_CELLS // max(n_rows, 1))
+        for start in range(0, n_queries, query_block_size):
+            stop = min(start + query_block_size, n_queries)
+            query_block = queries[start:stop]
+            if len(blocks) == 1:
+                block_indices, similarities = search_block(0, self.matrix, query_block)
+            else:
+                # Keep the top-k of every row block, then select among the winners
+                results = list(_get_thread_pool().map(
+                    lambda item: search_block(item[0], item[1], query_block),
+                    blocks
+                ))
+                candidates = np.hstack([result_indices for result_indices, _ in results])
+                candidate_similarities = np.hstack([result_similarities for _, result_similarities in results])
+                block_indices = np.empty((stop - start, n_neighbors), dtype=np.int64)
+                similarities = np.empty((stop - start, n_neighbors), dtype=np.float64)
+                for position in range(stop - start):
+                    block_indices[position], similarities[position] = _select_top(
+                        candidates[position], candidate_similarities[position], n_neighbors
+                    )
+            indices[start:stop] = block_indices
+            distances[start:stop] = np.clip(1.0 - similarities, 0.0, 2.0)
+        
+        return distances, indices
+
+class IVFIndex(NeighborIndex):
+    """
+    Approximate cosine search with an inverted-file (IVF) index
+    
+    Rows are clustered with spherical k-means into n_lists inverted lists.
+    A query is compared with the list centroids and only the rows of the
+    n_probe closest lists are scored exactly, so query time grows with
+    n_probe / n_lists of the catalog instead of all of it. Raising n_probe
+    trades latency for recall; evaluate_recall measures the trade-off.
+    
+    Rows appended with partial_fit are scored exactly by every query until
+    the next fit() assigns them to lists.
+    """
+    name = 'ivf'
+    
+    def __init__(
+        self,
+        n_lists: int = None,
+        n_probe: int = 8,
+        training_sample: int = 50000,
+        n_iterations: int = 10,
+        seed: int = 0
+    ):
+        """
+        Initialize the index
+        
+        Args:
+            n_lists: Number of clusters; defaults to sqrt(rows), and is
+                capped at the number of training rows
+            n_probe: Number of closest clusters scanned per query
+            training_sample: Maximum number of rows used to train the centroids
+            n_iterations: Number of k-means iterations
+            seed: Seed for sampling rows and initial centroids
+        """
+        super().__init__(
+            n_lists=n_lists,
+            n_probe=n_probe,
+            training_sample=training_sample,
+            n_iterations=n_iterations,
+            seed=seed
+        )
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.training_sample = training_sample
+        self.n_iterations = n_iterations
+        self.seed = seed
+        self.centroids = None
+        # Inverted lists in CSR layout: list i holds list_rows[list_offsets[i]:list_offsets[i + 1]]
+        self.list_offsets = None
+        self.list_rows = None
+        # Rows from this one on are not in the inverted lists yet
+        self.unindexed_start = 0
+    
+    def fit(self, matrix) -> 'IVFIndex':
+        self.matrix = matrix
+        n_rows = matrix.shape[0]
+        
+        rng = np.random.default_rng(self.seed)
+        sample = np.sort(rng.choice(n_rows, min(n_rows, self.training_sample), replace=False))
+        # Every initial centroid is a distinct sample row
+        n_lists = min(self.n_lists or max(1, int(np.sqrt(n_rows))), len(sample))
+        normalized = matrix[sample]
+        centroids = normalized[rng.choice(len(sample), n_lists, replace=False)].toarray()
+        
+        # Spherical k-means: assign by cosine, then renormalize the cluster sums
+        for _ in range(self.n_iterations):
+            assignments = self._nearest_centroids(normalized, centroids)
+            membership = sparse.csr_matrix(
+                (np.ones(len(sample)), (assignments, np.arange(len(sample)))),
+                shape=(n_lists, len(sample))
+            )
+            sums = np.asarray((membership @ normalized).todense())
+            norms = np.linalg.norm(sums, axis=1)
+            filled = norms > 0
+            # Empty clusters keep their previous centroid
+            centroids[filled] = sums[filled] / norms[filled, None]
+        
+        self.centroids = centroids
+        assignments = self._nearest_centroids(matrix, centroids)
+        self.list_rows = np.argsort(assignments, kind='stable').astype(np.int64)
+        self.list_offsets = np.concatenate(([0], np.cumsum(np.bincount(assignments, minlength=n_lists)))).astype(np.int64)
+        self.unindexed_start = n_rows
+        logger.info("Built IVF index with %d lists over %d rows", n_lists, n_rows)
+        return self
+    
+    def partial_fit(self, matrix, start_row: int) -> 'IVFIndex':
+        """
+        Accept rows appended since the last fit without touching the lists
+        
+        Re-sorting the lists would cost O(rows) per update; the new rows are
+        instead scored alongside the probed lists until the next fit().
+        """
+        self.matrix = matrix
+        self.unindexed_start = min(self.unindexed_start, start_row)
+        return self
+    
+    def _nearest_centroids(self, rows, centroids: np.ndarray) -> np.ndarray:
+        """Index of the most similar centroid of every row, computed in blocks"""
+        centroids = self._match_width(centroids, rows.shape[1])
+        block_size = max(1, self.MAX_BLOCK_CELLS // len(centroids))
+        assignments = np.empty(rows.shape[0], dtype=np.int64)
+        for start in range(0, rows.shape[0], block_size):
+            similarities = rows[start:start + block_size] @ centroids.T
+            assignments[start:start + block_size] = np.asarray(similarities).argmax(axis=1)
+        return assignments
+    
+    def _match_width(self, centroids: np.ndarray, width: int) -> np.ndarray:
+        """Pad centroids with zeros for feature columns added after training"""
+        if centroids.shape[1] >= width:
+            return centroids
+        return np.hstack((centroids, np.zeros((len(centroids), width - centroids.shape[1]))))
+    
+    def kneighbors(self, queries, n_neighbors: int) -> Tuple[np.ndarray, np.ndarray]:
+        n_queries = queries.shape[0]
+        n_neighbors = min(n_neighbors, self.matrix.shape[0])
+        distances = np.full((n_queries, n_neighbors), np.inf)
+        indices = np.full((n_queries, n_neighbors), -1, dtype=np.int64)
+        queries = normalize_rows(queries, dtype=self.matrix.dtype)
+        
+        n_lists = len(self.centroids)
+        n_probe = min(self.n_probe, n_lists)
+        centroids = self._match_width(self.centroids, queries.shape[1])
+        centroid_similarities = np.asarray(queries @ centroids.T)
+        if n_probe < n_lists:
+            probes = np.argpartition(-centroid_similarities, n_probe - 1, axis=1)[:, :n_probe]
+        else:
+            probes = np.broadcast_to(np.arange(n_lists), (n_queries, n_lists))
+        
+        unindexed = np.arange(self.unindexed_start, self.matrix.shape[0], dtype=np.int64)
+        for position in range(n_queries):
+            candidates = np.concatenate([unindexed] + [
+                self.list_rows[self.list_offsets[probe]:self.list_offsets[probe + 1]]
+                for probe in probes[position]
+            ])
+            if len(candidates) == 0:
+                continue
+            candidates.sort()
+            row_distances, row_indices = self._score_candidates(candidates, queries[position], n_neighbors)
+            distances[position, :len(row_indices)] = row_distances
+            indices[position, :len(row_indices)] = row_indices
+        
+        return distances, indices
+    
+    def get_state(self) -> Dict[str, np.ndarray]:
+        return {
+            'centroids': self.centroids,
+            'list_offsets': self.list_offsets,
+            'list_rows': self.list_rows,
+            'unindexed_start': np.array([self.unindexed_start], dtype=np.int64),
+        }
+    
+    def restore(self, matrix, arrays: Dict[str, np.ndarray]) -> 'IVFIndex':
+        super().restore(matrix, arrays)
+        self.centroids = arrays['centroids']
+        self.list_offsets = arrays['list_offsets']
+        self.list_rows = arrays['list_rows']
+        self.unindexed_start = int(arrays['unindexed_start'][0])
+        return self
+
+class InvertedIndex(NeighborIndex):
+    """
+    Approximate cosine search over impact-ordered posting lists
+    
+    Every feature column keeps a posting list of the rows that use it,
+    ordered by the column's contribution to cosine similarity (the
+    normalized value). A query only gathers the first max(depth,
+    n_neighbors) rows of the postings of its own columns and scores those
+    exactly, so query time depends on depth and the number of query
+    columns, not on the catalog size. Gathering at least n_neighbors rows
+    per column keeps one-hot queries exact and lets a search for more
+    neighbors reach farther down the postings; for multi-column queries a
+    larger depth raises recall. Query weights are assumed to be non-negative.
+    
+    Rows appended with partial_fit are always scored exactly until the next
+    fit() merges them into the postings.
+    """
+    name = 'inverted'
+    
+    def __init__(self, depth: int = 256):
+        """
+        Initialize the index
+        
+        Args:
+            depth: Least number of leading rows taken from each query
+                column's posting list; searches for more neighbors take that
+                many rows instead
+        """
+        super().__init__(depth=depth)
+        self.depth = depth
+        # Postings in CSR layout: column j holds posting_rows[posting_offsets[j]:posting_offsets[j + 1]]
+        self.posting_offsets = None
+        self.posting_rows = None
+        # Rows from this one on are not in the postings yet
+        self.unindexed_start = 0
+    
+    def fit(self, matrix) -> 'InvertedIndex':
+        self.matrix = matrix
+        
+        by_column = sparse.csc_matrix(matrix)
+        rows = by_column.indices.astype(np.int64)
+        impacts = by_column.data
+        columns = np.repeat(np.arange(by_column.shape[1]), np.diff(by_column.indptr))
+        # Within each column, highest impact first (ties by row)
+        order = np.lexsort((rows, -impacts, columns))
+        self.posting_rows = rows[order]
+        self.posting_offsets = by_column.indptr.astype(np.int64)
+        self.unindexed_start = matrix.shape[0]
+        return self
+    
+    def partial_fit(self, matrix, start_row: int) -> 'InvertedIndex':
+        self.matrix = matrix
+        self.unindexed_start = min(self.unindexed_start, start_row)
+        return self
+    
+    def kneighbors(self, queries, n_neighbors: int) -> Tuple[np.ndarray, np.ndarray]:
+        n_rows = self.matrix.shape[0]
+        n_queries = queries.shape[0]
+        n_neighbors = min(n_neighbors, n_rows)
+        distances = np.full((n_queries, n_neighbors), np.inf)
+        indices = np.full((n_queries, n_neighbors), -1, dtype=np.int64)
+        queries = normalize_rows(queries, dtype=self.matrix.dtype)
+        n_columns = len(self.posting_offsets) - 1
+        unindexed = np.arange(self.unindexed_start, n_rows, dtype=np.int64)
+        # A shallower cut would return fewer than n_neighbors rows while the
+        # postings hold more, which callers take for an exhausted index
+        depth = max(self.depth, n_neighbors)
+        
+        for position in range(n_queries):
+            columns = queries.indices[queries.indptr[position]:queries.indptr[position + 1]]
+            columns = columns[columns < n_columns]
+            candidates = np.unique(np.concatenate([unindexed] + [
+                self.posting_rows[self.posting_offsets[column]:min(
+                    self.posting_offsets[column] + depth,
+                    self.posting_offsets[column + 1]
+                )]
+                for column in columns
+            ]))
+            if len(candidates) == 0:
+                continue
+            
+            row_distances, row_indices = self._score_candidates(candidates, queries[position], n_neighbors)
+            distances[position, :len(row_indices)] = row_distances
+            indices[position, :len(row_indices)] = row_indices
+        
+        return distances, indices
+    
+    def get_state(self) -> Dict[str, np.ndarray]:
+        return {
+            'posting_offsets': self.posting_offsets,
+            'posting_rows': self.posting_rows,
+            'unindexed_start': np.array([self.unindexed_start], dtype=np.int64),
+        }
+    
+    def restore(self, matrix, arrays: Dict[str, np.ndarray]) -> 'InvertedIndex':
+        super().restore(matrix, arrays)
+        self.posting_offsets = arrays['posting_offsets']
+        self.posting_rows = arrays['posting_rows']
+        self.unindexed_start = int(arrays['unindexed_start'][0])
+        return self
+
+# Index backends selectable by name
+INDEX_TYPES = {
+    BruteForceIndex.name: BruteForceIndex,
+    IVFIndex.name: IVFIndex,
+    InvertedIndex.name: InvertedIndex,
+}
+
+def create_index(name: str = 'brute', params: Dict[str, Any] = None) -> NeighborIndex:
+    """Create a nearest-neighbor index by backend name"""
+    if name not in INDEX_TYPES:
+        raise ValueError(f"Unknown neighbor index '{name}', expected one of {sorted(INDEX_TYPES)}")
+    return INDEX_TYPES[name](**(params or {}))
+
+def evaluate_recall(index: NeighborIndex, queries, n_neighbors: int, max_distance: float = 1.0) -> Dict[str, float]:
+    """
+    Measure the recall and speed of an index against exact brute-force search
+    
+    Only exact neighbors closer than max_distance count as relevant, so
+    rows with zero similarity (which any order may return) are ignored.
+    Ties are handled by distance: an approximate result counts as a hit if
+    it is no farther than the farthest relevant exact neighbor.
+    
+    Args:
+        index: A fitted index
+        queries: CSR matrix with one query per row
+        n_neighbors: Number of neighbors to compare
+        max_distance: Exact neighbors at or beyond this distance are ignored
+    
+    Returns:
+        Dictionary with the mean recall and per-query latency of both searches
+    """
+    reference = BruteForceIndex().restore(index.matrix, {})
+    
+    start = time.perf_counter()
+    distances, _ = index.kneighbors(queries, n_neighbors)
+    index_seconds = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    exact_distances, _ = reference.kneighbors(queries, n_neighbors)
+    brute_seconds = time.perf_counter() - start
+    
+    recalls = []
+    for row_distances, row_exact in zip(distances, exact_distances):
+        relevant = row_exact[row_exact < max_distance]
+        if len(relevant) == 0:
+            continue
+        hits = int(np.sum(row_distances <= relevant[-1] + 1e-9))
+        recalls.append(min(hits, len(relevant)) / len(relevant))
+    
+    n_queries = max(queries.shape[0], 1)
+    return {
+        'recall': float(np.mean(recalls)) if recalls else 1.0,
+        'evaluated_queries': len(recalls),
+        'n_neighbors': n_neighbors,
+        'index_ms_per_query': index_seconds / n_queries * 1000,
+        'brute_ms_per_query': brute_seconds / n_queries * 1000,
+    }
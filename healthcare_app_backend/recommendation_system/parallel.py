@@ -0,0 +1,64 @@
+import itertools
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Iterable, Iterator, List, Tuple
+
+import numpy as np
+
+# Worker processes are spawned rather than forked: models are trained in a
+# background thread of the web workers, and a fork would copy the other
+# threads' locks in whatever state they happen to be
+START_METHOD = 'spawn'
+
+def resolve_jobs(n_jobs: int = None) -> int:
+    """Number of worker processes for an n_jobs setting; None means one per CPU"""
+    if n_jobs is None:
+        return os.cpu_count() or 1
+    return max(int(n_jobs), 1)
+
+def process_map(function: Callable[[Any], Any], items: Iterable[Any], n_jobs: int) -> Iterator[Any]:
+    """
+    Apply a function to every item on a pool of worker processes
+    
+    Results are yielded in item order. At most two items per worker are in
+    flight, so a generator of items (e.g. chunks read from the database) is
+    consumed as fast as the workers keep up rather than all at once. With
+    n_jobs <= 1 or a single item, everything runs in this process and no
+    pool is started.
+    
+    Args:
+        function: Picklable module-level function
+        items: Picklable items
+        n_jobs: Number of worker processes
+    """
+    items = iter(items)
+    head = list(itertools.islice(items, 2))
+    if n_jobs <= 1 or len(head) < 2:
+        for item in itertools.chain(head, items):
+            yield function(item)
+        return
+    
+    context = multiprocessing.get_context(START_METHOD)
+    with ProcessPoolExecutor(max_workers=n_jobs, mp_context=context) as executor:
+        pending = deque()
+        for item in itertools.chain(head, items):
+            pending.append(executor.submit(function, item))
+            if len(pending) >= 2 * n_jobs:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def shard_bounds(n_rows: int, n_shards: int, align: int = 64) -> List[Tuple[int, int]]:
+    """
+    Split rows into at most n_shards contiguous (start, stop) ranges of similar size
+    
+    Every shard but the last starts and stops at a multiple of align, so
+    bitsets packed per shard can be concatenated word by word.
+    """
+    n_blocks = (n_rows + align - 1) // align
+    n_shards = max(min(n_shards, n_blocks), 1)
+    block_bounds = np.linspace(0, n_blocks, n_shards + 1).astype(np.int64)
+    bounds = np.minimum(block_bounds * align, n_rows).tolist()
+    return [(start, stop) for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start] or [(0, n_rows)]
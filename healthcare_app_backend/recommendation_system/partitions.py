@@ -0,0 +1,154 @@
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+try:
+    from scipy import sparse
+except ImportError:
+    sparse = None
+
+from .buffers import AppendBuffers
+from .neighbors import NeighborIndex, create_index
+
+def specialization_key(specialization: Any) -> str:
+    """Normalized partition key of a specialization, or None if there is none"""
+    if not isinstance(specialization, str):
+        return None
+    return specialization.strip().lower() or None
+
+class SpecializationPartition:
+    """
+    The feature rows of one specialization with their own neighbor index
+    
+    A specialization-scoped query only searches its partition, so it costs
+    time proportional to that specialization rather than the whole catalog
+    and every returned neighbor is a doctor of the requested specialization.
+    The partition keeps its own copy of its feature rows (all partitions
+    together hold one extra copy of the feature matrix) so the index can
+    work on a contiguous matrix.
+    """
+    def __init__(self, rows: np.ndarray, matrix, index: NeighborIndex):
+        """
+        Initialize the partition
+        
+        Args:
+            rows: Rows of the full feature matrix held by the partition, in order
+            matrix: CSR matrix of those feature rows
+            index: Neighbor index fitted on matrix
+        """
+        self.rows = rows
+        self.matrix = matrix
+        self.index = index
+        # Spare capacity of the rows and matrix arrays grown by append
+        self._buffers = AppendBuffers()
+    
+    @classmethod
+    def build(cls, feature_matrix, rows: np.ndarray, index_type: str, index_params: Dict[str, Any]) -> 'SpecializationPartition':
+        """Copy the given rows of the feature matrix and index them"""
+        rows = np.asarray(rows, dtype=np.int64)
+        matrix = feature_matrix[rows]
+        return cls(rows, matrix, create_index(index_type, index_params).fit(matrix))
+    
+    def widen(self, width: int) -> None:
+        """
+        Add empty feature columns so the partition accepts queries of the given width
+        
+        This changes the partition, so DoctorRecommender widens every
+        partition under its write lock as soon as the vocabulary grows,
+        rather than on a query.
+        """
+        if self.matrix.shape[1] >= width:
+            return
+        self.matrix = sparse.csr_matrix(
+            (self.matrix.data, self.matrix.indices, self.matrix.indptr),
+            shape=(self.matrix.shape[0], width),
+            copy=False
+        )
+        # Re-point the index at the widened matrix; there are no new rows
+        self.index.partial_fit(self.matrix, self.matrix.shape[0])
+    
+    def append(self, row: int, feature_row) -> None:
+        """
+        Add a row appended to the full feature matrix
+        
+        Args:
+            row: Row index in the full feature matrix
+            feature_row: 1-row CSR matrix with the row's features
+        """
+        self.widen(feature_row.shape[1])
+        self.matrix = self._buffers.append_csr_rows('matrix', self.matrix, feature_row)
+        self.rows = self._buffers.append('rows', self.rows, row, np.int64)
+        self.index.partial_fit(self.matrix, self.matrix.shape[0] - 1)
+    
+    def kneighbors(self, queries, n_neighbors: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Nearest partition rows of each query
+        
+        Args:
+            queries: CSR matrix with one query per row, no wider than the partition
+            n_neighbors: Number of neighbors to return per query
+        
+        Returns:
+            Tuple of (distances, indices) as returned by the index, with
+            indices into the partition (see rows); padding stays -1
+        """
+        return self.index.kneighbors(queries, n_neighbors=n_neighbors)
+    
+    def get_state(self) -> Dict[str, np.ndarray]:
+        """Arrays needed to restore the partition without refitting its index"""
+        arrays = {
+            'rows': self.rows,
+            'data': self.matrix.data,
+            'indices': self.matrix.indices,
+            'indptr': self.matrix.indptr,
+        }
+        arrays.update({f'index_{name}': array for name, array in self.index.get_state().items()})
+        return arrays
+    
+    @classmethod
+    def from_state(
+        cls,
+        arrays: Dict[str, np.ndarray],
+        shape: List[int],
+        index_type: str,
+        index_params: Dict[str, Any]
+    ) -> 'SpecializationPartition':
+        """Rebuild a partition from get_state output; arrays may be memory-mapped"""
+        matrix = sparse.csr_matrix(
+            (arrays['data'], arrays['indices'], arrays['indptr']),
+            shape=tuple(shape),
+            copy=False
+        )
+        index = create_index(index_type, index_params).restore(
+            matrix,
+            {name[len('index_'):]: array for name, array in arrays.items() if name.startswith('index_')}
+        )
+        return cls(arrays['rows'], matrix, index)
+
+def build_partitions(
+    feature_matrix,
+    specializations: List[Any],
+    index_type: str,
+    index_params: Dict[str, Any]
+) -> Dict[str, SpecializationPartition]:
+    """
+    Partition the rows of a feature matrix by specialization
+    
+    Args:
+        feature_matrix: CSR feature matrix with one row per doctor
+        specializations: Specialization of every row; rows without one are
+            not placed in any partition
+        index_type: Neighbor index backend of every partition
+        index_params: Tuning parameters of the backend
+    
+    Returns:
+        Dictionary of partition key -> partition
+    """
+    rows_by_key = {}
+    for row, specialization in enumerate(specializations):
+        key = specialization_key(specialization)
+        if key is not None:
+            rows_by_key.setdefault(key, []).append(row)
+    return {
+        key: SpecializationPartition.build(feature_matrix, rows, index_type, index_params)
+        for key, rows in rows_by_key.items()
+    }
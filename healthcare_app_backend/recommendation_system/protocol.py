@@ -0,0 +1,174 @@
+import numbers
+import struct
+from typing import Any, BinaryIO, Optional, Tuple
+
+# Wire protocol between the recommender server and its clients. Both sides
+# exchange frames of a fixed header (payload length, request id, kind)
+# followed by one encoded value. Replies carry the id of their request, so
+# a client may send many requests on a connection before reading any reply.
+# Only the standard library is used, so clients stay lightweight.
+
+HEADER = struct.Struct('!IIB')
+# Largest payload accepted, guarding against a corrupt length
+MAX_PAYLOAD = 64 * 1024 * 1024
+
+# Request kinds: the recommender method a request calls, with its keyword
+# arguments as the payload
+METHODS = {
+    1: 'recommend_many',
+    2: 'recommend_with_facets',
+    3: 'filter_doctors',
+    4: 'cache_stats',
+    5: 'model_version',
+}
+METHOD_KINDS = {method: kind for kind, method in METHODS.items()}
+
+# Reply kinds; every reply but REPLY_OK carries an error message
+REPLY_OK = 0x80
+# The request was malformed, e.g. an invalid filter expression
+REPLY_INVALID = 0x81
+# The server has no model loaded yet
+REPLY_UNAVAILABLE = 0x82
+REPLY_ERROR = 0x83
+
+# Value tags
+_NONE, _TRUE, _FALSE = b'N', b'T', b'F'
+_INT, _FLOAT, _STR, _LIST, _MAP = b'i', b'd', b's', b'l', b'm'
+
+_INT64 = struct.Struct('!q')
+_FLOAT64 = struct.Struct('!d')
+_LENGTH = struct.Struct('!I')
+
+class ProtocolError(Exception):
+    """A frame or value could not be encoded or decoded"""
+
+def _encode_into(buffer: bytearray, value: Any) -> None:
+    """Append the encoding of one value to buffer"""
+    if value is None:
+        buffer += _NONE
+    elif value is True:
+        buffer += _TRUE
+    elif value is False:
+        buffer += _FALSE
+    elif isinstance(value, str):
+        data = value.encode('utf-8')
+        buffer += _STR
+        buffer += _LENGTH.pack(len(data))
+        buffer += data
+    elif isinstance(value, numbers.Integral):
+        try:
+            packed = _INT64.pack(int(value))
+        except struct.error:
+            raise ProtocolError(f"Integer out of range: {value}")
+        buffer += _INT
+        buffer += packed
+    elif isinstance(value, numbers.Real):
+        buffer += _FLOAT
+        buffer += _FLOAT64.pack(float(value))
+    elif isinstance(value, dict):
+        buffer += _MAP
+        buffer += _LENGTH.pack(len(value))
+        for key, item in value.items():
+            _encode_into(buffer, key)
+            _encode_into(buffer, item)
+    elif isinstance(value, (list, tuple)):
+        buffer += _LIST
+        buffer += _LENGTH.pack(len(value))
+        for item in value:
+            _encode_into(buffer, item)
+    else:
+        raise ProtocolError(f"Cannot encode value of type {type(value).__name__}")
+
+def encode(value: Any) -> bytes:
+    """
+    Encode a value built from None, bools, ints, floats, strings, lists and dicts
+    
+    Tuples are encoded as lists; numpy scalars as the matching Python number.
+    
+    Raises:
+        ProtocolError: If the value holds another type or an integer beyond 64 bits
+    """
+    buffer = bytearray()
+    _encode_into(buffer, value)
+    return bytes(buffer)
+
+def _decode_from(data: memoryview, offset: int) -> Tuple[Any, int]:
+    """Decode the value starting at offset; returns it and the offset after it"""
+    tag = bytes(data[offset:offset + 1])
+    offset += 1
+    if tag == _NONE:
+        return None, offset
+    if tag == _TRUE:
+        return True, offset
+    if tag == _FALSE:
+        return False, offset
+    if tag == _INT:
+        return _INT64.unpack_from(data, offset)[0], offset + _INT64.size
+    if tag == _FLOAT:
+        return _FLOAT64.unpack_from(data, offset)[0], offset + _FLOAT64.size
+    if tag in (_STR, _LIST, _MAP):
+        (length,) = _LENGTH.unpack_from(data, offset)
+        offset += _LENGTH.size
+        if tag == _STR:
+            if offset + length > len(data):
+                raise ProtocolError("Truncated string")
+            return str(data[offset:offset + length], 'utf-8'), offset + length
+        if tag == _LIST:
+            items = []
+            for _ in range(length):
+                item, offset = _decode_from(data, offset)
+                items.append(item)
+            return items, offset
+        mapping = {}
+        for _ in range(length):
+            key, offset = _decode_from(data, offset)
+            mapping[key], offset = _decode_from(data, offset)
+        return mapping, offset
+    raise ProtocolError(f"Unknown value tag {tag!r}")
+
+def decode(data: bytes) -> Any:
+    """
+    Decode a value written by encode
+    
+    Raises:
+        ProtocolError: If the data is truncated, malformed or has trailing bytes
+    """
+    view = memoryview(data)
+    try:
+        value, offset = _decode_from(view, 0)
+    except (struct.error, UnicodeDecodeError, TypeError) as e:
+        raise ProtocolError(f"Malformed value: {e}")
+    if offset != len(view):
+        raise ProtocolError("Trailing bytes after value")
+    return value
+
+def pack_frame(request_id: int, kind: int, value: Any) -> bytes:
+    """Frame of one request or reply, ready to be written to the socket"""
+    payload = encode(value)
+    if len(payload) > MAX_PAYLOAD:
+        raise ProtocolError(f"Payload of {len(payload)} bytes exceeds {MAX_PAYLOAD}")
+    return HEADER.pack(len(payload), request_id, kind) + payload
+
+def read_frame(stream: BinaryIO) -> Optional[Tuple[int, int, Any]]:
+    """
+    Read one frame from a buffered binary stream
+    
+    Returns:
+        Tuple of (request id, kind, decoded value), or None if the stream
+        ended cleanly before a new frame
+    
+    Raises:
+        ProtocolError: If the stream ends inside a frame or the frame is malformed
+    """
+    header = stream.read(HEADER.size)
+    if not header:
+        return None
+    if len(header) < HEADER.size:
+        raise ProtocolError("Connection closed inside a frame header")
+    length, request_id, kind = HEADER.unpack(header)
+    if length > MAX_PAYLOAD:
+        raise ProtocolError(f"Payload of {length} bytes exceeds {MAX_PAYLOAD}")
+    payload = stream.read(length)
+    if len(payload) < length:
+        raise ProtocolError("Connection closed inside a frame payload")
+    return request_id, kind, decode(payload)
@@ -1,4 +1,5 @@
 import os
+import shutil
 import logging
 from .utils import get_model_path
 
@@ -6,15 +7,20 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 def reset_model():
-    """Delete the existing model file to force retraining"""
+    """Delete the existing model artifact to force retraining"""
     try:
         model_path = get_model_path()
+        # Pickles written before the versioned artifact format
+        legacy_path = f"{model_path}.pkl"
+        if os.path.exists(legacy_path):
+            os.remove(legacy_path)
+            logger.info(f"Deleted legacy model file: {legacy_path}")
         if os.path.exists(model_path):
-            os.remove(model_path)
-            logger.info(f"Successfully deleted model file: {model_path}")
+            shutil.rmtree(model_path)
+            logger.info(f"Successfully deleted model artifact: {model_path}")
             return True
         else:
-            logger.info(f"No model file found at: {model_path}")
+            logger.info(f"No model artifact found at: {model_path}")
             return False
     except Exception as e:
         logger.error(f"Error resetting model: {str(e)}")
@@ -0,0 +1,60 @@
+from collections import OrderedDict
+from typing import Any, Dict, Hashable
+import threading
+
+class ResultCache:
+    """
+    Bounded LRU cache of recommendation results with hit/miss counters
+    
+    Each model instance owns its cache, so swapping in a new model starts
+    from an empty cache; incremental updates clear it explicitly.
+    """
+    def __init__(self, max_entries: int = 1024):
+        """
+        Initialize the cache
+        
+        Args:
+            max_entries: Number of results kept before the least recently
+                used one is evicted
+        """
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key: Hashable) -> Any:
+        """Return the cached value for key (marking it recently used), or None"""
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+    
+    def put(self, key: Hashable, value: Any) -> None:
+        """Cache a value, evicting the least recently used entries beyond max_entries"""
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def clear(self) -> None:
+        """Drop every cached value; the counters are kept"""
+        with self._lock:
+            self._entries.clear()
+    
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and current size"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'size': len(self._entries),
+                'max_entries': self.max_entries,
+            }
@@ -0,0 +1,221 @@
+import argparse
+import os
+import signal
+import socket
+import socketserver
+import stat
+import threading
+from typing import Any, Callable, Tuple
+import logging
+
+from .model_holder import ModelHolder
+from .protocol import (
+    METHODS,
+    REPLY_ERROR,
+    REPLY_INVALID,
+    REPLY_OK,
+    REPLY_UNAVAILABLE,
+    ProtocolError,
+    pack_frame,
+    read_frame,
+)
+from .utils import get_current_version, get_model_path, load_model
+
+logger = logging.getLogger(__name__)
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    """
+    Answers the requests of one client connection
+    
+    Requests are read and answered in order; a client may pipeline several
+    before reading the replies, which carry their request ids.
+    """
+    def handle(self) -> None:
+        server = self.server.recommender_server
+        server.track_connection(self.request, True)
+        try:
+            self._answer_requests(server)
+        finally:
+            server.track_connection(self.request, False)
+    
+    def _answer_requests(self, server: 'RecommenderServer') -> None:
+        """Answer requests until the client disconnects"""
+        while True:
+            try:
+                frame = read_frame(self.rfile)
+            except ProtocolError as e:
+                logger.warning("Dropping recommender client: %s", str(e))
+                return
+            except OSError:
+                return
+            if frame is None:
+                return
+            request_id, kind, arguments = frame
+            reply_kind, value = server.dispatch(kind, arguments)
+            try:
+                reply = pack_frame(request_id, reply_kind, value)
+            except ProtocolError as e:
+                reply = pack_frame(request_id, REPLY_ERROR, f"Reply could not be encoded: {e}")
+            try:
+                self.wfile.write(reply)
+            except OSError:
+                return
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+class RecommenderServer:
+    """
+    Serves a saved recommender model to other processes over a Unix domain socket
+    
+    The model published by `manage.py build_recommender` is memory-mapped
+    once in this process and answers requests from RecommenderClient (see
+    protocol for the wire format), so web workers need neither the model
+    nor numpy, pandas and scikit-learn. Newly published versions are picked
+    up within poll_seconds; requests keep being answered by the previous
+    version while the new one loads.
+    """
+    def __init__(
+        self,
+        socket_path: str,
+        model_path: str = None,
+        poll_seconds: float = 5.0,
+        loader: Callable[[str], Any] = load_model
+    ):
+        """
+        Initialize the server
+        
+        Args:
+            socket_path: Path of the Unix domain socket to listen on
+            model_path: Artifact directory of the served model; get_model_path() by default
+            poll_seconds: Seconds between checks for a newly published model
+            loader: Function loading the model from its artifact directory
+        """
+        self.socket_path = socket_path
+        self.model_path = model_path or get_model_path()
+        self.poll_seconds = poll_seconds
+        self._loader = loader
+        self.holder = ModelHolder(self._load_model, name="served recommender")
+        self._server = None
+        self._stopped = threading.Event()
+        # Open client connections, closed when the server stops
+        self._connections = set()
+        self._connections_lock = threading.Lock()
+    
+    def _load_model(self, publish: Callable[[Any], None]) -> Any:
+        """Builder of the model holder: load the published model"""
+        return self._loader(self.model_path)
+    
+    def _watch_model(self) -> None:
+        """Reload the model whenever a new version is published, until the server stops"""
+        while True:
+            model = self.holder.get()
+            published_version = get_current_version(self.model_path)
+            if model is None or (
+                published_version is not None
+                and published_version != getattr(model, 'artifact_version', None)
+            ):
+                self.holder.rebuild_async()
+            if self._stopped.wait(self.poll_seconds):
+                return
+    
+    def track_connection(self, connection: socket.socket, is_open: bool) -> None:
+        """Register a client connection as it opens, and forget it as it closes"""
+        with self._connections_lock:
+            if is_open:
+                self._connections.add(connection)
+            else:
+                self._connections.discard(connection)
+    
+    def dispatch(self, kind: int, arguments: Any) -> Tuple[int, Any]:
+        """
+        Answer one request
+        
+        Args:
+            kind: Request kind, see protocol.METHODS
+            arguments: Keyword arguments of the method
+        
+        Returns:
+            Tuple of (reply kind, reply value)
+        """
+        method = METHODS.get(kind)
+        if method is None:
+            return REPLY_ERROR, f"Unknown request kind {kind}"
+        if not isinstance(arguments, dict):
+            return REPLY_ERROR, "Request arguments must be a map"
+        
+        model = self.holder.get()
+        if model is None:
+            return REPLY_UNAVAILABLE, "No recommender model is loaded yet"
+        
+        try:
+            if method == 'model_version':
+                return REPLY_OK, model.artifact_version
+            return REPLY_OK, getattr(model, method)(**arguments)
+        except ValueError as e:
+            # Malformed filter expressions and query weights
+            return REPLY_INVALID, str(e)
+        except Exception as e:
+            logger.error("Error answering %s: %s", method, str(e))
+            return REPLY_ERROR, str(e)
+    
+    def serve_forever(self) -> None:
+        """Listen on the socket and answer requests until shutdown() is called"""
+        # A socket file left behind by a previous server would make bind fail
+        try:
+            if stat.S_ISSOCK(os.stat(self.socket_path).st_mode):
+                os.unlink(self.socket_path)
+        except FileNotFoundError:
+            pass
+        
+        self._server = _UnixServer(self.socket_path, _RequestHandler)
+        self._server.recommender_server = self
+        threading.Thread(target=self._watch_model, name="recommender-model-watcher", daemon=True).start()
+        logger.info("Serving recommender %s on %s", self.model_path, self.socket_path)
+        try:
+            self._server.serve_forever()
+        finally:
+            self._stopped.set()
+            self._server.server_close()
+            # Handler threads end once their clients see the connection close
+            with self._connections_lock:
+                for connection in self._connections:
+                    try:
+                        connection.shutdown(socket.SHUT_RDWR)
+                    except OSError:
+                        pass
+            try:
+                os.unlink(self.socket_path)
+            except OSError:
+                pass
+    
+    def shutdown(self) -> None:
+        """Stop serve_forever; must be called from another thread"""
+        self._stopped.set()
+        if self._server is not None:
+            self._server.shutdown()
+
+def main(argv=None) -> None:
+    """Run a recommender server, e.g. `python -m recommendation_system.server --socket /run/recommender.sock`"""
+    parser = argparse.ArgumentParser(description="Serve the published doctor recommender over a Unix domain socket")
+    parser.add_argument('--socket', required=True, help="Path of the Unix domain socket to listen on")
+    parser.add_argument('--model', default=None, help="Artifact directory of the model (default: the published model)")
+    parser.add_argument(
+        '--poll',
+        type=float,
+        default=5.0,
+        help="Seconds between checks for a newly published model"
+    )
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    
+    server = RecommenderServer(args.socket, model_path=args.model, poll_seconds=args.poll)
+    # shutdown() waits for serve_forever, so it runs off the signal handler's thread
+    signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown, daemon=True).start())
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
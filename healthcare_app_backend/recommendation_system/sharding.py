@@ -0,0 +1,496 @@
+import multiprocessing
+import threading
+import zlib
+from typing import Any, Dict, Iterable, List, Tuple
+import logging
+
+import numpy as np
+
+from .doctor_recommender import DoctorRecommender, SimpleRecommender
+from .doctor_store import DoctorStore
+from .parallel import START_METHOD
+
+logger = logging.getLogger(__name__)
+
+# Recommender methods a shard worker answers on behalf of the coordinator
+SHARD_METHODS = (
+    'recommend_many',
+    'recommend_with_facets',
+    'recommend_fallback',
+    'vocabulary',
+    'add_correction_keys',
+    'filter_doctors',
+    'upsert_doctor',
+    'remove_doctor',
+    'compact',
+    'cache_stats',
+)
+
+def shard_of(doctor_id: Any, n_shards: int) -> int:
+    """
+    Shard owning a doctor id
+    
+    The id's text is hashed with CRC-32 rather than hash(), so every process
+    (and every run) places a doctor on the same shard.
+    """
+    return zlib.crc32(str(doctor_id).encode('utf-8')) % n_shards
+
+def _serve_shard(connection, options: Dict[str, Any]) -> None:
+    """
+    Command loop of a shard worker process
+    
+    Every message is a (method, args, kwargs) tuple answered with
+    (True, result) or (False, exception); None stops the worker.
+    'add_chunk' encodes a chunk of the shard's doctors and 'fit' fits the
+    shard's recommender on every chunk added since the last fit.
+    """
+    recommender = DoctorRecommender(**options)
+    parts = []
+    while True:
+        message = connection.recv()
+        if message is None:
+            break
+        method, args, kwargs = message
+        try:
+            if method == 'add_chunk':
+                parts.append(DoctorRecommender.store_from_chunks([args[0]]))
+                result = len(parts[-1])
+            elif method == 'fit':
+                doctors = DoctorStore.concat(parts)
+                parts = []
+                recommender = DoctorRecommender(**options)
+                if len(doctors):
+                    recommender.fit_store(doctors)
+                result = len(doctors)
+            elif method in SHARD_METHODS:
+                result = getattr(recommender, method)(*args, **kwargs)
+            else:
+                raise ValueError(f"Unknown shard method: {method}")
+            reply = (True, result)
+        except Exception as e:
+            reply = (False, e)
+        connection.send(reply)
+    connection.close()
+
+def _id_key(doctor_id: Any) -> Tuple[int, Any]:
+    """Sort key of a doctor id; numeric ids order numerically, before any other id"""
+    if isinstance(doctor_id, (int, float)) and not isinstance(doctor_id, bool):
+        return (0, doctor_id)
+    return (1, str(doctor_id))
+
+def _sort_value(doctor: Dict[str, Any], field: str) -> float:
+    """Value of a SORT_DEFAULTS field of a doctor record, with the default for missing values"""
+    value = doctor.get(field)
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return SimpleRecommender.SORT_DEFAULTS[field]
+    return SimpleRecommender.SORT_DEFAULTS[field] if np.isnan(value) else value
+
+def _doctor_sort_key(doctor: Dict[str, Any], sort_by: str = None, scored: bool = True) -> Tuple:
+    """
+    Ordering key of a doctor record from any shard; smaller sorts first
+    
+    Mirrors DoctorRecommender._sort_order (and SimpleRecommender._sort_rows
+    for unscored records), except that the final tie-break is the doctor id
+    instead of the shard-local row, so merged results do not depend on how
+    the doctors were loaded.
+    """
+    sort_by = sort_by.lower() if sort_by else None
+    if sort_by == 'rating':
+        keys = [-_sort_value(doctor, 'rating'), -_sort_value(doctor, 'experience')]
+    elif sort_by == 'fee':
+        keys = [_sort_value(doctor, 'fee')]
+    elif sort_by == 'experience' or (sort_by and not scored):
+        keys = [-_sort_value(doctor, 'experience'), -_sort_value(doctor, 'rating')]
+    else:
+        # Similarity order, or id order for unsorted filter results
+        keys = []
+    if scored:
+        keys.append(-doctor.get('similarity_score', 0.0))
+    return (*keys, _id_key(doctor.get('id')))
+
+def merge_results(
+    shard_results: List[List[Dict[str, Any]]],
+    sort_by: str = None,
+    limit: int = None,
+    scored: bool = True
+) -> List[Dict[str, Any]]:
+    """
+    Merge the per-shard top results of one query into the overall top
+    
+    Args:
+        shard_results: Ordered results of every shard
+        sort_by: Sorting criteria the shards used
+        limit: Maximum number of results to return; all by default
+        scored: Whether the results carry a similarity_score (recommendations)
+            or not (filter_doctors, ordered by id when sort_by is None)
+    
+    Returns:
+        Merged results, best first
+    """
+    merged = [doctor for results in shard_results for doctor in results]
+    merged.sort(key=lambda doctor: _doctor_sort_key(doctor, sort_by, scored))
+    return merged[:limit]
+
+def merge_fallback(
+    shard_replies: List[Tuple[int, List[Dict[str, Any]], float, Dict[str, Any]]],
+    sort_by: str = None,
+    limit: int = None
+) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Merge the simple-recommender fallback of every shard for one query
+    
+    A single recommender only answers from its best matching tier, so the
+    shards that matched in a worse tier (e.g. free text, while another
+    shard has key matches) are dropped. The rest are ordered as
+    SimpleRecommender.recommend_tier orders them; free-text scores are
+    rescaled by the best BM25 score of every shard.
+    
+    Args:
+        shard_replies: (tier, recommendations, best score, facet counts)
+            of every shard, see DoctorRecommender.recommend_fallback
+        sort_by: Sorting criteria the shards used
+        limit: Maximum number of results to return; all by default
+    
+    Returns:
+        Tuple of (merged results best first, merged facet counts)
+    """
+    tiers = [tier for tier, _, _, _ in shard_replies if tier is not None]
+    best_tier = min(tiers) if tiers else None
+    replies = [reply for reply in shard_replies if reply[0] == best_tier]
+    merged = [doctor for _, results, _, _ in replies for doctor in results]
+    
+    sort_by = sort_by.lower() if sort_by else 'similarity'
+    if best_tier == SimpleRecommender.TEXT_TIER and sort_by in ('similarity', 'relevance'):
+        merged.sort(key=lambda doctor: (-doctor['similarity_score'], _id_key(doctor.get('id'))))
+    else:
+        # Key matches are never ordered by similarity
+        sort_by = sort_by if sort_by in ('rating', 'fee') else 'experience'
+        merged.sort(key=lambda doctor: _doctor_sort_key(doctor, sort_by, scored=False))
+    merged = merged[:limit]
+    
+    if best_tier == SimpleRecommender.TEXT_TIER:
+        best_score = max(best_score for _, _, best_score, _ in replies)
+        for doctor in merged:
+            doctor['similarity_score'] = doctor['similarity_score'] / best_score
+    return merged, merge_facets([facets for _, _, _, facets in replies])
+
+def merge_facets(shard_facets: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Add up the facet counts of every shard, see FilterIndex.facet_counts
+    
+    Specialization counts are summed per value and ordered by count, then
+    value; fee and rating buckets have the same boundaries on every shard
+    and are summed position by position.
+    """
+    counts = {}
+    # Shards without doctors have no facets
+    shard_facets = [facets for facets in shard_facets if facets is not None]
+    for facets in shard_facets:
+        for entry in facets.get('specialization', []):
+            counts[entry['value']] = counts.get(entry['value'], 0) + entry['count']
+    merged = {
+        'specialization': [
+            {'value': value, 'count': count}
+            for value, count in sorted(counts.items(), key=lambda item: (-item[1], str(item[0])))
+        ]
+    }
+    for field in ('fee', 'rating'):
+        buckets = None
+        for facets in shard_facets:
+            if field not in facets:
+                continue
+            if buckets is None:
+                buckets = [dict(bucket) for bucket in facets[field]]
+            else:
+                for bucket, shard_bucket in zip(buckets, facets[field]):
+                    bucket['count'] += shard_bucket['count']
+        if buckets is not None:
+            merged[field] = buckets
+    return merged
+
+class ShardedRecommender:
+    """
+    Doctor catalog partitioned by id across local worker processes
+    
+    Every shard is a worker process owning a DoctorRecommender over its
+    share of the doctors, so the catalog is bounded by the memory of all
+    workers rather than one process. Queries are fanned out to every shard
+    at once and the per-shard top results are merged; ties are broken by
+    doctor id, so results are deterministic for a given catalog and shard
+    count.
+    
+    Each shard fits its own feature scaling and vocabulary. Ids are hashed
+    across shards, so every shard holds a uniform sample of the catalog and
+    similarity scores agree closely between shards, though not exactly with
+    a single DoctorRecommender. Like a single recommender, queries fall
+    back to the simple recommender only when no shard finds a KNN match,
+    and every shard corrects misspelled queries against the keys of all
+    shards.
+    """
+    def __init__(self, n_shards: int = 2, **recommender_options):
+        """
+        Start the shard workers
+        
+        Args:
+            n_shards: Number of shard worker processes
+            **recommender_options: DoctorRecommender arguments of every shard,
+                e.g. n_neighbors or index
+        """
+        if n_shards < 1:
+            raise ValueError("A sharded recommender needs at least one shard")
+        self.n_shards = n_shards
+        self.recommender_options = recommender_options
+        # One request at a time travels through the shard connections
+        self._lock = threading.Lock()
+        self._connections = []
+        self._processes = []
+        # Condition and specialization keys of every shard, given to all
+        # shards for spelling correction
+        self._vocabulary = set()
+        
+        context = multiprocessing.get_context(START_METHOD)
+        for shard in range(n_shards):
+            parent_connection, child_connection = context.Pipe()
+            process = context.Process(
+                target=_serve_shard,
+                args=(child_connection, recommender_options),
+                name=f"recommender-shard-{shard}",
+                daemon=True
+            )
+            process.start()
+            child_connection.close()
+            self._connections.append(parent_connection)
+            self._processes.append(process)
+        logger.info("Started %d recommender shards", n_shards)
+    
+    def __enter__(self) -> 'ShardedRecommender':
+        return self
+    
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+    
+    def close(self) -> None:
+        """Stop the shard workers"""
+        with self._lock:
+            for connection, process in zip(self._connections, self._processes):
+                try:
+                    connection.send(None)
+                except (OSError, ValueError):
+                    pass
+                process.join(timeout=5)
+                if process.is_alive():
+                    process.terminate()
+                connection.close()
+            self._connections = []
+            self._processes = []
+    
+    def _scatter(self, calls: Dict[int, Tuple[str, tuple, dict]]) -> Dict[int, Any]:
+        """
+        Send one call to each given shard, then gather every reply
+        
+        All shards work concurrently; the first shard error is raised once
+        every reply has been read, so the connections stay in step.
+        
+        Args:
+            calls: Shard -> (method, args, kwargs)
+        
+        Returns:
+            Shard -> result
+        
+        Raises:
+            RuntimeError: If the recommender has been closed
+        """
+        with self._lock:
+            if not self._connections:
+                raise RuntimeError("Sharded recommender is closed")
+            for shard, call in calls.items():
+                self._connections[shard].send(call)
+            replies = {shard: self._connections[shard].recv() for shard in calls}
+        
+        for ok, result in replies.values():
+            if not ok:
+                raise result
+        return {shard: result for shard, (_, result) in replies.items()}
+    
+    def _broadcast(self, method: str, *args, **kwargs) -> List[Any]:
+        """Call a method on every shard; results in shard order"""
+        results = self._scatter({shard: (method, args, kwargs) for shard in range(self.n_shards)})
+        return [results[shard] for shard in range(self.n_shards)]
+    
+    def fit(self, doctors_data: List[Dict[str, Any]]) -> None:
+        """Fit every shard on its share of the doctors"""
+        self.fit_chunks([doctors_data])
+    
+    def fit_chunks(self, chunks: Iterable[List[Dict[str, Any]]]) -> None:
+        """
+        Fit every shard on its share of chunks of doctor dictionaries
+        
+        Each chunk is split by id and sent to the shards, which encode their
+        parts concurrently; the coordinator only holds one chunk at a time,
+        so a generator reading the doctors from the database in pages never
+        brings the catalog into this process.
+        
+        Args:
+            chunks: Iterable of lists of doctor dictionaries, each with an 'id'
+        """
+        for chunk in chunks:
+            parts = [[] for _ in range(self.n_shards)]
+            for doctor in chunk:
+                if doctor.get('id') is None:
+                    raise ValueError("Doctor must have an 'id' to be added to the recommender")
+                parts[shard_of(doctor['id'], self.n_shards)].append(doctor)
+            self._scatter({shard: ('add_chunk', (part,), {}) for shard, part in enumerate(parts) if part})
+        
+        sizes = self._broadcast('fit')
+        self._vocabulary = {key for keys in self._broadcast('vocabulary') for key in keys}
+        self._broadcast('add_correction_keys', sorted(self._vocabulary))
+        logger.info("Fitted %d recommender shards with %d doctors (%s per shard)", self.n_shards, sum(sizes), sizes)
+    
+    def recommend_doctors(
+        self,
+        query: str,
+        specialization: str = None,
+        sort_by: str = None,
+        min_score: float = 0.1,
+        limit: int = 10,
+        filters: Dict[str, Any] = None
+    ) -> List[Dict[str, Any]]:
+        """Recommend doctors across all shards; see DoctorRecommender.recommend_doctors"""
+        return self.recommend_many(
+            [query],
+            specialization=specialization,
+            sort_by=sort_by,
+            min_score=min_score,
+            limit=limit,
+            filters=filters
+        )[0]
+    
+    def recommend_many(
+        self,
+        queries: List[str],
+        specialization: str = None,
+        sort_by: str = None,
+        min_score: float = 0.1,
+        limit: int = 10,
+        filters: Dict[str, Any] = None
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Recommend doctors for a batch of query conditions across all shards
+        
+        Every shard answers the whole batch with its own top limit doctors;
+        see DoctorRecommender.recommend_many for the arguments.
+        
+        Returns:
+            One merged list of recommended doctors per query, in query order
+        
+        Raises:
+            ValueError: If the filter expression or a query weight is malformed
+        """
+        return self._recommend(queries, specialization, sort_by, min_score, limit, filters, facets=False)[0]
+    
+    def recommend_with_facets(
+        self,
+        queries: List[str],
+        specialization: str = None,
+        sort_by: str = None,
+        min_score: float = 0.1,
+        limit: int = 10,
+        filters: Dict[str, Any] = None
+    ) -> Tuple[List[List[Dict[str, Any]]], List[Dict[str, Any]]]:
+        """
+        Recommend doctors with facet counts across all shards
+        
+        See DoctorRecommender.recommend_with_facets; the facet counts of
+        every shard are added up.
+        
+        Returns:
+            Tuple of (one list of recommended doctors per query, one facet
+            dictionary per query), in query order
+        """
+        return self._recommend(queries, specialization, sort_by, min_score, limit, filters, facets=True)
+    
+    def _recommend(
+        self,
+        queries: List[str],
+        specialization: str,
+        sort_by: str,
+        min_score: float,
+        limit: int,
+        filters: Dict[str, Any],
+        facets: bool
+    ) -> Tuple[List[List[Dict[str, Any]]], List[Dict[str, Any]]]:
+        """
+        Merged KNN results of every shard, then the merged simple-recommender
+        fallback of the queries no shard found a KNN match for
+        
+        Returns:
+            Tuple of (one merged result list per query, one merged facet
+            dictionary per query or None if facets were not requested)
+        """
+        options = {'specialization': specialization, 'sort_by': sort_by, 'limit': limit, 'filters': filters}
+        if facets:
+            shard_replies = self._broadcast('recommend_with_facets', queries, min_score=min_score, fallback=False, **options)
+        else:
+            shard_replies = [
+                (results, None)
+                for results in self._broadcast('recommend_many', queries, min_score=min_score, fallback=False, **options)
+            ]
+        results = [
+            merge_results([shard_results[i] for shard_results, _ in shard_replies], sort_by, limit)
+            for i in range(len(queries))
+        ]
+        facet_counts = [
+            merge_facets([shard_facets[i] for _, shard_facets in shard_replies]) for i in range(len(queries))
+        ] if facets else None
+        
+        missing = [i for i, query_results in enumerate(results) if not query_results]
+        if missing:
+            fallback_replies = self._broadcast('recommend_fallback', [queries[i] for i in missing], facets=facets, **options)
+            for position, i in enumerate(missing):
+                results[i], query_facets = merge_fallback([replies[position] for replies in fallback_replies], sort_by, limit)
+                if facets:
+                    facet_counts[i] = query_facets
+        return results, facet_counts
+    
+    def filter_doctors(self, filters: Dict[str, Any] = None, sort_by: str = None, limit: int = None) -> List[Dict[str, Any]]:
+        """
+        Doctors matching a filter expression across all shards
+        
+        See DoctorRecommender.filter_doctors; without sort_by, doctors are
+        ordered by id.
+        """
+        shard_results = self._broadcast('filter_doctors', filters, sort_by=sort_by, limit=limit)
+        return merge_results(shard_results, sort_by, limit, scored=False)
+    
+    def upsert_doctor(self, doctor: Dict[str, Any]) -> None:
+        """Add or replace a doctor on the shard owning its id"""
+        if doctor.get('id') is None:
+            raise ValueError("Doctor must have an 'id' to be added to the recommender")
+        shard = shard_of(doctor['id'], self.n_shards)
+        self._scatter({shard: ('upsert_doctor', (doctor,), {})})
+        
+        normalized = DoctorRecommender._normalize_doctor(doctor)
+        new_keys = SimpleRecommender._row_keys(normalized['conditions_treated'], normalized.get('specialization')) - self._vocabulary
+        if new_keys:
+            self._vocabulary.update(new_keys)
+            self._broadcast('add_correction_keys', sorted(new_keys))
+    
+    def remove_doctor(self, doctor_id: Any) -> bool:
+        """
+        Remove a doctor from the shard owning its id
+        
+        Returns:
+            bool: True if the doctor was present
+        """
+        shard = shard_of(doctor_id, self.n_shards)
+        return self._scatter({shard: ('remove_doctor', (doctor_id,), {})})[shard]
+    
+    def compact(self) -> None:
+        """Compact every shard"""
+        self._broadcast('compact')
+    
+    def cache_stats(self) -> List[Dict[str, Any]]:
+        """Result cache counters of every shard, in shard order"""
+        return self._broadcast('cache_stats')
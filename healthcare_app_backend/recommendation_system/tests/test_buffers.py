@@ -0,0 +1,49 @@
+import unittest
+
+import numpy as np
+from scipy import sparse
+
+from recommendation_system.buffers import AppendBuffers
+
+class AppendBuffersTests(unittest.TestCase):
+    def test_appends_reuse_the_buffer(self):
+        buffers = AppendBuffers()
+        array = buffers.append('values', np.arange(3, dtype=np.int32), 3)
+        grown = buffers.append('values', array, [4, 5])
+        np.testing.assert_array_equal(grown, [0, 1, 2, 3, 4, 5])
+        self.assertEqual(grown.dtype, np.int32)
+        self.assertIs(grown.base, array.base)
+    
+    def test_earlier_views_do_not_change(self):
+        buffers = AppendBuffers()
+        first = buffers.append('values', np.zeros(2), 1.0)
+        shared = first
+        buffers.append('values', first, 2.0)
+        # Appending to a stale view starts a new buffer instead of overwriting
+        other = buffers.append('values', shared, 3.0)
+        np.testing.assert_array_equal(shared, [0.0, 0.0, 1.0])
+        np.testing.assert_array_equal(other, [0.0, 0.0, 1.0, 3.0])
+        self.assertIsNot(other.base, shared.base)
+    
+    def test_read_only_arrays_are_copied(self):
+        array = np.arange(4, dtype=np.int64)
+        array.flags.writeable = False
+        grown = AppendBuffers().append('values', array, 4)
+        np.testing.assert_array_equal(grown, np.arange(5))
+        np.testing.assert_array_equal(array, np.arange(4))
+    
+    def test_resize_zero_fills_new_cells(self):
+        buffers = AppendBuffers()
+        bitsets = buffers.resize('bitsets', np.ones((2, 3), dtype=np.uint64), (2, 4))
+        bitsets = buffers.resize('bitsets', bitsets, (3, 5))
+        np.testing.assert_array_equal(bitsets[:2, :3], 1)
+        self.assertEqual(int(bitsets.sum()), 6)
+        self.assertTrue(bitsets.flags.writeable)
+    
+    def test_append_csr_rows_widens_the_matrix(self):
+        buffers = AppendBuffers()
+        matrix = sparse.csr_matrix(np.array([[1.0, 0.0], [0.0, 2.0]], dtype=np.float32))
+        for row in ([[0.0, 0.0, 3.0]], [[4.0, 0.0, 0.0]]):
+            matrix = buffers.append_csr_rows('matrix', matrix, sparse.csr_matrix(np.array(row, dtype=np.float32)))
+        np.testing.assert_array_equal(matrix.toarray(), [[1, 0, 0], [0, 2, 0], [0, 0, 3], [4, 0, 0]])
+        self.assertEqual(matrix.dtype, np.float32)
@@ -0,0 +1,102 @@
+import logging
+import unittest
+
+import numpy as np
+
+from recommendation_system.doctor_recommender import DoctorRecommender
+from recommendation_system.doctor_store import DoctorStore, RowIdIndex
+from recommendation_system.tests.test_sharding import make_doctors
+
+def columns(store):
+    """Python values of every column of a store"""
+    return {name: store.values(name) for name in store.kinds}
+
+class ChunkedStoreTests(unittest.TestCase):
+    def test_chunks_build_the_same_store_as_one_list(self):
+        records = [
+            {'id': 1, 'fee': 500, 'rating': None, 'specialization': 'Cardiologist', 'conditions_treated': ['Diabetes']},
+            {'id': 2, 'fee': 650, 'rating': None, 'specialization': 'Cardiologist', 'conditions_treated': []},
+            # The fee turns fractional and the rating appears only in later chunks
+            {'id': 3, 'fee': 725.5, 'rating': 4.5, 'specialization': 'Endocrinologist', 'conditions_treated': ['Thyroid']},
+            {'id': 4, 'fee': None, 'rating': 3.9, 'specialization': None, 'conditions_treated': ['Diabetes', 'Thyroid']},
+            {'id': 5, 'fee': 300, 'rating': 4.1, 'specialization': 'Cardiologist', 'name': 'Only here'},
+        ]
+        expected = columns(DoctorStore.from_records(records))
+        for chunk_size in (1, 2, 3):
+            with self.subTest(chunk_size=chunk_size):
+                chunks = [records[start:start + chunk_size] for start in range(0, len(records), chunk_size)]
+                store = DoctorStore.from_chunks(chunks)
+                self.assertEqual(len(store), len(records))
+                self.assertEqual(columns(store), expected)
+    
+    def test_chunked_training_data_fits_the_same_model(self):
+        logging.disable(logging.CRITICAL)
+        self.addCleanup(logging.disable, logging.NOTSET)
+        doctors = make_doctors(range(1, 51))
+        whole = DoctorRecommender(n_neighbors=10)
+        whole.fit(doctors)
+        chunked = DoctorRecommender(n_neighbors=10)
+        chunked.fit_store(DoctorRecommender.store_from_chunks(doctors[start:start + 7] for start in range(0, 50, 7)))
+        for query in ('diabetes', 'hypertension'):
+            self.assertEqual(chunked.recommend_doctors(query, sort_by='rating'), whole.recommend_doctors(query, sort_by='rating'))
+        self.assertEqual((chunked.feature_matrix != whole.feature_matrix).nnz, 0)
+
+class CompactStoreTests(unittest.TestCase):
+    def setUp(self):
+        self.records = [
+            {
+                'id': i,
+                'experience': i % 40,
+                'rating': [4.7, 3.9, 4.25][i % 3],
+                'fee': [500.123456789, 300.0][i % 2],
+                'specialization': ['Cardiologist', 'Endocrinologist'][i % 2],
+                'name': f"Doctor {i}",
+                'conditions_treated': [['Diabetes', 'Asthma'], ['Diabetes']][i % 2],
+                'extra': {'room': i},
+            }
+            for i in range(10)
+        ]
+        self.store = DoctorStore.from_records(self.records)
+    
+    def test_columns_use_compact_encodings(self):
+        self.assertEqual(self.store.kinds, {
+            'id': 'int', 'experience': 'int', 'rating': 'float', 'fee': 'float', 'specialization': 'category',
+            'name': 'str', 'conditions_treated': 'list', 'extra': 'json',
+        })
+        self.assertEqual(self.store.columns['id']['values'].dtype, np.int8)
+        # float32 only when every value round-trips
+        self.assertEqual(self.store.columns['rating']['values'].dtype, np.float32)
+        self.assertEqual(self.store.columns['fee']['values'].dtype, np.float64)
+        self.assertEqual(self.store.dictionary('specialization'), ['Cardiologist', 'Endocrinologist'])
+        self.assertEqual(sorted(self.store.dictionary('conditions_treated')), ['Asthma', 'Diabetes'])
+    
+    def test_records_round_trip_exactly(self):
+        self.assertEqual(self.store.records(np.arange(10)), self.records)
+        restored = DoctorStore.from_state(*self.store.get_state())
+        self.assertEqual(restored.records(np.array([9, 0])), [self.records[9], self.records[0]])
+    
+    def test_appends_widen_columns(self):
+        copy = self.store.copy()
+        record = {
+            'id': 10 ** 10, 'experience': 1000, 'rating': 4.7, 'fee': 1, 'specialization': 'Neurologist',
+            'name': 'New', 'conditions_treated': ['Migraine'], 'extra': None,
+        }
+        self.assertEqual(self.store.append(record), 10)
+        self.assertEqual(self.store.columns['id']['values'].dtype, np.int64)
+        self.assertEqual(self.store.records(np.array([10, 3])), [{**record, 'fee': 1.0}, self.records[3]])
+        # The copy shares arrays but not appended rows
+        self.assertEqual(len(copy), 10)
+        self.assertEqual(copy.records(np.arange(10)), self.records)
+    
+    def test_taken_and_sliced_rows(self):
+        self.assertEqual(self.store.take(np.array([7, 2])).records(np.arange(2)), [self.records[7], self.records[2]])
+        self.assertEqual(self.store.slice_rows(3, 6).records(np.arange(3)), self.records[3:6])
+    
+    def test_row_ids(self):
+        active_rows = np.ones(10, dtype=bool)
+        active_rows[4] = False
+        row_by_id = RowIdIndex.build(self.store, active_rows)
+        self.assertEqual((row_by_id.get(3), row_by_id.get(4), row_by_id.get(99, -1)), (3, None, -1))
+        row_by_id['new'] = 10
+        self.assertEqual(row_by_id.pop(3), 3)
+        self.assertEqual((row_by_id.get(3), row_by_id.get('new')), (None, 10))
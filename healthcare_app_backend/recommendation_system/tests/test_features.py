@@ -0,0 +1,62 @@
+import logging
+import unittest
+
+import numpy as np
+from scipy import sparse
+
+from recommendation_system.doctor_recommender import DoctorRecommender
+
+DOCTORS = [
+    {'id': 1, 'name': 'A', 'specialization': 'Cardiologist', 'conditions_treated': ['Hypertension', ' hypertension'],
+     'experience': 10, 'rating': 4.5, 'fee': 500},
+    {'id': 2, 'name': 'B', 'specialization': 'Endocrinologist', 'conditions_treated': 'Diabetes, Thyroid',
+     'experience': 4, 'rating': 4.0, 'fee': 300},
+    {'id': 3, 'name': 'C', 'specialization': None, 'conditions_treated': ['DIABETES'],
+     'experience': 7, 'rating': 3.5, 'fee': 400},
+]
+
+class FeatureMatrixTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        logging.disable(logging.CRITICAL)
+        cls.recommender = DoctorRecommender(n_neighbors=3)
+        cls.recommender.fit(DOCTORS)
+    
+    @classmethod
+    def tearDownClass(cls):
+        logging.disable(logging.NOTSET)
+    
+    def row_features(self, row):
+        """Names of the non-zero non-numeric features of a feature matrix row"""
+        columns = self.recommender.feature_matrix[row].indices
+        numeric = len(self.recommender.numeric_features)
+        return sorted(self.recommender.feature_names[column] for column in columns if column >= numeric)
+    
+    def test_features_are_a_sparse_matrix_with_named_columns(self):
+        matrix = self.recommender.feature_matrix
+        self.assertTrue(sparse.isspmatrix_csr(matrix))
+        self.assertEqual(matrix.shape, (3, len(self.recommender.feature_names)))
+        self.assertEqual(self.recommender.feature_names, [
+            'experience', 'rating', 'fee',
+            'treats_diabetes', 'treats_hypertension', 'treats_thyroid',
+            'spec_Cardiologist', 'spec_Endocrinologist',
+        ])
+    
+    def test_rows_are_unit_float32(self):
+        matrix = self.recommender.feature_matrix
+        self.assertEqual(matrix.dtype, np.float32)
+        np.testing.assert_allclose(np.sqrt(matrix.multiply(matrix).sum(axis=1)).A1, 1.0, rtol=1e-6)
+    
+    def test_conditions_are_matched_ignoring_case_and_whitespace(self):
+        self.assertEqual(self.row_features(0), ['spec_Cardiologist', 'treats_hypertension'])
+        self.assertEqual(self.row_features(1), ['spec_Endocrinologist', 'treats_diabetes', 'treats_thyroid'])
+        # No specialization column for a doctor without one
+        self.assertEqual(self.row_features(2), ['treats_diabetes'])
+    
+    def test_query_rows_set_the_condition_and_specialization_columns(self):
+        queries = self.recommender._get_query_matrix(['diabetes', 'thyroid, unknown'], specialization='endocrinologist ')
+        self.assertTrue(sparse.isspmatrix_csr(queries))
+        columns = self.recommender.condition_columns
+        spec_column = self.recommender.specialization_columns['Endocrinologist']
+        np.testing.assert_array_equal(queries[0].indices, sorted([columns['diabetes'], spec_column]))
+        np.testing.assert_array_equal(queries[1].indices, sorted([columns['thyroid'], spec_column]))
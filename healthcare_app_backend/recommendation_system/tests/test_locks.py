@@ -0,0 +1,68 @@
+import threading
+import time
+import unittest
+
+from recommendation_system.locks import ReadWriteLock
+
+class ReadWriteLockTests(unittest.TestCase):
+    def test_readers_share_the_lock(self):
+        lock = ReadWriteLock()
+        both_inside = threading.Barrier(2, timeout=5)
+        
+        def read():
+            with lock.read():
+                both_inside.wait()
+        
+        threads = [threading.Thread(target=read) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+        self.assertFalse(both_inside.broken)
+    
+    def test_writer_excludes_readers_and_goes_first(self):
+        lock = ReadWriteLock()
+        events = []
+        
+        def write():
+            with lock.write():
+                events.append('write')
+        
+        def read():
+            with lock.read():
+                events.append('read')
+        
+        with lock.read():
+            writer = threading.Thread(target=write)
+            writer.start()
+            while not lock._waiting_writers:
+                time.sleep(0.001)
+            # A reader arriving after the writer waits behind it
+            reader = threading.Thread(target=read)
+            reader.start()
+            time.sleep(0.05)
+            self.assertEqual(events, [])
+        writer.join(5)
+        reader.join(5)
+        self.assertEqual(events, ['write', 'read'])
+    
+    def test_reentrant(self):
+        lock = ReadWriteLock()
+        with lock.write():
+            with lock.write():
+                with lock.read():
+                    pass
+        with lock.read():
+            with lock.read():
+                pass
+        # Fully released: another thread can write
+        writer = threading.Thread(target=lambda: (lock.acquire_write(), lock.release_write()))
+        writer.start()
+        writer.join(5)
+        self.assertFalse(writer.is_alive())
+    
+    def test_upgrade_is_refused(self):
+        lock = ReadWriteLock()
+        with lock.read():
+            with self.assertRaises(RuntimeError):
+                lock.acquire_write()
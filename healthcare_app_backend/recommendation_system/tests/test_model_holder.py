@@ -0,0 +1,87 @@
+import logging
+import threading
+import unittest
+
+from recommendation_system.model_holder import ModelHolder
+
+class BlockingBuilder:
+    """Builder that publishes an interim model and waits to be released before returning its model"""
+    def __init__(self, model, interim=None):
+        self.model = model
+        self.interim = interim
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.calls = 0
+    
+    def __call__(self, publish):
+        self.calls += 1
+        if self.interim is not None:
+            publish(self.interim)
+        self.started.set()
+        self.release.wait(5)
+        if isinstance(self.model, Exception):
+            raise self.model
+        return self.model
+
+class ModelHolderTests(unittest.TestCase):
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+    
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+    
+    def test_builds_are_single_flight(self):
+        builder = BlockingBuilder('model')
+        holder = ModelHolder(builder)
+        self.assertTrue(holder.rebuild_async())
+        builder.started.wait(5)
+        self.assertFalse(holder.rebuild_async())
+        self.assertTrue(holder.is_building)
+        self.assertIsNone(holder.get())
+        
+        builder.release.set()
+        self.assertTrue(holder.wait(5))
+        self.assertFalse(holder.is_building)
+        self.assertEqual(builder.calls, 1)
+        self.assertEqual((holder.get(), holder.version), ('model', 1))
+        # A finished build does not block the next one
+        self.assertTrue(holder.rebuild_async())
+        self.assertTrue(holder.wait(5))
+        self.assertEqual((builder.calls, holder.version), (2, 2))
+    
+    def test_interim_models_are_served_during_the_build(self):
+        builder = BlockingBuilder('model', interim='interim')
+        holder = ModelHolder(builder)
+        holder.rebuild_async()
+        builder.started.wait(5)
+        self.assertEqual(holder.get(), 'interim')
+        builder.release.set()
+        holder.wait(5)
+        self.assertEqual((holder.get(), holder.version), ('model', 2))
+    
+    def test_swap_during_a_rebuild(self):
+        builder = BlockingBuilder('rebuilt')
+        holder = ModelHolder(builder)
+        holder.swap('initial')
+        holder.rebuild_async()
+        builder.started.wait(5)
+        # Swapping in a model while the build runs serves it right away...
+        holder.swap('swapped')
+        self.assertEqual((holder.get(), holder.version), ('swapped', 2))
+        self.assertTrue(holder.is_building)
+        # ...and the build still replaces it once it finishes
+        builder.release.set()
+        holder.wait(5)
+        self.assertEqual((holder.get(), holder.version), ('rebuilt', 3))
+    
+    def test_failed_builds_keep_the_served_model(self):
+        for result in (RuntimeError("training failed"), None):
+            with self.subTest(result=result):
+                builder = BlockingBuilder(result)
+                holder = ModelHolder(builder)
+                holder.swap('served')
+                holder.rebuild_async()
+                builder.release.set()
+                self.assertTrue(holder.wait(5))
+                self.assertEqual((holder.get(), holder.version), ('served', 1))
+                self.assertFalse(holder.is_building)
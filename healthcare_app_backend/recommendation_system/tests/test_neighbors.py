@@ -0,0 +1,107 @@
+import unittest
+
+import numpy as np
+from scipy import sparse
+
+from recommendation_system.neighbors import (
+    BruteForceIndex,
+    IVFIndex,
+    InvertedIndex,
+    _sparse_top_k,
+    evaluate_recall,
+    normalize_rows,
+)
+
+class NormalizedRowsTests(unittest.TestCase):
+    def test_rows_are_unit_float32(self):
+        matrix = normalize_rows(sparse.csr_matrix(np.array([[3.0, 4.0, 0.0], [0.0, 0.0, 0.0], [0.0, -2.0, 0.0]])))
+        self.assertEqual(matrix.dtype, np.float32)
+        np.testing.assert_allclose(matrix.toarray(), [[0.6, 0.8, 0.0], [0.0, 0.0, 0.0], [0.0, -1.0, 0.0]], rtol=1e-6)
+    
+    def test_sparse_top_k_matches_a_dense_selection(self):
+        rng = np.random.default_rng(2)
+        for _ in range(50):
+            n_columns = int(rng.integers(1, 30))
+            dense = np.round(rng.normal(size=n_columns), 1) * (rng.random(n_columns) < 0.4)
+            columns = np.flatnonzero(dense)
+            # Explicit zeros are allowed and treated like missing entries
+            columns = np.concatenate((columns, np.flatnonzero(dense == 0)[:2]))
+            rng.shuffle(columns)
+            k = int(rng.integers(1, n_columns + 1))
+            expected = np.lexsort((np.arange(n_columns), -dense))[:k]
+            top_columns, top_similarities = _sparse_top_k(columns, dense[columns], n_columns, k)
+            np.testing.assert_array_equal(top_columns, expected)
+            np.testing.assert_array_equal(top_similarities, dense[expected])
+    
+    def test_brute_force_matches_dense_cosine_search(self):
+        rng = np.random.default_rng(3)
+        dense = rng.random((200, 15)) * (rng.random((200, 15)) < 0.3)
+        queries = rng.random((20, 15)) * (rng.random((20, 15)) < 0.3)
+        distances, indices = BruteForceIndex(n_jobs=1).fit(normalize_rows(sparse.csr_matrix(dense))).kneighbors(
+            sparse.csr_matrix(queries), n_neighbors=10
+        )
+        
+        def unit(rows):
+            norms = np.linalg.norm(rows, axis=1, keepdims=True)
+            return rows / np.where(norms == 0, 1, norms)
+        similarities = unit(queries) @ unit(dense).T
+        for query in range(len(queries)):
+            if not similarities[query].any():
+                continue
+            expected = np.lexsort((np.arange(len(dense)), -similarities[query]))[:10]
+            np.testing.assert_array_equal(indices[query], expected)
+            np.testing.assert_allclose(distances[query], 1 - similarities[query][expected], atol=1e-6)
+
+class InvertedIndexTests(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        dense = rng.random((40, 6)) * (rng.random((40, 6)) < 0.5)
+        self.matrix = normalize_rows(sparse.csr_matrix(dense))
+    
+    def test_shallow_depth_still_returns_every_neighbor_asked_for(self):
+        index = InvertedIndex(depth=2).fit(self.matrix)
+        query = sparse.csr_matrix(([1.0], ([0], [3])), shape=(1, 6))
+        n_rows = self.matrix[:, 3].nnz
+        _, indices = index.kneighbors(query, n_neighbors=n_rows)
+        _, exact = BruteForceIndex(n_jobs=1).fit(self.matrix).kneighbors(query, n_neighbors=n_rows)
+        self.assertGreater(n_rows, 2)
+        np.testing.assert_array_equal(indices, exact)
+    
+    def test_appended_rows_are_found_before_the_next_fit(self):
+        index = InvertedIndex(depth=2).fit(self.matrix)
+        row = normalize_rows(sparse.csr_matrix(np.array([[0.3, 0.0, 0.0, 0.9, 0.0, 0.7]])))
+        index.partial_fit(sparse.vstack([self.matrix, row], format='csr'), self.matrix.shape[0])
+        distances, indices = index.kneighbors(row, n_neighbors=1)
+        self.assertEqual(indices[0, 0], self.matrix.shape[0])
+        self.assertAlmostEqual(distances[0, 0], 0.0, places=5)
+
+class IVFIndexTests(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(1)
+        dense = rng.random((300, 12)) * (rng.random((300, 12)) < 0.3)
+        self.matrix = normalize_rows(sparse.csr_matrix(dense))
+        self.queries = sparse.csr_matrix(dense[:40])
+    
+    def test_probing_every_list_is_exact(self):
+        index = IVFIndex(n_lists=16, n_probe=16).fit(self.matrix)
+        result = evaluate_recall(index, self.queries, n_neighbors=10)
+        self.assertEqual(result['recall'], 1.0)
+        self.assertGreater(result['evaluated_queries'], 30)
+    
+    def test_recall_grows_with_n_probe(self):
+        recalls = [
+            evaluate_recall(IVFIndex(n_lists=16, n_probe=n_probe).fit(self.matrix), self.queries, n_neighbors=10)['recall']
+            for n_probe in (1, 4, 16)
+        ]
+        self.assertLess(recalls[0], 1.0)
+        self.assertEqual(recalls, sorted(recalls))
+    
+    def test_more_lists_than_training_rows(self):
+        index = IVFIndex(n_lists=50, training_sample=10).fit(self.matrix)
+        self.assertEqual(len(index.centroids), 10)
+        self.assertEqual(index.n_probe, 8)
+        # sqrt(300) lists by default, above the sample as well
+        self.assertEqual(len(IVFIndex(training_sample=5).fit(self.matrix).centroids), 5)
+        
+        index.n_probe = len(index.centroids)
+        self.assertEqual(evaluate_recall(index, self.queries, n_neighbors=10)['recall'], 1.0)
@@ -0,0 +1,65 @@
+import logging
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from recommendation_system.doctor_recommender import DoctorRecommender, SimpleRecommender
+from recommendation_system.parallel import resolve_jobs, shard_bounds
+from recommendation_system.tests.test_simple_recommender import make_catalog
+
+class ShardBoundsTests(unittest.TestCase):
+    def test_shards_cover_every_row_on_aligned_bounds(self):
+        for n_rows, n_shards in ((0, 4), (1, 4), (64, 4), (1000, 3), (1000, 64)):
+            with self.subTest(n_rows=n_rows, n_shards=n_shards):
+                bounds = shard_bounds(n_rows, n_shards)
+                self.assertLessEqual(len(bounds), n_shards)
+                self.assertEqual(bounds[0][0], 0)
+                self.assertEqual(bounds[-1][1], n_rows)
+                for (_, stop), (start, _) in zip(bounds[:-1], bounds[1:]):
+                    self.assertEqual(stop, start)
+                    self.assertEqual(start % 64, 0)
+    
+    def test_resolve_jobs(self):
+        self.assertEqual(resolve_jobs(1), 1)
+        self.assertEqual(resolve_jobs(0), 1)
+        self.assertGreaterEqual(resolve_jobs(None), 1)
+
+class ParallelIndexingTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        logging.disable(logging.CRITICAL)
+        cls.doctors = make_catalog(1000)
+    
+    @classmethod
+    def tearDownClass(cls):
+        logging.disable(logging.NOTSET)
+    
+    def test_parallel_indexes_equal_serial_ones(self):
+        serial = SimpleRecommender()
+        serial.fit(self.doctors)
+        with mock.patch.object(SimpleRecommender, 'PARALLEL_MIN_ROWS', 100):
+            parallel = SimpleRecommender(n_jobs=3)
+            parallel.fit(self.doctors)
+        
+        self.assertEqual(parallel.index_keys, serial.index_keys)
+        for parallel_rows, serial_rows in zip(parallel.postings, serial.postings):
+            np.testing.assert_array_equal(parallel_rows, serial_rows)
+        for expression in (
+            {'field': 'fee', 'lte': 500},
+            {'or': [{'field': 'specialization', 'eq': 'neurologist'}, {'field': 'rating', 'gte': 4.5}]},
+        ):
+            np.testing.assert_array_equal(parallel.filter_mask(expression), serial.filter_mask(expression))
+        for query in ('pulmonary hypertension', 'gest', 'doctor 17'):
+            parallel_rows, parallel_scores = parallel.text_index.search([(query, 1.0)])
+            serial_rows, serial_scores = serial.text_index.search([(query, 1.0)])
+            np.testing.assert_array_equal(parallel_rows, serial_rows)
+            np.testing.assert_allclose(parallel_scores, serial_scores)
+    
+    def test_parallel_encoding_equals_serial(self):
+        chunks = [self.doctors[start:start + 150] for start in range(0, len(self.doctors), 150)]
+        serial = DoctorRecommender.store_from_chunks(chunks)
+        parallel = DoctorRecommender.store_from_chunks(chunks, n_jobs=2)
+        # Results come back in chunk order
+        rows = np.arange(len(self.doctors))
+        self.assertEqual(parallel.records(rows), serial.records(rows))
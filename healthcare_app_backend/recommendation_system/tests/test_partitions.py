@@ -0,0 +1,66 @@
+import logging
+import unittest
+
+import numpy as np
+
+from recommendation_system.doctor_recommender import DoctorRecommender
+from recommendation_system.neighbors import normalize_rows
+from recommendation_system.partitions import build_partitions, specialization_key
+from recommendation_system.tests.test_sharding import make_doctors
+
+class PartitionTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        logging.disable(logging.CRITICAL)
+    
+    @classmethod
+    def tearDownClass(cls):
+        logging.disable(logging.NOTSET)
+    
+    def setUp(self):
+        self.doctors = make_doctors(range(1, 81))
+        self.doctors[5]['specialization'] = ' cardiologist'
+        self.doctors[6]['specialization'] = None
+        self.recommender = DoctorRecommender(n_neighbors=10, cache_size=0)
+        self.recommender.fit(self.doctors)
+    
+    def exact_ids(self, query, specialization, limit):
+        """Ids of the best scoring doctors of a specialization, ranked over every one of them"""
+        rows = np.array([
+            row for row, doctor in enumerate(self.doctors)
+            if specialization_key(doctor['specialization']) == specialization_key(specialization)
+        ])
+        query_row = normalize_rows(self.recommender._get_query_matrix([query], specialization))
+        scores = (self.recommender.feature_matrix[rows] @ query_row.T).toarray().ravel()
+        order = np.lexsort((rows, -scores))
+        return [self.doctors[row]['id'] for row, score in zip(rows[order], scores[order]) if score >= 0.1][:limit]
+    
+    def test_partitions_hold_the_rows_of_their_specialization(self):
+        partitions = build_partitions(
+            self.recommender.feature_matrix, [doctor['specialization'] for doctor in self.doctors], 'brute', {}
+        )
+        self.assertEqual(sorted(partitions), ['cardiologist', 'endocrinologist'])
+        cardiologists = [row for row, doctor in enumerate(self.doctors) if (row % 2 == 0 and row != 6) or row == 5]
+        self.assertEqual(partitions['cardiologist'].rows.tolist(), cardiologists)
+        self.assertEqual(
+            (partitions['cardiologist'].matrix != self.recommender.feature_matrix[cardiologists]).nnz, 0
+        )
+        self.assertNotIn(6, partitions['endocrinologist'].rows.tolist())
+    
+    def test_scoped_queries_rank_like_a_search_of_the_whole_specialization(self):
+        for query in ('hypertension', 'diabetes'):
+            for specialization in ('Cardiologist', 'ENDOCRINOLOGIST'):
+                with self.subTest(query=query, specialization=specialization):
+                    results = self.recommender.recommend_doctors(query, specialization=specialization, limit=8)
+                    self.assertEqual([doctor['id'] for doctor in results], self.exact_ids(query, specialization, 8))
+    
+    def test_upserts_update_the_partitions(self):
+        self.recommender.upsert_doctor({**make_doctors([200])[0], 'specialization': 'Neurologist', 'conditions_treated': ['Migraine']})
+        self.recommender.upsert_doctor({**self.doctors[0], 'specialization': 'Neurologist'})
+        results = self.recommender.recommend_doctors('diabetes', specialization='neurologist', limit=5)
+        # Doctor 200 only shares the specialization feature
+        self.assertEqual([doctor['id'] for doctor in results], [self.doctors[0]['id'], 200])
+        self.assertNotIn(self.doctors[0]['id'], [
+            doctor['id'] for doctor in self.recommender.recommend_doctors('diabetes', specialization='cardiologist', limit=80)
+        ])
+        self.assertEqual(self.recommender.recommend_many(['diabetes'], specialization='dermatologist', fallback=False), [[]])
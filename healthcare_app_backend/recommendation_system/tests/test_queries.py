@@ -0,0 +1,53 @@
+import logging
+import unittest
+
+from recommendation_system.doctor_recommender import DoctorRecommender, format_query_terms, parse_query_terms
+
+class ParseQueryTermsTests(unittest.TestCase):
+    def test_query_forms(self):
+        self.assertEqual(parse_query_terms(' Asthma '), [('asthma', 1.0)])
+        self.assertEqual(parse_query_terms('asthma, Hypertension:2.5'), [('asthma', 1.0), ('hypertension', 2.5)])
+        self.assertEqual(parse_query_terms(['Asthma', 'asthma', '']), [('asthma', 2.0)])
+        self.assertEqual(parse_query_terms({'asthma': '3', 'copd': 1}), [('asthma', 3.0), ('copd', 1.0)])
+        # A colon not followed by a number is part of the condition name
+        self.assertEqual(parse_query_terms('type: 2 diabetes'), [('type: 2 diabetes', 1.0)])
+        self.assertEqual(parse_query_terms(''), [])
+    
+    def test_malformed_weights_are_rejected(self):
+        for query in ('asthma:0', 'asthma:-1', {'asthma': 'high'}, {'asthma': None}):
+            with self.subTest(query=query):
+                with self.assertRaises(ValueError):
+                    parse_query_terms(query)
+    
+    def test_equivalent_queries_share_one_form(self):
+        self.assertEqual(format_query_terms(parse_query_terms('Hypertension:2, asthma')), 'asthma, hypertension:2')
+        self.assertEqual(format_query_terms(parse_query_terms({'hypertension': 2.0, 'asthma': 1})), 'asthma, hypertension:2')
+        self.assertEqual(format_query_terms(parse_query_terms('asthma:1')), 'asthma')
+
+class WeightedQueryTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        logging.disable(logging.CRITICAL)
+        cls.recommender = DoctorRecommender(n_neighbors=10, cache_size=0)
+        cls.recommender.fit([
+            {'id': doctor_id, 'name': f"Doctor {doctor_id}", 'specialization': 'General', 'conditions_treated': conditions,
+             'experience': 10, 'rating': 4.0, 'fee': 500}
+            for doctor_id, conditions in ((1, ['Diabetes']), (2, ['Migraine']), (3, ['Diabetes', 'Migraine']), (4, ['Asthma']))
+        ])
+    
+    @classmethod
+    def tearDownClass(cls):
+        logging.disable(logging.NOTSET)
+    
+    def ids(self, query):
+        return [doctor['id'] for doctor in self.recommender.recommend_doctors(query, limit=3)]
+    
+    def test_doctors_treating_every_condition_rank_first(self):
+        self.assertEqual(self.ids('diabetes, migraine'), [3, 1, 2])
+        results = self.recommender.recommend_doctors('diabetes, migraine', limit=1)
+        self.assertEqual(results[0]['matched_conditions'], ['Diabetes', 'Migraine'])
+    
+    def test_weights_favor_their_condition(self):
+        self.assertLess(self.ids('diabetes:5, migraine').index(1), self.ids('diabetes:5, migraine').index(2))
+        self.assertLess(self.ids('diabetes, migraine:5').index(2), self.ids('diabetes, migraine:5').index(1))
+        self.assertEqual(self.ids(['Diabetes', 'migraine ']), self.ids('diabetes, migraine'))
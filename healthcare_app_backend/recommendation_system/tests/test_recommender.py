@@ -0,0 +1,330 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from recommendation_system.doctor_recommender import DoctorRecommender
+from recommendation_system.tests.test_sharding import make_doctors
+from recommendation_system.utils import (
+    MANIFEST_FILE,
+    MODEL_SCHEMA_VERSION,
+    get_current_version,
+    load_model,
+    read_manifest,
+    save_model,
+)
+
+def ids(doctors):
+    return [doctor['id'] for doctor in doctors]
+
+class RecommenderTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        logging.disable(logging.CRITICAL)
+        cls.doctors = make_doctors(range(1, 41))
+    
+    @classmethod
+    def tearDownClass(cls):
+        logging.disable(logging.NOTSET)
+    
+    def fit(self, **params):
+        recommender = DoctorRecommender(**{'n_neighbors': 10, 'precompute_neighbors': True, **params})
+        recommender.fit(self.doctors)
+        return recommender
+
+class UpsertTests(RecommenderTestCase):
+    def test_added_doctor_is_recommended(self):
+        recommender = self.fit()
+        recommender.upsert_doctor({
+            **make_doctors([100])[0],
+            'conditions_treated': ['Migraine'],
+            'specialization': 'Neurologist',
+        })
+        self.assertEqual(ids(recommender.recommend_doctors('migraine', limit=5)), [100])
+        self.assertEqual(ids(recommender.recommend_doctors('migraine', specialization='neurologist')), [100])
+        self.assertEqual(ids(recommender.filter_doctors({'field': 'specialization', 'eq': 'neurologist'})), [100])
+    
+    def test_replaced_doctor_is_served_with_its_new_data(self):
+        recommender = self.fit()
+        replaced = {**self.doctors[0], 'fee': 5000, 'conditions_treated': ['Migraine']}
+        recommender.upsert_doctor(replaced)
+        self.assertEqual(ids(recommender.filter_doctors({'field': 'fee', 'gte': 5000})), [replaced['id']])
+        self.assertNotIn(replaced['id'], ids(recommender.recommend_doctors('hypertension', limit=40)))
+        self.assertEqual(ids(recommender.recommend_doctors('migraine')), [replaced['id']])
+        self.assertEqual(len(recommender.filter_doctors()), len(self.doctors))
+    
+    def test_removed_doctor_is_not_served(self):
+        recommender = self.fit()
+        removed = self.doctors[1]['id']
+        self.assertTrue(recommender.remove_doctor(removed))
+        self.assertFalse(recommender.remove_doctor(removed))
+        self.assertNotIn(removed, ids(recommender.recommend_doctors('diabetes', limit=40)))
+        self.assertNotIn(removed, ids(recommender.filter_doctors()))
+    
+    def test_compaction_keeps_the_served_doctors(self):
+        recommender = self.fit()
+        recommender.COMPACTION_INTERVAL = 5
+        for doctor in make_doctors(range(100, 103)):
+            recommender.upsert_doctor(doctor)
+        recommender.remove_doctor(self.doctors[0]['id'])
+        expected = ids(recommender.recommend_doctors('diabetes', sort_by='rating', limit=50))
+        # The fifth update compacts the dead row away
+        recommender.upsert_doctor(make_doctors([103])[0])
+        self.assertEqual(recommender.updates_since_compaction, 0)
+        self.assertEqual(len(recommender.doctors), len(self.doctors) + 3)
+        served = ids(recommender.recommend_doctors('diabetes', sort_by='rating', limit=50))
+        self.assertEqual(sorted(served), sorted(expected + [103]))
+
+class BatchTests(RecommenderTestCase):
+    def test_batches_answer_like_single_queries(self):
+        recommender = self.fit(cache_size=0)
+        queries = ['diabetes', 'Hypertension', '', 'unknown', 'diabetes, hypertension:2', 'diabetes']
+        for params in ({}, {'sort_by': 'fee'}, {'sort_by': 'rating', 'specialization': 'Cardiologist'}, {'limit': 3}):
+            with self.subTest(params=params):
+                self.assertEqual(
+                    recommender.recommend_many(queries, **params),
+                    [recommender.recommend_doctors(query, **params) for query in queries]
+                )
+    
+    def test_empty_batches(self):
+        recommender = self.fit()
+        self.assertEqual(recommender.recommend_many([]), [])
+        self.assertEqual(recommender.recommend_with_facets([]), ([], []))
+
+class NeighborTableTests(RecommenderTestCase):
+    def assert_table_matches_a_search(self, recommender):
+        columns = recommender.neighbor_table_columns
+        self.assertEqual(sorted(columns.tolist()), sorted(recommender.condition_columns.values()))
+        for table_row, column in enumerate(columns):
+            query = recommender._get_query_matrix([recommender.feature_names[column][len('treats_'):]])
+            distances, indices = recommender._search_neighbors(query)
+            # Rows not treating the condition only pad the search and score 0
+            scoring = distances[0] < 1
+            table_scoring = recommender.neighbor_table_distances[table_row] < 1
+            self.assertEqual(recommender.neighbor_table_indices[table_row][table_scoring].tolist(), indices[0][scoring].tolist())
+            self.assertEqual(recommender.neighbor_table_distances[table_row][table_scoring].tolist(), distances[0][scoring].tolist())
+    
+    def test_table_rows_equal_a_neighbor_search(self):
+        self.assert_table_matches_a_search(self.fit())
+    
+    def test_upserts_refresh_the_table(self):
+        precomputed = self.fit()
+        searched = self.fit(precompute_neighbors=False)
+        for recommender in (precomputed, searched):
+            recommender.upsert_doctor({**make_doctors([100])[0], 'conditions_treated': ['Diabetes', 'Migraine']})
+            recommender.upsert_doctor({**self.doctors[3], 'conditions_treated': ['Hypertension']})
+            recommender.remove_doctor(self.doctors[4]['id'])
+        self.assert_table_matches_a_search(precomputed)
+        for query in ('diabetes', 'hypertension', 'migraine'):
+            for sort_by in (None, 'fee'):
+                self.assertEqual(
+                    precomputed.recommend_doctors(query, sort_by=sort_by, limit=10),
+                    searched.recommend_doctors(query, sort_by=sort_by, limit=10)
+                )
+
+class ConcurrentUpdateTests(RecommenderTestCase):
+    def test_queries_during_upserts(self):
+        recommender = self.fit(cache_size=0)
+        errors = []
+        updating = threading.Event()
+        updating.set()
+        
+        def query():
+            try:
+                while updating.is_set():
+                    for params in (
+                        {'specialization': 'Cardiologist'},
+                        {'filters': {'field': 'fee', 'lte': 700}},
+                        {'sort_by': 'rating'},
+                        {},
+                    ):
+                        # Without the fallback, errors of the KNN search reach the caller
+                        results = recommender.recommend_many(['diabetes', 'hypertension'], limit=5, fallback=False, **params)
+                        if not all(results):
+                            errors.append(f"No results for {params}")
+            except Exception as e:
+                errors.append(e)
+        
+        threads = [threading.Thread(target=query) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        try:
+            # Every upsert adds a condition column, widening the matrix and partitions
+            for doctor_id in range(100, 160):
+                recommender.upsert_doctor({
+                    **make_doctors([doctor_id])[0],
+                    'conditions_treated': ['Diabetes', f'Condition {doctor_id}'],
+                })
+        finally:
+            updating.clear()
+            for thread in threads:
+                thread.join(10)
+        
+        self.assertEqual(errors, [])
+        self.assertEqual(ids(recommender.recommend_doctors('condition 159', specialization='Cardiologist'))[0], 159)
+        self.assertEqual(ids(recommender.recommend_doctors('condition 158', filters={'field': 'fee', 'gte': 0})), [158])
+
+class NeighborExpansionTests(RecommenderTestCase):
+    def setUp(self):
+        doctors = make_doctors(range(1, 401))
+        self.approximate = DoctorRecommender(
+            n_neighbors=10, cache_size=0, index='ivf', index_params={'n_lists': 40, 'n_probe': 1}
+        )
+        self.approximate.fit(doctors)
+        self.exact = DoctorRecommender(n_neighbors=10, cache_size=0)
+        self.exact.fit(doctors)
+    
+    def recommend(self, recommender, **params):
+        """Recommendations, and whether the neighbor search had to be continued"""
+        with mock.patch.object(recommender, '_find_matching', wraps=recommender._find_matching) as find_matching:
+            results = recommender.recommend_doctors('hypertension', limit=30, **params)
+        return ids(results), find_matching.called
+    
+    def test_short_searches_are_continued(self):
+        # One probed list holds fewer than 30 of the matching doctors
+        _, indices = self.approximate._find_neighbors(['hypertension'], None, 30)
+        self.assertLess(len(indices[0]), 30)
+        
+        results, continued = self.recommend(self.approximate)
+        self.assertTrue(continued)
+        self.assertEqual(results, self.recommend(self.exact)[0])
+        self.assertEqual(len(results), 30)
+    
+    def test_removed_doctors_are_replaced(self):
+        for doctor_id in self.recommend(self.exact)[0][:5]:
+            self.approximate.remove_doctor(doctor_id)
+            self.exact.remove_doctor(doctor_id)
+        results, continued = self.recommend(self.approximate, specialization='Cardiologist')
+        self.assertTrue(continued)
+        self.assertEqual(results, self.recommend(self.exact, specialization='Cardiologist')[0])
+    
+    def test_complete_searches_are_not_continued(self):
+        self.assertFalse(self.recommend(self.exact)[1])
+        # The farthest neighbor is below min_score, so no farther doctor can match
+        self.assertFalse(self.recommend(self.approximate, min_score=0.99)[1])
+
+class ResultCacheTests(RecommenderTestCase):
+    def test_repeated_queries_are_served_from_the_cache(self):
+        recommender = self.fit()
+        first = recommender.recommend_many(['hypertension', 'Hypertension '], limit=5)
+        second = recommender.recommend_many(['hypertension'], limit=5)
+        self.assertEqual(first, [second[0], second[0]])
+        stats = recommender.cache_stats()
+        # Both spellings of the first batch are computed once, as one entry
+        self.assertEqual((stats['hits'], stats['misses'], stats['size']), (1, 2, 1))
+    
+    def test_returned_results_do_not_share_cached_data(self):
+        recommender = self.fit()
+        result = recommender.recommend_doctors('hypertension', limit=5)
+        expected = [dict(doctor, conditions_treated=list(doctor['conditions_treated'])) for doctor in result]
+        for doctor in result:
+            doctor['conditions_treated'].append('Migraine')
+            doctor['matched_conditions'].clear()
+            doctor['fee'] = 0
+        again = recommender.recommend_doctors('hypertension', limit=5)
+        self.assertEqual(recommender.cache_stats()['hits'], 1)
+        self.assertEqual([doctor['conditions_treated'] for doctor in again], [doctor['conditions_treated'] for doctor in expected])
+        self.assertTrue(all(doctor['matched_conditions'] for doctor in again))
+        self.assertEqual(again, recommender.recommend_doctors('hypertension', limit=5))
+    
+    def test_updates_invalidate_cached_results(self):
+        recommender = self.fit()
+        self.assertNotIn(100, ids(recommender.recommend_doctors('hypertension', limit=40)))
+        recommender.upsert_doctor({**make_doctors([100])[0], 'conditions_treated': ['Hypertension']})
+        self.assertIn(100, ids(recommender.recommend_doctors('hypertension', limit=40)))
+        self.assertEqual(recommender.cache_stats()['hits'], 0)
+    
+    def test_new_models_start_with_an_empty_cache(self):
+        recommender = self.fit()
+        recommender.recommend_doctors('diabetes')
+        self.assertEqual(self.fit().cache_stats()['size'], 0)
+
+class FilterTests(RecommenderTestCase):
+    def test_expressions_combine(self):
+        recommender = self.fit()
+        expression = {'and': [
+            {'field': 'specialization', 'eq': ' cardiologist '},
+            {'not': {'field': 'fee', 'gt': 500}},
+            {'or': [{'field': 'rating', 'gte': 4.5}, {'field': 'experience', 'lt': 7}]},
+        ]}
+        expected = [
+            doctor['id'] for doctor in self.doctors
+            if doctor['specialization'] == 'Cardiologist'
+            and doctor['fee'] <= 500
+            and (doctor['rating'] >= 4.5 or doctor['experience'] < 7)
+        ]
+        self.assertTrue(expected)
+        self.assertEqual(sorted(ids(recommender.filter_doctors(expression))), expected)
+    
+    def test_facets_count_every_match(self):
+        recommender = self.fit()
+        results, facets = recommender.recommend_with_facets(['diabetes'], limit=3)
+        self.assertEqual(len(results[0]), 3)
+        counts = {entry['value']: entry['count'] for entry in facets[0]['specialization']}
+        self.assertEqual(counts, {'Cardiologist': 20, 'Endocrinologist': 20})
+        self.assertEqual(sum(bucket['count'] for bucket in facets[0]['fee']), len(self.doctors))
+    
+    def test_malformed_filters_are_rejected(self):
+        recommender = self.fit()
+        for expression in (
+            {'field': 'unknown', 'eq': 1},
+            {'field': 'fee', 'contains': 'x'},
+            {'and': {'field': 'fee', 'gte': 1}},
+        ):
+            with self.assertRaises(ValueError):
+                recommender.recommend_doctors('diabetes', filters=expression)
+
+class ArtifactTests(RecommenderTestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = self.directory.name
+    
+    def tearDown(self):
+        self.directory.cleanup()
+    
+    def test_loaded_model_answers_like_the_saved_one(self):
+        recommender = self.fit(index='inverted')
+        recommender.upsert_doctor(make_doctors([100])[0])
+        self.assertTrue(save_model(recommender, self.path, fingerprint='catalog-1'))
+        loaded = load_model(self.path, fingerprint='catalog-1')
+        self.assertIsInstance(loaded, DoctorRecommender)
+        self.assertEqual(loaded.artifact_version, get_current_version(self.path))
+        for query, params in (('diabetes', {}), ('hypertension', {'sort_by': 'fee'}), ('diabetes', {'specialization': 'Cardiologist'})):
+            self.assertEqual(
+                ids(loaded.recommend_doctors(query, limit=15, **params)),
+                ids(recommender.recommend_doctors(query, limit=15, **params))
+            )
+        
+        # A loaded (memory-mapped) model still takes updates
+        loaded.upsert_doctor({**make_doctors([101])[0], 'conditions_treated': ['Migraine']})
+        self.assertEqual(ids(loaded.recommend_doctors('migraine')), [101])
+    
+    def test_stale_artifacts_are_ignored(self):
+        save_model(self.fit(), self.path, fingerprint='catalog-1')
+        self.assertIsNone(load_model(self.path, fingerprint='catalog-2'))
+        self.assertIsNotNone(load_model(self.path))
+    
+    def test_other_schema_versions_are_ignored(self):
+        save_model(self.fit(), self.path)
+        manifest = read_manifest(self.path)
+        self.assertEqual(manifest['schema_version'], MODEL_SCHEMA_VERSION)
+        
+        manifest_path = os.path.join(self.path, manifest['version'], MANIFEST_FILE)
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        manifest['schema_version'] = MODEL_SCHEMA_VERSION - 1
+        with open(manifest_path, 'w') as f:
+            json.dump(manifest, f)
+        self.assertIsNone(load_model(self.path))
+    
+    def test_new_versions_replace_the_current_one(self):
+        recommender = self.fit()
+        save_model(recommender, self.path)
+        first = get_current_version(self.path)
+        recommender.upsert_doctor(make_doctors([100])[0])
+        save_model(recommender, self.path)
+        self.assertNotEqual(get_current_version(self.path), first)
+        self.assertIn(100, ids(load_model(self.path).filter_doctors()))
@@ -0,0 +1,23 @@
+import unittest
+
+from recommendation_system.result_cache import ResultCache
+
+class ResultCacheTests(unittest.TestCase):
+    def test_least_recently_used_entries_are_evicted(self):
+        cache = ResultCache(max_entries=2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+        cache.put('c', 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('c'), 3)
+    
+    def test_clear_keeps_the_counters(self):
+        cache = ResultCache()
+        cache.put('a', 1)
+        cache.get('a')
+        cache.get('b')
+        cache.clear()
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.stats(), {'hits': 1, 'misses': 2, 'hit_rate': 1 / 3, 'size': 0, 'max_entries': 1024})
@@ -0,0 +1,92 @@
+import logging
+import unittest
+
+import numpy as np
+
+from recommendation_system.doctor_recommender import DoctorRecommender
+from recommendation_system.tests.test_sharding import make_doctors
+
+class ResultAssemblyTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        logging.disable(logging.CRITICAL)
+        doctors = make_doctors(range(1, 61))
+        doctors[0]['conditions_treated'] = ['Type 2 DIABETES', 'Asthma', 'Gestational diabetes']
+        cls.recommender = DoctorRecommender(n_neighbors=60, cache_size=0)
+        cls.recommender.fit(doctors)
+        cls.doctors = doctors
+    
+    @classmethod
+    def tearDownClass(cls):
+        logging.disable(logging.NOTSET)
+    
+    def reference_order(self, rows, scores, sort_by):
+        """Positions of rows ordered one doctor at a time, like the per-row implementation"""
+        def key(position):
+            doctor = self.doctors[rows[position]]
+            primary = {
+                'experience': (-doctor['experience'], -doctor['rating']),
+                'rating': (-doctor['rating'], -doctor['experience']),
+                'fee': (doctor['fee'],),
+            }.get(sort_by, ())
+            return primary + (-scores[position], rows[position])
+        return sorted(range(len(rows)), key=key)
+    
+    def test_sort_orders_match_a_per_row_sort(self):
+        random = np.random.default_rng(0)
+        rows = random.permutation(60)[:40]
+        # Few distinct scores, so ties are common
+        scores = random.integers(0, 4, size=40) / 4
+        for sort_by in (None, 'similarity', 'experience', 'rating', 'fee'):
+            expected = self.reference_order(rows, scores, sort_by)
+            for limit in (None, 1, 7, 40, 100):
+                with self.subTest(sort_by=sort_by, limit=limit):
+                    order = self.recommender._sort_order(rows, scores, sort_by, limit=limit)
+                    self.assertEqual(order.tolist(), expected[:limit])
+    
+    def test_matched_conditions_keep_their_spelling(self):
+        rows = np.array([0, 1, 2])
+        self.assertEqual(self.recommender._matched_conditions(rows, 'diabetes'), [
+            ['Type 2 DIABETES', 'Gestational diabetes'], ['Diabetes'], ['Diabetes'],
+        ])
+        self.assertEqual(self.recommender._matched_conditions(rows, 'asthma, hypertension'), [
+            ['Asthma'], ['Hypertension'], ['Hypertension'],
+        ])
+        self.assertEqual(self.recommender._matched_conditions(rows[:0], 'diabetes'), [])
+    
+    def test_recommendations_carry_the_doctor_and_its_score(self):
+        results = self.recommender.recommend_doctors('hypertension', limit=5)
+        self.assertEqual(len(results), 5)
+        for doctor in results:
+            source = next(candidate for candidate in self.doctors if candidate['id'] == doctor['id'])
+            self.assertEqual({field: doctor[field] for field in source}, source)
+            self.assertEqual(doctor['matched_conditions'], ['Hypertension'])
+        scores = [doctor['similarity_score'] for doctor in results]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+
+class ExactSortTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        logging.disable(logging.CRITICAL)
+        doctors = make_doctors(range(1, 201))
+        cls.recommenders = []
+        for n_neighbors in (5, 200):
+            recommender = DoctorRecommender(n_neighbors=n_neighbors, cache_size=0)
+            recommender.fit([dict(doctor) for doctor in doctors])
+            cls.recommenders.append(recommender)
+    
+    @classmethod
+    def tearDownClass(cls):
+        logging.disable(logging.NOTSET)
+    
+    def test_sorts_rank_every_matching_doctor(self):
+        few_neighbors, every_neighbor = self.recommenders
+        for sort_by in ('experience', 'rating', 'fee'):
+            for params in ({}, {'specialization': 'Endocrinologist'}, {'filters': {'field': 'rating', 'gte': 4.0}}):
+                with self.subTest(sort_by=sort_by, params=params):
+                    results = few_neighbors.recommend_doctors('hypertension', sort_by=sort_by, limit=8, **params)
+                    self.assertEqual(len(results), 8)
+                    self.assertEqual(
+                        results,
+                        every_neighbor.recommend_doctors('hypertension', sort_by=sort_by, limit=8, **params)
+                    )
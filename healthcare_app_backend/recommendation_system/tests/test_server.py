@@ -0,0 +1,87 @@
+import logging
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from recommendation_system.client import RecommenderClient, RecommenderUnavailableError
+from recommendation_system.doctor_recommender import DoctorRecommender
+from recommendation_system.server import RecommenderServer
+from recommendation_system.tests.test_sharding import make_doctors
+
+class RecommenderServerTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        logging.disable(logging.CRITICAL)
+        cls.recommender = DoctorRecommender(n_neighbors=10)
+        cls.recommender.fit(make_doctors(range(1, 31)))
+    
+    @classmethod
+    def tearDownClass(cls):
+        logging.disable(logging.NOTSET)
+    
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.socket_path = os.path.join(self.directory.name, 'recommender.sock')
+        self.model_ready = threading.Event()
+        self.server = RecommenderServer(
+            self.socket_path,
+            model_path=self.directory.name,
+            poll_seconds=0.05,
+            loader=self._load_model
+        )
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self._wait_until(lambda: os.path.exists(self.socket_path))
+        self.client = RecommenderClient(self.socket_path, timeout=5)
+    
+    def tearDown(self):
+        self.model_ready.set()
+        self.client.close()
+        self.server.shutdown()
+        self.thread.join(5)
+        self.directory.cleanup()
+    
+    def _load_model(self, model_path):
+        self.model_ready.wait(5)
+        return self.recommender
+    
+    def _wait_until(self, condition):
+        deadline = time.monotonic() + 5
+        while not condition():
+            if time.monotonic() > deadline:
+                self.fail("Timed out waiting for the server")
+            time.sleep(0.01)
+    
+    def _wait_for_model(self):
+        self.model_ready.set()
+        self._wait_until(lambda: self.server.holder.get() is not None)
+    
+    def test_unavailable_until_the_model_is_loaded(self):
+        with self.assertRaises(RecommenderUnavailableError):
+            self.client.recommend_doctors('diabetes')
+        self._wait_for_model()
+        self.assertTrue(self.client.recommend_doctors('diabetes'))
+    
+    def test_answers_like_the_model(self):
+        self._wait_for_model()
+        params = {'sort_by': 'rating', 'limit': 5, 'filters': {'field': 'fee', 'lte': 700}}
+        self.assertEqual(
+            self.client.recommend_doctors('hypertension', **params),
+            self.recommender.recommend_doctors('hypertension', **params)
+        )
+        results, facets = self.client.recommend_with_facets(['diabetes', 'hypertension'], limit=3)
+        expected_results, expected_facets = self.recommender.recommend_with_facets(['diabetes', 'hypertension'], limit=3)
+        self.assertEqual((results, facets), (expected_results, expected_facets))
+        self.assertEqual(
+            self.client.filter_doctors({'field': 'specialization', 'eq': 'cardiologist'}),
+            self.recommender.filter_doctors({'field': 'specialization', 'eq': 'cardiologist'})
+        )
+    
+    def test_malformed_filters_raise_value_error(self):
+        self._wait_for_model()
+        with self.assertRaises(ValueError):
+            self.client.recommend_doctors('diabetes', filters={'field': 'unknown', 'eq': 1})
+        # The connection stays usable after an invalid request
+        self.assertTrue(self.client.recommend_doctors('diabetes'))
@@ -0,0 +1,178 @@
+import logging
+import unittest
+
+from recommendation_system.doctor_recommender import DoctorRecommender, SimpleRecommender
+from recommendation_system.sharding import ShardedRecommender, merge_facets, merge_fallback, merge_results, shard_of
+from recommendation_system.utils import batch_preprocess_doctors
+
+def make_doctors(ids):
+    """Preprocessed doctors with the given ids, alternating two specializations"""
+    return batch_preprocess_doctors([
+        {
+            'id': doctor_id,
+            'name': f"Doctor {doctor_id}",
+            'specialization': 'Cardiologist' if i % 2 == 0 else 'Endocrinologist',
+            'conditions_treated': ['Diabetes', 'Hypertension'] if i % 3 else ['Diabetes'],
+            'experience': 5 + i % 7,
+            'rating': 3.5 + (i % 4) * 0.5,
+            'fee': 300 + (i % 5) * 200,
+            'availability': '10 AM - 5 PM',
+        }
+        for i, doctor_id in enumerate(ids)
+    ])
+
+class MergeTests(unittest.TestCase):
+    def test_ties_are_broken_by_doctor_id(self):
+        shard_results = [
+            [{'id': 7, 'similarity_score': 0.5}, {'id': 2, 'similarity_score': 0.25}],
+            [{'id': 3, 'similarity_score': 0.5}, {'id': 'x1', 'similarity_score': 0.25}],
+        ]
+        merged = merge_results(shard_results)
+        self.assertEqual([doctor['id'] for doctor in merged], [3, 7, 2, 'x1'])
+        self.assertEqual([doctor['id'] for doctor in merge_results(shard_results, limit=3)], [3, 7, 2])
+    
+    def test_sort_key_before_similarity(self):
+        shard_results = [
+            [{'id': 1, 'rating': 4.0, 'experience': 3, 'similarity_score': 0.9}],
+            [{'id': 2, 'rating': 4.5, 'experience': 1, 'similarity_score': 0.1}],
+            [{'id': 3, 'rating': 4.0, 'experience': 3, 'similarity_score': 0.95}],
+        ]
+        merged = merge_results(shard_results, sort_by='rating')
+        self.assertEqual([doctor['id'] for doctor in merged], [2, 3, 1])
+    
+    def test_unscored_results_default_to_id_order(self):
+        merged = merge_results([[{'id': 5}, {'id': 9}], [{'id': 1}]], scored=False)
+        self.assertEqual([doctor['id'] for doctor in merged], [1, 5, 9])
+    
+    def test_facet_counts_are_summed(self):
+        def fee_buckets(counts):
+            return [{'min': None, 'max': 500, 'count': counts[0]}, {'min': 500, 'max': None, 'count': counts[1]}]
+        
+        merged = merge_facets([
+            {'specialization': [{'value': 'Cardiologist', 'count': 2}], 'fee': fee_buckets([1, 1])},
+            None,
+            {
+                'specialization': [{'value': 'Dermatologist', 'count': 3}, {'value': 'Cardiologist', 'count': 2}],
+                'fee': fee_buckets([4, 1]),
+            },
+        ])
+        self.assertEqual(merged['specialization'], [
+            {'value': 'Cardiologist', 'count': 4},
+            {'value': 'Dermatologist', 'count': 3},
+        ])
+        self.assertEqual([bucket['count'] for bucket in merged['fee']], [5, 2])
+        self.assertNotIn('rating', merged)
+
+    def test_fallback_keeps_the_best_tier(self):
+        key_match = (SimpleRecommender.KEY_TIER, [{'id': 4, 'experience': 3, 'rating': 4.0, 'similarity_score': 1.0}], None, None)
+        text_match = (SimpleRecommender.TEXT_TIER, [{'id': 1, 'experience': 9, 'rating': 5.0, 'similarity_score': 6.0}], 6.0, None)
+        merged, _ = merge_fallback([text_match, key_match, (None, [], None, None)])
+        self.assertEqual([doctor['id'] for doctor in merged], [4])
+        
+        other_text_match = (SimpleRecommender.TEXT_TIER, [{'id': 2, 'experience': 1, 'rating': 3.0, 'similarity_score': 3.0}], 8.0, None)
+        merged, _ = merge_fallback([other_text_match, text_match])
+        self.assertEqual([(doctor['id'], doctor['similarity_score']) for doctor in merged], [(1, 0.75), (2, 0.375)])
+        self.assertEqual([doctor['id'] for doctor in merge_fallback([other_text_match, text_match], 'rating')[0]], [1, 2])
+
+class CorrectionKeysTests(unittest.TestCase):
+    def test_keys_of_other_shards_correct_queries(self):
+        recommender = SimpleRecommender()
+        recommender.fit(make_doctors([1, 2]))
+        self.assertEqual(recommender.correct_term('migrane'), 'migrane')
+        self.assertTrue(recommender.add_correction_keys(['migraine', 'diabetes']))
+        self.assertFalse(recommender.add_correction_keys(['migraine']))
+        self.assertEqual(recommender.correct_term('migrane'), 'migraine')
+        self.assertEqual(recommender.correct_term('migraine'), 'migraine')
+
+class UnfittedRecommenderTests(unittest.TestCase):
+    def test_filtered_queries_return_nothing(self):
+        recommender = DoctorRecommender()
+        filters = {'field': 'fee', 'lte': 1000}
+        self.assertEqual(recommender.recommend_many(['diabetes'], filters=filters), [[]])
+        self.assertEqual(recommender.recommend_with_facets(['diabetes'], filters=filters), ([[]], [None]))
+        self.assertEqual(recommender.filter_doctors(filters), [])
+
+class ShardedRecommenderTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        logging.disable(logging.INFO)
+        cls.sharded = ShardedRecommender(4, n_neighbors=10)
+    
+    @classmethod
+    def tearDownClass(cls):
+        cls.sharded.close()
+        logging.disable(logging.NOTSET)
+    
+    def test_empty_shards(self):
+        doctors = make_doctors([1, 2])
+        self.assertLess(len({shard_of(doctor['id'], 4) for doctor in doctors}), 4)
+        self.sharded.fit(doctors)
+        filters = {'field': 'fee', 'lte': 1000}
+        
+        results = self.sharded.recommend_many(['diabetes'], filters=filters)
+        self.assertEqual(sorted(doctor['id'] for doctor in results[0]), [1, 2])
+        
+        results, facets = self.sharded.recommend_with_facets(['diabetes'], filters=filters)
+        self.assertEqual(sorted(doctor['id'] for doctor in results[0]), [1, 2])
+        self.assertEqual(sum(entry['count'] for entry in facets[0]['specialization']), 2)
+        
+        self.assertEqual([doctor['id'] for doctor in self.sharded.filter_doctors(filters)], [1, 2])
+    
+    def test_matches_single_recommender(self):
+        doctors = make_doctors(range(1, 61))
+        self.sharded.fit(doctors)
+        single = DoctorRecommender(n_neighbors=10)
+        single.fit(doctors)
+        filters = {'field': 'rating', 'gte': 4.0}
+        
+        self.assertEqual(
+            [doctor['id'] for doctor in self.sharded.filter_doctors(filters, sort_by='fee', limit=15)],
+            [doctor['id'] for doctor in merge_results([single.filter_doctors(filters)], 'fee', 15, scored=False)]
+        )
+        
+        _, sharded_facets = self.sharded.recommend_with_facets(['diabetes'], filters=filters)
+        _, single_facets = single.recommend_with_facets(['diabetes'], filters=filters)
+        self.assertEqual(sharded_facets, single_facets)
+    
+    def test_fallback_only_when_no_shard_has_knn_matches(self):
+        doctors = make_doctors(range(1, 13))
+        for doctor in doctors:
+            if doctor['id'] in (1, 2):
+                doctor['conditions_treated'] = ['Asthma Induced Cough']
+            elif doctor['id'] in (4, 5, 6):
+                doctor['conditions_treated'] = ['Asthma', 'COPD']
+        # Doctors 1 and 2 only match "asthma" as a substring, on shards without KNN matches
+        self.assertFalse({shard_of(1, 4), shard_of(2, 4)} & {shard_of(4, 4), shard_of(5, 4), shard_of(6, 4)})
+        self.sharded.fit(doctors)
+        single = DoctorRecommender(n_neighbors=10)
+        single.fit(doctors)
+        
+        for query in ('asthma', 'Asthma Induced Cough'):
+            self.assertEqual(
+                sorted(doctor['id'] for doctor in self.sharded.recommend_doctors(query)),
+                sorted(doctor['id'] for doctor in single.recommend_doctors(query))
+            )
+        self.assertEqual(
+            [doctor['id'] for doctor in self.sharded.recommend_doctors('cough')],
+            [doctor['id'] for doctor in single.recommend_doctors('cough')]
+        )
+        results, facets = self.sharded.recommend_with_facets(['cough'])
+        _, single_facets = single.recommend_with_facets(['cough'])
+        self.assertEqual(facets, single_facets)
+    
+    def test_upsert_and_remove(self):
+        self.sharded.fit(make_doctors(range(1, 21)))
+        doctor = make_doctors([1000])[0]
+        doctor['specialization'] = 'Nephrologist'
+        self.sharded.upsert_doctor(doctor)
+        filters = {'field': 'specialization', 'eq': 'Nephrologist'}
+        self.assertEqual([found['id'] for found in self.sharded.filter_doctors(filters)], [1000])
+        
+        self.assertTrue(self.sharded.remove_doctor(1000))
+        self.assertFalse(self.sharded.remove_doctor(1000))
+        self.assertEqual(self.sharded.filter_doctors(filters), [])
+    
+    def test_malformed_filter_is_rejected(self):
+        self.sharded.fit(make_doctors(range(1, 21)))
+        with self.assertRaises(ValueError):
+            self.sharded.recommend_many(['diabetes'], filters={'field': 'fee', 'between': 3})
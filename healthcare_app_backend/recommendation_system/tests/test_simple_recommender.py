@@ -0,0 +1,68 @@
+import logging
+import unittest
+
+from recommendation_system.doctor_recommender import SimpleRecommender
+
+CONDITIONS = ['Diabetes', 'Hypertension', 'Gestational Diabetes', 'Asthma', 'Pulmonary Hypertension', 'Migraine']
+SPECIALIZATIONS = ['Cardiologist', 'Endocrinologist', 'Pulmonologist', 'Neurologist']
+
+def make_catalog(n):
+    """Doctors with overlapping condition names, so substring queries match several keys"""
+    return [
+        {
+            'id': i,
+            'name': f"Doctor {i}",
+            'specialization': SPECIALIZATIONS[i % len(SPECIALIZATIONS)],
+            'conditions_treated': [CONDITIONS[i % len(CONDITIONS)], CONDITIONS[(i * 7) % len(CONDITIONS)]],
+            'experience': i % 13,
+            'rating': 3.0 + (i % 5) * 0.5,
+            'fee': 200 + (i % 9) * 100,
+        }
+        for i in range(n)
+    ]
+
+def scan(doctors, query, specialization=None):
+    """Ids of the doctors a linear scan matches"""
+    return sorted(
+        doctor['id'] for doctor in doctors
+        if (any(query in condition.lower() for condition in doctor['conditions_treated'])
+            or query in doctor['specialization'].lower())
+        and (specialization is None or doctor['specialization'].lower() == specialization)
+    )
+
+class InvertedIndexTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        logging.disable(logging.CRITICAL)
+        cls.doctors = make_catalog(200)
+    
+    @classmethod
+    def tearDownClass(cls):
+        logging.disable(logging.NOTSET)
+    
+    def setUp(self):
+        self.recommender = SimpleRecommender()
+        self.recommender.fit(self.doctors)
+    
+    def ids(self, query, **params):
+        return sorted(doctor['id'] for doctor in self.recommender.recommend_doctors(query, limit=1000, **params))
+    
+    def test_matches_equal_a_linear_scan(self):
+        for query in ('diabetes', 'hypertension', 'tension', 'logist', 'asthma', 'cardio'):
+            with self.subTest(query=query):
+                self.assertEqual(self.ids(query), scan(self.doctors, query))
+        self.assertEqual(self.ids('hypertension', specialization='Cardiologist'), scan(self.doctors, 'hypertension', 'cardiologist'))
+    
+    def test_results_are_sorted(self):
+        results = self.recommender.recommend_doctors('diabetes', sort_by='experience', limit=20)
+        keys = [(-doctor['experience'], -doctor['rating']) for doctor in results]
+        self.assertEqual(keys, sorted(keys))
+        fees = [doctor['fee'] for doctor in self.recommender.recommend_doctors('diabetes', sort_by='fee', limit=20)]
+        self.assertEqual(fees, sorted(fees))
+    
+    def test_upserts_and_removals_update_the_index(self):
+        self.recommender.upsert_doctor({**self.doctors[0], 'id': 500, 'conditions_treated': ['Lupus']})
+        self.recommender.upsert_doctor({**self.doctors[1], 'conditions_treated': ['Lupus Nephritis']})
+        self.assertTrue(self.recommender.remove_doctor(3))
+        self.assertEqual(self.ids('lupus'), [1, 500])
+        self.assertEqual(self.ids('asthma'), [doctor_id for doctor_id in scan(self.doctors, 'asthma') if doctor_id != 3])
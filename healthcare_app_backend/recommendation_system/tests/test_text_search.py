@@ -0,0 +1,102 @@
+import logging
+import math
+import unittest
+
+from recommendation_system.doctor_recommender import SimpleRecommender
+from recommendation_system.doctor_store import DoctorStore
+from recommendation_system.text_search import TextSearchIndex, tokenize
+
+DOCTORS = [
+    {'id': 1, 'name': 'Asha Rao', 'specialization': 'Cardiologist', 'conditions_treated': ['Chest Pain', 'Heart Failure']},
+    {'id': 2, 'name': 'Vikram Shah', 'specialization': 'Cardiologist', 'conditions_treated': ['Hypertension']},
+    {'id': 3, 'name': 'Meera Iyer', 'specialization': 'Pulmonologist', 'conditions_treated': ['Chest Pain', 'Asthma']},
+    {'id': 4, 'name': 'Rahul Nair', 'specialization': 'Gastroenterologist', 'conditions_treated': ['Abdominal Pain']},
+    {'id': 5, 'name': 'Sara Heart', 'specialization': 'General Physician', 'conditions_treated': ['Fever', 'Back Pain']},
+]
+
+def reference_scores(doctors, query):
+    """BM25 score of every doctor, computed one doctor at a time"""
+    frequencies = []
+    for doctor in doctors:
+        row = {}
+        for field, weight in TextSearchIndex.FIELD_WEIGHTS.items():
+            value = doctor[field]
+            for text in (value if isinstance(value, list) else [value]):
+                for token in tokenize(text):
+                    row[token] = row.get(token, 0.0) + weight
+        frequencies.append(row)
+    lengths = [sum(row.values()) for row in frequencies]
+    average_length = sum(lengths) / len(lengths)
+    scores = {}
+    for token in tokenize(query):
+        count = sum(token in row for row in frequencies)
+        idf = math.log1p((len(doctors) - count + 0.5) / (count + 0.5))
+        for doctor, row, length in zip(doctors, frequencies, lengths):
+            if token in row:
+                k = TextSearchIndex.K1 * (1 - TextSearchIndex.B + TextSearchIndex.B * length / average_length)
+                scores[doctor['id']] = scores.get(doctor['id'], 0.0) + idf * row[token] * (TextSearchIndex.K1 + 1) / (row[token] + k)
+    return scores
+
+class TextSearchIndexTests(unittest.TestCase):
+    def search(self, index, query):
+        rows, scores = index.search([(query, 1.0)])
+        return {DOCTORS[row]['id']: score for row, score in zip(rows.tolist(), scores.tolist())}
+    
+    def assert_scores(self, actual, expected):
+        self.assertEqual(sorted(actual), sorted(expected))
+        for doctor_id, score in expected.items():
+            self.assertAlmostEqual(actual[doctor_id], score, places=5)
+    
+    def test_scores_match_bm25(self):
+        index = TextSearchIndex.build(DoctorStore.from_records(DOCTORS))
+        for query in ('chest pain', 'heart', 'pain asthma', 'chest pain heart'):
+            with self.subTest(query=query):
+                self.assert_scores(self.search(index, query), reference_scores(DOCTORS, query))
+    
+    def test_rare_and_repeated_words_rank_first(self):
+        index = TextSearchIndex.build(DoctorStore.from_records(DOCTORS))
+        scores = self.search(index, 'chest pain heart')
+        ranking = sorted(scores, key=lambda doctor_id: -scores[doctor_id])
+        # Doctor 1 matches every word; 4 only the common "pain"
+        self.assertEqual(ranking[0], 1)
+        self.assertEqual(ranking[-1], 4)
+        # A condition counts more than a name
+        self.assertGreater(self.search(index, 'heart')[1], self.search(index, 'heart')[5])
+    
+    def test_unknown_words_match_the_words_they_prefix(self):
+        index = TextSearchIndex.build(DoctorStore.from_records(DOCTORS))
+        self.assertEqual(sorted(self.search(index, 'cardio')), [1, 2])
+        self.assertEqual(self.search(index, 'ca'), {})
+        self.assertEqual(self.search(index, 'migraine'), {})
+    
+    def test_appended_and_merged_indexes_score_like_a_build(self):
+        expected = TextSearchIndex.build(DoctorStore.from_records(DOCTORS))
+        appended = TextSearchIndex.build(DoctorStore.from_records(DOCTORS[:2]))
+        for doctor in DOCTORS[2:]:
+            appended.append(doctor)
+        merged = TextSearchIndex.merge([
+            TextSearchIndex.build(DoctorStore.from_records(DOCTORS[:3])),
+            TextSearchIndex.build(DoctorStore.from_records(DOCTORS[3:])),
+        ])
+        for query in ('chest pain heart', 'cardio', 'fever'):
+            with self.subTest(query=query):
+                self.assert_scores(self.search(appended, query), self.search(expected, query))
+                self.assert_scores(self.search(merged, query), self.search(expected, query))
+
+class TextTierTests(unittest.TestCase):
+    def test_queries_no_key_contains_are_searched_as_text(self):
+        logging.disable(logging.CRITICAL)
+        self.addCleanup(logging.disable, logging.NOTSET)
+        recommender = SimpleRecommender()
+        recommender.fit([dict(doctor, experience=5, rating=4.0, fee=500) for doctor in DOCTORS])
+        
+        tier, results, best_score = recommender.recommend_tier('chest pain heart', sort_by='similarity')
+        self.assertEqual(tier, SimpleRecommender.TEXT_TIER)
+        self.assertEqual(results[0]['id'], 1)
+        self.assertEqual(best_score, results[0]['similarity_score'])
+        scores = [doctor['similarity_score'] for doctor in recommender.recommend_doctors('chest pain heart', sort_by='similarity')]
+        self.assertEqual(scores[0], 1.0)
+        self.assertEqual(scores, sorted(scores, reverse=True))
+        # Key matches come first when a key contains the query
+        self.assertEqual(recommender.recommend_tier('chest pain')[0], SimpleRecommender.KEY_TIER)
+        self.assertEqual(sorted(doctor['id'] for doctor in recommender.recommend_doctors('chest pain')), [1, 3])
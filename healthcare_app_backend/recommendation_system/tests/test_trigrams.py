@@ -0,0 +1,47 @@
+import logging
+import unittest
+
+from recommendation_system.doctor_recommender import DoctorRecommender
+from recommendation_system.tests.test_sharding import make_doctors
+from recommendation_system.trigrams import TrigramIndex, trigrams
+
+TERMS = ['diabetes', 'gestational diabetes', 'hypertension', 'asthma', 'cardiologist']
+
+class TrigramIndexTests(unittest.TestCase):
+    def setUp(self):
+        self.index = TrigramIndex(TERMS)
+    
+    def test_misspellings_map_to_the_closest_term(self):
+        for text, term in (('diabeties', 'diabetes'), ('hypertenshun', 'hypertension'), ('asthama', 'asthma'), ('cardiolgist', 'cardiologist')):
+            with self.subTest(text=text):
+                self.assertEqual(self.index.closest(text)[0], term)
+    
+    def test_similarity_is_the_dice_coefficient(self):
+        term, similarity = self.index.closest('diabeties')
+        text_trigrams, term_trigrams = set(trigrams('diabeties')), set(trigrams(term))
+        self.assertAlmostEqual(similarity, 2 * len(text_trigrams & term_trigrams) / (len(text_trigrams) + len(term_trigrams)))
+        self.assertEqual(self.index.closest('diabetes'), ('diabetes', 1.0))
+    
+    def test_distant_texts_are_not_corrected(self):
+        self.assertIsNone(self.index.closest('migraine'))
+        self.assertIsNone(self.index.closest('xyz'))
+        self.assertIsNone(TrigramIndex().closest('diabetes'))
+    
+    def test_added_terms_are_found(self):
+        self.index.add('migraine')
+        self.index.add('migraine')
+        self.assertEqual(self.index.closest('migrane')[0], 'migraine')
+        self.assertEqual(len(self.index.terms), len(TERMS) + 1)
+        self.assertIn('gestational', self.index.words)
+
+class QueryCorrectionTests(unittest.TestCase):
+    def test_misspelled_queries_are_answered_like_the_correct_ones(self):
+        logging.disable(logging.CRITICAL)
+        self.addCleanup(logging.disable, logging.NOTSET)
+        recommender = DoctorRecommender(n_neighbors=10)
+        recommender.fit(make_doctors(range(1, 21)))
+        self.assertEqual(recommender.recommend_doctors('Diabeties '), recommender.recommend_doctors('diabetes'))
+        self.assertEqual(recommender._normalize_query('hypertenshun, diabeties:2'), 'diabetes:2, hypertension')
+        # Partial and unknown words are kept
+        self.assertEqual(recommender._normalize_query('tension'), 'tension')
+        self.assertEqual(recommender._normalize_query('migraine'), 'migraine')
@@ -0,0 +1,287 @@
+import bisect
+import re
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+from .buffers import AppendBuffers
+from .doctor_store import DoctorStore, gather_ranges
+
+_TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+
+def tokenize(text: Any) -> List[str]:
+    """Lowercase alphanumeric tokens of a text"""
+    if text is None:
+        return []
+    return _TOKEN_PATTERN.findall(str(text).lower())
+
+class TextSearchIndex:
+    """
+    BM25 free-text index over doctor conditions, specialization and name
+    
+    Every token keeps a posting list of (row, term frequency) pairs, with
+    the frequencies of the fields added up using FIELD_WEIGHTS. A query
+    scores only the postings of its tokens, all at once with vectorized
+    BM25, so rare tokens (e.g. an uncommon condition) weigh more than
+    common ones and multi-word queries such as "chest pain heart" rank
+    doctors by how many and how rare the matched words are. Query tokens
+    that are not in the vocabulary match the tokens they prefix, so
+    partial words ("cardio") still find doctors.
+    
+    The posting lists of all tokens are stored back to back in flat arrays
+    (int32 rows, float32 frequencies) with per-token offsets. Postings of
+    rows appended after the index was built are kept in small per-token
+    arrays next to them and scored with the current collection statistics;
+    a rebuild folds them in.
+    """
+    # Field -> weight of its term frequencies
+    FIELD_WEIGHTS = {'conditions_treated': 1.0, 'specialization': 1.0, 'name': 0.5}
+    # BM25 term frequency saturation and length normalization
+    K1 = 1.2
+    B = 0.75
+    # Shortest query token expanded to the tokens it prefixes, and the most tokens it expands to
+    MIN_PREFIX_LENGTH = 3
+    MAX_PREFIX_EXPANSIONS = 50
+    
+    def __init__(self):
+        self.n_rows = 0
+        # Token -> id, and tokens in id order and in sorted order
+        self.term_ids = {}
+        self.terms = []
+        self._sorted_terms = []
+        # Posting lists of every token id, back to back: rows and weighted term frequencies
+        self.posting_rows = np.array([], dtype=np.int32)
+        self.posting_frequencies = np.array([], dtype=np.float32)
+        self.posting_offsets = np.zeros(1, dtype=np.int64)
+        # Token id -> (rows, frequencies) of rows appended since the build
+        self.appended_postings = {}
+        # Weighted token count of every row and of all rows
+        self.row_lengths = np.array([], dtype=np.float32)
+        self.total_length = 0.0
+        # Spare capacity of the arrays grown by append
+        self._buffers = AppendBuffers()
+    
+    @classmethod
+    def _row_frequencies(cls, record: Dict[str, Any]) -> Dict[str, float]:
+        """Weighted term frequencies of one doctor"""
+        frequencies = {}
+        for field, weight in cls.FIELD_WEIGHTS.items():
+            value = record.get(field)
+            texts = value if isinstance(value, list) else [value]
+            for text in texts:
+                for token in tokenize(text):
+                    frequencies[token] = frequencies.get(token, 0.0) + weight
+        return frequencies
+    
+    @classmethod
+    def build(cls, doctors: DoctorStore) -> 'TextSearchIndex':
+        """Index the text fields of every row of a doctor store"""
+        index = cls()
+        index.n_rows = len(doctors)
+        
+        # Conditions and specializations repeat across doctors, so every
+        # distinct text is tokenized once and the rows refer to it by id
+        text_ids = {}
+        text_rows, row_text_ids, text_weights = [], [], []
+        for field, weight in cls.FIELD_WEIGHTS.items():
+            for row, value in enumerate(doctors.values(field)):
+                for text in (value if isinstance(value, list) else [value]):
+                    text_rows.append(row)
+                    row_text_ids.append(text_ids.setdefault(text, len(text_ids)))
+                    text_weights.append(weight)
+        
+        text_tokens = []
+        for text in text_ids:
+            text_tokens.append([index.term_ids.setdefault(token, len(index.term_ids)) for token in tokenize(text)])
+        flat_tokens = np.array([token for tokens in text_tokens for token in tokens], dtype=np.int64)
+        token_offsets = np.concatenate(([0], np.cumsum([len(tokens) for tokens in text_tokens]))).astype(np.int64)
+        
+        # Expand every (row, text) pair into its (row, token) pairs
+        entries, pair_counts = gather_ranges(token_offsets, np.array(row_text_ids, dtype=np.int64))
+        tokens = flat_tokens[entries]
+        rows = np.repeat(np.array(text_rows, dtype=np.int64), pair_counts)
+        weights = np.repeat(np.array(text_weights, dtype=np.float64), pair_counts)
+        
+        # Add up the frequencies of each (token, row); sorting by token keeps rows ascending within a token
+        keys, inverse = np.unique(tokens * max(index.n_rows, 1) + rows, return_inverse=True)
+        frequencies = np.bincount(inverse, weights=weights).astype(np.float32)
+        posting_tokens, posting_rows = np.divmod(keys, max(index.n_rows, 1))
+        index.posting_rows = posting_rows.astype(np.int32)
+        index.posting_frequencies = frequencies
+        index.posting_offsets = np.searchsorted(posting_tokens, np.arange(len(index.term_ids) + 1)).astype(np.int64)
+        
+        index.terms = list(index.term_ids)
+        index._sorted_terms = sorted(index.terms)
+        index.row_lengths = np.bincount(rows, weights=weights, minlength=index.n_rows).astype(np.float32)
+        index.total_length = float(index.row_lengths.sum())
+        return index
+    
+    @classmethod
+    def merge(cls, indexes: List['TextSearchIndex']) -> 'TextSearchIndex':
+        """
+        Index of consecutive row shards, each built on its own
+        
+        Token ids differ from a single build, but every token's postings and
+        every score are the same.
+        """
+        index = cls()
+        shard_tokens, shard_rows, shard_frequencies = [], [], []
+        start = 0
+        for shard in indexes:
+            shard_ids = np.array(
+                [index.term_ids.setdefault(token, len(index.term_ids)) for token in shard.terms],
+                dtype=np.int64
+            )
+            arrays = shard.get_state()[0]
+            rows, frequencies, offsets = arrays['posting_rows'], arrays['posting_frequencies'], arrays['posting_offsets']
+            shard_tokens.append(np.repeat(shard_ids, np.diff(offsets)))
+            shard_rows.append(rows.astype(np.int64) + start)
+            shard_frequencies.append(frequencies)
+            start += shard.n_rows
+        index.n_rows = start
+        
+        # A stable sort by token keeps the shards, and so the rows, in order within every token
+        tokens = np.concatenate([np.array([], dtype=np.int64)] + shard_tokens)
+        order = np.argsort(tokens, kind='stable')
+        index.posting_rows = np.concatenate([np.array([], dtype=np.int64)] + shard_rows)[order].astype(np.int32)
+        index.posting_frequencies = np.concatenate([np.array([], dtype=np.float32)] + shard_frequencies)[order]
+        index.posting_offsets = np.searchsorted(tokens[order], np.arange(len(index.term_ids) + 1)).astype(np.int64)
+        
+        index.terms = list(index.term_ids)
+        index._sorted_terms = sorted(index.terms)
+        index.row_lengths = np.concatenate([np.array([], dtype=np.float32)] + [shard.row_lengths for shard in indexes])
+        index.total_length = float(index.row_lengths.sum())
+        return index
+    
+    def append(self, record: Dict[str, Any]) -> None:
+        """Index a record appended to the doctor store"""
+        row = self.n_rows
+        self.n_rows += 1
+        row_frequencies = self._row_frequencies(record)
+        for token, frequency in row_frequencies.items():
+            term_id = self.term_ids.get(token)
+            if term_id is None:
+                term_id = self.term_ids[token] = len(self.terms)
+                self.terms.append(token)
+                bisect.insort(self._sorted_terms, token)
+            empty = (np.array([], dtype=np.int32), np.array([], dtype=np.float32))
+            rows, frequencies = self.appended_postings.get(term_id, empty)
+            self.appended_postings[term_id] = (
+                self._buffers.append(('rows', term_id), rows, row),
+                self._buffers.append(('frequencies', term_id), frequencies, frequency)
+            )
+        length = sum(row_frequencies.values())
+        self.row_lengths = self._buffers.append('row_lengths', self.row_lengths, length)
+        self.total_length += length
+    
+    def query_tokens(self, terms: List[Tuple[str, float]]) -> Dict[int, float]:
+        """
+        Token ids a query matches, with their query weights
+        
+        Args:
+            terms: (text, weight) pairs, e.g. from parse_query_terms
+        
+        Returns:
+            Dictionary of token id -> weight; unknown tokens are replaced by
+            the vocabulary tokens they prefix
+        """
+        weights = {}
+        for text, weight in terms:
+            for token in tokenize(text):
+                if token in self.term_ids:
+                    matched = [self.term_ids[token]]
+                elif len(token) >= self.MIN_PREFIX_LENGTH:
+                    start = bisect.bisect_left(self._sorted_terms, token)
+                    matched = []
+                    for candidate in self._sorted_terms[start:start + self.MAX_PREFIX_EXPANSIONS]:
+                        if not candidate.startswith(token):
+                            break
+                        matched.append(self.term_ids[candidate])
+                else:
+                    matched = []
+                for term_id in matched:
+                    weights[term_id] = weights.get(term_id, 0.0) + weight
+        return weights
+    
+    def postings(self, term_id: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Rows and weighted term frequencies of a token id, rows ascending"""
+        if term_id + 1 < len(self.posting_offsets):
+            start, stop = self.posting_offsets[term_id], self.posting_offsets[term_id + 1]
+            rows, frequencies = self.posting_rows[start:stop], self.posting_frequencies[start:stop]
+        else:
+            rows, frequencies = self.posting_rows[:0], self.posting_frequencies[:0]
+        if term_id in self.appended_postings:
+            appended_rows, appended_frequencies = self.appended_postings[term_id]
+            rows = np.concatenate((rows, appended_rows))
+            frequencies = np.concatenate((frequencies, appended_frequencies))
+        return rows, frequencies
+    
+    def search(self, terms: List[Tuple[str, float]]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        BM25 scores of every row matching any query token
+        
+        Args:
+            terms: (text, weight) pairs, e.g. from parse_query_terms
+        
+        Returns:
+            Tuple of (rows, scores), rows ascending, every score positive
+        """
+        token_weights = self.query_tokens(terms)
+        if not token_weights or self.n_rows == 0:
+            return np.array([], dtype=np.int64), np.array([], dtype=np.float64)
+        
+        term_ids = list(token_weights)
+        postings = [self.postings(term_id) for term_id in term_ids]
+        rows = np.concatenate([rows for rows, _ in postings])
+        frequencies = np.concatenate([frequencies for _, frequencies in postings]).astype(np.float64)
+        counts = np.array([len(rows) for rows, _ in postings])
+        # Postings include deactivated rows; they only slightly inflate document frequencies
+        idf = np.log1p((self.n_rows - counts + 0.5) / (counts + 0.5))
+        term_weights = np.repeat(idf * np.array([token_weights[term_id] for term_id in term_ids]), counts)
+        
+        average_length = self.total_length / self.n_rows if self.total_length else 1.0
+        length_norm = self.K1 * (1 - self.B + self.B * self.row_lengths[rows] / average_length)
+        partial_scores = term_weights * frequencies * (self.K1 + 1) / (frequencies + length_norm)
+        
+        unique_rows, inverse = np.unique(rows, return_inverse=True)
+        return unique_rows, np.bincount(inverse, weights=partial_scores)
+    
+    def get_state(self) -> Tuple[Dict[str, np.ndarray], Dict[str, Any]]:
+        """Export the index as flat arrays and JSON-serializable metadata"""
+        if self.appended_postings or len(self.posting_offsets) != len(self.terms) + 1:
+            # Merge the appended postings into new flat arrays
+            postings = [self.postings(term_id) for term_id in range(len(self.terms))]
+            lengths = np.array([len(rows) for rows, _ in postings], dtype=np.int64)
+            posting_rows = np.concatenate([self.posting_rows[:0]] + [rows for rows, _ in postings])
+            posting_frequencies = np.concatenate([self.posting_frequencies[:0]] + [frequencies for _, frequencies in postings])
+            posting_offsets = np.concatenate(([0], np.cumsum(lengths))).astype(np.int64)
+        else:
+            posting_rows, posting_frequencies, posting_offsets = self.posting_rows, self.posting_frequencies, self.posting_offsets
+        arrays = {
+            'posting_rows': posting_rows,
+            'posting_frequencies': posting_frequencies,
+            'posting_offsets': posting_offsets,
+            'row_lengths': self.row_lengths,
+        }
+        metadata = {
+            'n_rows': self.n_rows,
+            'terms': self.terms,
+            'total_length': self.total_length,
+        }
+        return arrays, metadata
+    
+    @classmethod
+    def from_state(cls, arrays: Dict[str, np.ndarray], metadata: Dict[str, Any]) -> 'TextSearchIndex':
+        """Rebuild the index from get_state output; arrays may be memory-mapped"""
+        index = cls()
+        index.n_rows = metadata['n_rows']
+        index.terms = list(metadata['terms'])
+        index.term_ids = {token: term_id for term_id, token in enumerate(index.terms)}
+        index._sorted_terms = sorted(index.terms)
+        # Posting lists are read from the (possibly memory-mapped) arrays in place
+        index.posting_rows = arrays['posting_rows']
+        index.posting_frequencies = arrays['posting_frequencies']
+        index.posting_offsets = arrays['posting_offsets']
+        index.row_lengths = arrays['row_lengths']
+        index.total_length = metadata['total_length']
+        return index
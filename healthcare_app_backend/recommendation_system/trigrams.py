@@ -0,0 +1,74 @@
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from .text_search import tokenize
+
+def trigrams(text: str) -> List[str]:
+    """Distinct character trigrams of a text, padded so word starts and ends count"""
+    padded = f"  {text} "
+    return list(dict.fromkeys(padded[i:i + 3] for i in range(len(padded) - 2)))
+
+class TrigramIndex:
+    """
+    Character trigram index over a vocabulary of terms, for spelling correction
+    
+    Every trigram maps to the ids of the terms containing it. A lookup adds
+    up the postings of the query's trigrams with one bincount and ranks the
+    terms by Dice similarity, so a misspelled condition ("diabeties",
+    "asthama") is mapped to the closest known one without comparing it
+    against every term.
+    """
+    # Smallest Dice similarity of the trigram sets accepted as a correction
+    MIN_SIMILARITY = 0.6
+    
+    def __init__(self, terms: List[str] = ()):
+        self.terms = []
+        self.term_ids = {}
+        # Number of distinct trigrams of every term
+        self.trigram_counts = np.array([], dtype=np.int64)
+        # Trigram -> ids of the terms containing it
+        self.postings = {}
+        # Words of all terms; queries made only of known words are never corrected
+        self.words = set()
+        for term in terms:
+            self.add(term)
+    
+    def add(self, term: str) -> None:
+        """Add a term to the vocabulary; known terms are ignored"""
+        if term in self.term_ids:
+            return
+        term_id = len(self.terms)
+        term_trigrams = trigrams(term)
+        # Store the term before any posting refers to it, so a concurrent
+        # lookup never sees an unknown term id
+        self.terms.append(term)
+        self.term_ids[term] = term_id
+        self.trigram_counts = np.append(self.trigram_counts, len(term_trigrams))
+        for trigram in term_trigrams:
+            self.postings[trigram] = np.append(self.postings.get(trigram, np.array([], dtype=np.int64)), term_id)
+        self.words.update(tokenize(term))
+    
+    def closest(self, text: str) -> Optional[Tuple[str, float]]:
+        """
+        Most similar term to a text
+        
+        Args:
+            text: Lowercased text to look up
+        
+        Returns:
+            Tuple of (term, similarity), or None if no term reaches MIN_SIMILARITY
+        """
+        text_trigrams = trigrams(text)
+        known_trigrams = [trigram for trigram in text_trigrams if trigram in self.postings]
+        if not known_trigrams:
+            return None
+        overlaps = np.bincount(
+            np.concatenate([self.postings[trigram] for trigram in known_trigrams]),
+            minlength=len(self.terms)
+        )
+        similarities = 2 * overlaps / (len(text_trigrams) + self.trigram_counts[:len(overlaps)])
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.MIN_SIMILARITY:
+            return None
+        return self.terms[best], float(similarities[best])
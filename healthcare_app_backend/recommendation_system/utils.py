@@ -1,46 +1,171 @@
-import pickle
-from typing import Any, Dict, List
+import json
+import shutil
+import time
+from typing import Any, Dict, List, Optional
 import os
 import logging
 from pathlib import Path
 
+import numpy as np
+
 logger = logging.getLogger(__name__)
 
-def save_model(model: Any, filepath: str) -> bool:
+# Bump whenever the layout written by save_model or a model's get_state changes
+MODEL_SCHEMA_VERSION = 6
+
+# Pointer file naming the active version directory of an artifact
+CURRENT_POINTER = 'CURRENT'
+MANIFEST_FILE = 'manifest.json'
+METADATA_FILE = 'metadata.json'
+
+# Number of published versions kept on disk, including the current one
+KEEP_VERSIONS = 2
+
+def _model_classes() -> Dict[str, Any]:
+    """Model classes that can be restored from an artifact, by name"""
+    from .doctor_recommender import DoctorRecommender
+    return {'DoctorRecommender': DoctorRecommender}
+
+def save_model(model: Any, filepath: str, fingerprint: Optional[str] = None) -> bool:
     """
-    Save the trained model to a file
+    Save the trained model as a versioned artifact directory
+    
+    Each save writes a new version directory holding one .npy file per array,
+    a manifest.json (schema version, model class, fingerprint) and the model's
+    metadata.json, then atomically repoints the CURRENT file at it, so
+    readers never observe a half-written model.
     
     Args:
-        model: Trained model instance
-        filepath: Path to save the model
+        model: Trained model instance implementing get_state()
+        filepath: Artifact directory to save the model into
+        fingerprint: Optional fingerprint of the training data, used by
+            load_model to detect stale artifacts
         
     Returns:
         bool: True if successful, False otherwise
     """
     try:
-        os.makedirs(os.path.dirname(filepath), exist_ok=True)
-        with open(filepath, 'wb') as f:
-            pickle.dump(model, f)
-        logger.info(f"Model saved successfully to {filepath}")
+        arrays, metadata = model.get_state()
+        os.makedirs(filepath, exist_ok=True)
+        
+        version = f"v{time.time_ns()}-{os.getpid()}"
+        staging_dir = os.path.join(filepath, f".{version}.tmp")
+        os.makedirs(staging_dir)
+        
+        for name, array in arrays.items():
+            np.save(os.path.join(staging_dir, f"{name}.npy"), np.ascontiguousarray(array), allow_pickle=False)
+        
+        with open(os.path.join(staging_dir, METADATA_FILE), 'w') as f:
+            json.dump(metadata, f)
+        
+        manifest = {
+            'schema_version': MODEL_SCHEMA_VERSION,
+            'model_class': type(model).__name__,
+            'fingerprint': fingerprint,
+            'arrays': sorted(arrays),
+            'created_at': time.time(),
+        }
+        with open(os.path.join(staging_dir, MANIFEST_FILE), 'w') as f:
+            json.dump(manifest, f)
+        
+        os.rename(staging_dir, os.path.join(filepath, version))
+        
+        # Atomically publish the new version
+        pointer_tmp = os.path.join(filepath, f".{CURRENT_POINTER}.{os.getpid()}.tmp")
+        with open(pointer_tmp, 'w') as f:
+            f.write(version)
+        os.replace(pointer_tmp, os.path.join(filepath, CURRENT_POINTER))
+        
+        _prune_versions(filepath, version)
+        logger.info(f"Model saved successfully to {filepath} (version {version})")
         return True
     except Exception as e:
         logger.error(f"Error saving model: {str(e)}")
         return False
 
-def load_model(filepath: str) -> Any:
+def _prune_versions(filepath: str, current_version: str) -> None:
+    """Remove old version directories, keeping the newest KEEP_VERSIONS"""
+    versions = sorted(
+        (name for name in os.listdir(filepath)
+         if name.startswith('v') and os.path.isdir(os.path.join(filepath, name))),
+        key=lambda name: int(name[1:].split('-')[0])
+    )
+    for name in versions[:-KEEP_VERSIONS]:
+        if name != current_version:
+            shutil.rmtree(os.path.join(filepath, name), ignore_errors=True)
+
+def get_current_version(filepath: str) -> Optional[str]:
+    """Name of the currently published version of an artifact, if any"""
+    try:
+        with open(os.path.join(filepath, CURRENT_POINTER)) as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+def read_manifest(filepath: str) -> Optional[Dict[str, Any]]:
+    """Read the manifest of the currently published version of an artifact"""
+    version = get_current_version(filepath)
+    if version is None:
+        return None
+    try:
+        with open(os.path.join(filepath, version, MANIFEST_FILE)) as f:
+            manifest = json.load(f)
+        manifest['version'] = version
+        return manifest
+    except (OSError, ValueError):
+        return None
+
+def load_model(filepath: str, fingerprint: Optional[str] = None, mmap: bool = True) -> Any:
     """
-    Load a trained model from file
+    Load a trained model from a versioned artifact directory
     
     Args:
-        filepath: Path to the saved model
+        filepath: Artifact directory written by save_model
+        fingerprint: If given, the artifact is treated as stale unless it
+            was saved with the same fingerprint
+        mmap: Memory-map the arrays instead of reading them into memory
         
     Returns:
-        Loaded model instance
+        Loaded model instance, or None if the artifact is missing, stale or
+        was written with a different schema version
     """
     try:
-        with open(filepath, 'rb') as f:
-            model = pickle.load(f)
-        logger.info(f"Model loaded successfully from {filepath}")
+        manifest = read_manifest(filepath)
+        if manifest is None:
+            logger.info(f"No model artifact found at {filepath}")
+            return None
+        
+        if manifest.get('schema_version') != MODEL_SCHEMA_VERSION:
+            logger.info(
+                f"Model artifact schema {manifest.get('schema_version')} does not match "
+                f"{MODEL_SCHEMA_VERSION}, ignoring it"
+            )
+            return None
+        
+        if fingerprint is not None and manifest.get('fingerprint') != fingerprint:
+            logger.info("Model artifact is stale, ignoring it")
+            return None
+        
+        model_class = _model_classes().get(manifest.get('model_class'))
+        if model_class is None:
+            logger.error(f"Unknown model class in artifact: {manifest.get('model_class')}")
+            return None
+        
+        version_dir = os.path.join(filepath, manifest['version'])
+        arrays = {
+            name: np.load(
+                os.path.join(version_dir, f"{name}.npy"),
+                mmap_mode='r' if mmap else None,
+                allow_pickle=False
+            )
+            for name in manifest['arrays']
+        }
+        with open(os.path.join(version_dir, METADATA_FILE)) as f:
+            metadata = json.load(f)
+        
+        model = model_class.from_state(arrays, metadata)
+        model.artifact_version = manifest['version']
+        logger.info(f"Model loaded successfully from {filepath} (version {manifest['version']})")
         return model
     except Exception as e:
         logger.error(f"Error loading model: {str(e)}")
@@ -92,7 +217,7 @@ def batch_preprocess_doctors(doctors: List[Dict[str, Any]]) -> List[Dict[str, An
     return [preprocess_doctor_data(doc) for doc in doctors]
 
 def get_model_path() -> str:
-    """Get the path for saving/loading the model"""
+    """Get the artifact directory for saving/loading the model"""
     base_dir = Path(__file__).parent.parent
     models_dir = base_dir / 'models'
-    return str(models_dir / 'doctor_recommender.pkl') 
\ No newline at end of file
+    return str(models_dir / 'doctor_recommender') 
\ No newline at end of file
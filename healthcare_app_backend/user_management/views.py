@@ -8,6 +8,7 @@ from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from django.contrib.auth import authenticate
 from Doctor.models import Doctor  # Import the Doctor model from the Doctor app
+from Doctor.views import invalidate_doctor_lists, sync_doctor_to_recommender
 from rest_framework_simplejwt.authentication import JWTAuthentication
 from rest_framework.decorators import authentication_classes, permission_classes
 import logging
@@ -78,6 +79,9 @@ class RegisterHealthcareUserView(APIView):
                             # Try to create a Doctor profile with the provided information
                             doctor = Doctor.objects.create(**doctor_data)
                             doctor_id = doctor.id
+                            # Make the new doctor recommendable without retraining
+                            sync_doctor_to_recommender(doctor)
+                            invalidate_doctor_lists()
                         except Exception as inner_e:
                             # If Doctor creation fails, log it but continue with user creation
                             logger.error(f"Doctor model creation failed, proceeding with user only: {str(inner_e)}")